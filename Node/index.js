@@ -1,9 +1,6 @@
 const { Client, LocalAuth, MessageMedia } = require('whatsapp-web.js');
 const qrcode = require('qrcode-terminal');
 const axios = require('axios');
-const fs = require('fs');
-const FormData = require('form-data');
-const path = require('path');
 
 // ===================================================
 // CONFIGURAÇÕES
@@ -14,11 +11,8 @@ const SEU_NUMERO = '557592238338';
 
 // Backend Python
 const API_URL = 'http://127.0.0.1:8002/message';
-const AUDIO_API_URL = 'http://127.0.0.1:8002/audio';
-
-// Pasta temporária para áudios
-const AUDIO_DIR = path.join(__dirname, 'audios');
-if (!fs.existsSync(AUDIO_DIR)) fs.mkdirSync(AUDIO_DIR);
+// Áudio -> transcrição -> transação em uma chamada só (sem arquivo em disco)
+const AUDIO_API_URL = 'http://127.0.0.1:8002/audio/mensagem/base64';
 
 // ===================================================
 // CLIENTE WHATSAPP
@@ -74,34 +68,22 @@ client.on('message', async (msg) => {
             console.log('🎤 Áudio recebido, baixando...');
 
             const media = await msg.downloadMedia();
-            const buffer = Buffer.from(media.data, 'base64');
-
-            const fileName = `audio_${Date.now()}.ogg`;
-            const filePath = path.join(AUDIO_DIR, fileName);
-
-            fs.writeFileSync(filePath, buffer);
 
             console.log('🔄 Enviando áudio para transcrição...');
 
-            const form = new FormData();
-            form.append('audio', fs.createReadStream(filePath));
-
-            const response = await axios.post(AUDIO_API_URL, form, {
-                headers: form.getHeaders()
+            const response = await axios.post(AUDIO_API_URL, {
+                user_id: fromNumber,
+                data: media.data,
+                mimetype: media.mimetype,
+                message_id: msg.id._serialized
             });
 
             const transcribedText = response.data.text;
 
             console.log('📝 Transcrição:', transcribedText);
 
-            // Enviar texto transcrito para o backend normal
-            const finalResponse = await axios.post(API_URL, {
-                user_id: fromNumber,
-                text: transcribedText
-            });
-
-            if (finalResponse.data?.reply) {
-                await msg.reply(`🎤 "${transcribedText}"\n\n${finalResponse.data.reply}`);
+            if (response.data?.reply) {
+                await msg.reply(`🎤 "${transcribedText}"\n\n${response.data.reply}`);
             }
 
             return;
@@ -115,7 +97,9 @@ client.on('message', async (msg) => {
 
             const response = await axios.post(API_URL, {
                 user_id: fromNumber,
-                text: msg.body
+                text: msg.body,
+                // Reenvio da mesma mensagem devolve a resposta já dada
+                message_id: msg.id._serialized
             });
 
             if (response.data?.reply) {
@@ -125,7 +109,8 @@ client.on('message', async (msg) => {
 
     } catch (err) {
         console.error('❌ Erro:', err.message);
-        await msg.reply('⚠️ Erro ao processar a mensagem.');
+        // 429 (fila cheia) já vem com a resposta para o usuário
+        await msg.reply(err.response?.data?.reply || '⚠️ Erro ao processar a mensagem.');
     }
 });
 
@@ -0,0 +1,408 @@
+"""
+Administração da planilha: backup, restauração e limpeza.
+
+    python admin.py exportar [arquivo.jsonl.gz] [--por-pagina 500] [--simultaneas 4] [--do-zero]
+    python admin.py restaurar arquivo.jsonl.gz [--lote 100] [--simultaneas 4] [--do-zero]
+    python admin.py limpar [--sem-backup]
+
+Exportação: páginas buscadas em paralelo e gravadas EM ORDEM, uma linha JSON
+por transação (.gz = comprimido). Memória limitada a `simultaneas` páginas.
+A cada página gravada um checkpoint (<arquivo>.checkpoint.json) guarda a
+próxima página e o tamanho do arquivo: interrompida, a exportação continua
+de onde parou (o que foi gravado depois do checkpoint é descartado e baixado de novo).
+Sem arquivo informado, o padrão é a exportação interrompida mais recente em
+BACKUP_DIR: rodar o mesmo comando (exportar ou limpar) retoma o backup.
+
+Restauração: lê o arquivo em streaming e envia em lotes (rota de lote da API,
+com fallback para envios individuais). Cada transação leva uma chave de
+idempotência derivada do próprio registro: repetir a restauração não duplica.
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from api_client import enviar_lote, close_http_client, saude_api
+from saude_upstream import SaudeUpstream
+from config import (
+    API_URL, API_CLEAR_URL, HTTP_TIMEOUT,
+    ADMIN_PAGE_SIZE, ADMIN_CONCURRENCY, BACKUP_DIR
+)
+
+# Campos gerados pela API: não voltam na restauração
+CAMPOS_SERVIDOR = ("id", "_id", "created_at", "updated_at")
+
+# ======================================================
+# CHECKPOINTS
+# ======================================================
+
+
+def _ler_checkpoint(caminho: str) -> Optional[dict]:
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _salvar_checkpoint(caminho: str, dados: dict):
+    # Grava ao lado e renomeia: um checkpoint nunca fica pela metade
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+
+
+def _remover(caminho: str):
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+# ======================================================
+# EXPORTAÇÃO
+# ======================================================
+
+
+def _itens_da_resposta(corpo: Any) -> List[dict]:
+    """Aceita lista pura ou {"transactions"|"items"|"data": [...]}"""
+    if isinstance(corpo, list):
+        return corpo
+    if isinstance(corpo, dict):
+        for chave in ("transactions", "items", "data"):
+            if isinstance(corpo.get(chave), list):
+                return corpo[chave]
+    raise ValueError("Resposta da listagem em formato desconhecido")
+
+
+async def _buscar_pagina(http: httpx.AsyncClient, pagina: int, por_pagina: int,
+                         tentativas: int = 5, skip: Optional[int] = None) -> List[dict]:
+    params = {"skip": pagina * por_pagina if skip is None else skip, "limit": por_pagina}
+    for tentativa in range(tentativas):
+        try:
+            response = await http.get(API_URL, params=params)
+            if response.status_code == 200:
+                return _itens_da_resposta(response.json())
+            erro = f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            erro = str(e) or type(e).__name__
+        if tentativa < tentativas - 1:
+            await asyncio.sleep(SaudeUpstream.backoff(tentativa, base=1.0, maximo=30.0))
+    raise RuntimeError(f"Página {pagina} falhou {tentativas}x: {erro}")
+
+
+def _bloco(itens: List[dict], comprimir: bool) -> bytes:
+    """Uma página em JSONL; comprimida vira um membro gzip próprio (gzip aceita concatenação)"""
+    texto = "".join(
+        json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n" for item in itens)
+    dados = texto.encode("utf-8")
+    return gzip.compress(dados) if comprimir else dados
+
+
+async def exportar(saida: str, por_pagina: int = ADMIN_PAGE_SIZE,
+                   simultaneas: int = ADMIN_CONCURRENCY, retomar: bool = True) -> Dict[str, Any]:
+    """Exporta todas as transações da planilha para `saida` (JSONL, .gz opcional)"""
+    checkpoint = saida + ".checkpoint.json"
+    ponto = _ler_checkpoint(checkpoint) if retomar else None
+    comprimir = saida.endswith(".gz")
+
+    if ponto and os.path.exists(saida):
+        por_pagina = ponto["por_pagina"]
+        pagina, linhas = ponto["pagina"], ponto["linhas"]
+        # Descarta o que foi escrito depois do último checkpoint
+        with open(saida, "r+b") as f:
+            f.truncate(ponto["bytes"])
+        print(f"↩️  Retomando da página {pagina} ({linhas} transações já salvas)")
+    else:
+        pagina, linhas = 0, 0
+        os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+        open(saida, "wb").close()
+
+    inicio = time.perf_counter()
+    ultima = None  # primeira página incompleta = última página (conferido no fim)
+    maior_pagina = 0
+    proxima = pagina
+    em_voo: Dict[asyncio.Task, int] = {}
+    prontas: Dict[int, List[dict]] = {}
+
+    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as http:
+        try:
+            with open(saida, "ab") as f:
+                while ultima is None or pagina <= ultima:
+                    # Janela: no máximo `simultaneas` páginas em memória/voo
+                    while (len(em_voo) + len(prontas) < simultaneas
+                           and (ultima is None or proxima <= ultima)):
+                        tarefa = asyncio.ensure_future(_buscar_pagina(http, proxima, por_pagina))
+                        em_voo[tarefa] = proxima
+                        proxima += 1
+
+                    feitas, _ = await asyncio.wait(em_voo, return_when=asyncio.FIRST_COMPLETED)
+                    for tarefa in feitas:
+                        numero = em_voo.pop(tarefa)
+                        itens = tarefa.result()
+                        prontas[numero] = itens
+                        maior_pagina = max(maior_pagina, len(itens))
+                        if len(itens) < por_pagina and (ultima is None or numero < ultima):
+                            ultima = numero
+
+                    # Grava em ordem e só então avança o checkpoint
+                    while pagina in prontas:
+                        itens = prontas.pop(pagina)
+                        if itens:
+                            f.write(_bloco(itens, comprimir))
+                            f.flush()
+                            os.fsync(f.fileno())
+                        linhas += len(itens)
+                        pagina += 1
+                        _salvar_checkpoint(checkpoint, {
+                            "pagina": pagina, "linhas": linhas,
+                            "bytes": f.tell(), "por_pagina": por_pagina})
+                        print(f"\r📥 {linhas} transações ({pagina} páginas)", end="", flush=True)
+        finally:
+            for tarefa in em_voo:
+                tarefa.cancel()
+
+        # Página curta pode ser o teto do servidor (limit menor que o pedido),
+        # não o fim: só está completo se não houver nada depois do que foi salvo
+        restante = await _buscar_pagina(http, pagina, por_pagina, skip=linhas)
+        if restante:
+            # Com teto, cada página deixou itens de fora: o arquivo não serve nem para retomar
+            _remover(checkpoint)
+            raise RuntimeError(
+                f"Exportação incompleta: a API devolveu só {maior_pagina} itens por página "
+                f"e há transações depois das {linhas} salvas. "
+                f"Rode de novo com --por-pagina {maior_pagina or 1} --do-zero")
+
+    _remover(checkpoint)
+    decorrido = time.perf_counter() - inicio
+    print()
+    return {"arquivo": saida, "transacoes": linhas, "bytes": os.path.getsize(saida),
+            "segundos": round(decorrido, 2)}
+
+# ======================================================
+# RESTAURAÇÃO
+# ======================================================
+
+
+def _ler_linhas(entrada: str) -> Iterator[dict]:
+    abrir = gzip.open if entrada.endswith(".gz") else open
+    with abrir(entrada, "rt", encoding="utf-8") as f:
+        for linha in f:
+            if linha.strip():
+                yield json.loads(linha)
+
+
+def _para_envio(item: dict):
+    """(chave de idempotência, payload) de um registro exportado"""
+    payload = {k: v for k, v in item.items() if k not in CAMPOS_SERVIDOR}
+    origem = item.get("id") or item.get("_id") or json.dumps(payload, sort_keys=True)
+    chave = hashlib.sha256(f"restauracao|{origem}".encode("utf-8")).hexdigest()[:32]
+    return chave, payload
+
+
+async def _enviar_com_retry(lote: List[tuple], tentativas: int = 4) -> bool:
+    pendentes = lote
+    for tentativa in range(tentativas):
+        # Disjuntor aberto: espera a API voltar em vez de gastar tentativas
+        espera_ate = time.monotonic() + 300
+        while not saude_api.disponivel() and time.monotonic() < espera_ate:
+            await asyncio.sleep(1)
+        resultados = await enviar_lote(pendentes)
+        pendentes = [item for item, ok in zip(pendentes, resultados) if not ok]
+        if not pendentes:
+            return True
+        if tentativa < tentativas - 1:
+            await asyncio.sleep(SaudeUpstream.backoff(tentativa, base=1.0, maximo=30.0))
+    return False
+
+
+async def restaurar(entrada: str, tamanho_lote: int = 100,
+                    simultaneas: int = ADMIN_CONCURRENCY, retomar: bool = True) -> Dict[str, Any]:
+    """Envia para a planilha as transações de um arquivo exportado"""
+    checkpoint = entrada + ".restauracao.json"
+    ponto = _ler_checkpoint(checkpoint) if retomar else None
+    confirmadas = ponto["linhas"] if ponto else 0
+    if confirmadas:
+        print(f"↩️  Retomando após {confirmadas} transações já enviadas")
+
+    inicio = time.perf_counter()
+    # Lotes em voo por posição inicial; o checkpoint só avança por prefixo contíguo
+    em_voo: Dict[asyncio.Task, tuple] = {}
+    concluidos: Dict[int, int] = {}
+
+    async def aguardar(ate: int):
+        nonlocal confirmadas
+        while len(em_voo) > ate:
+            feitas, _ = await asyncio.wait(em_voo, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in feitas:
+                posicao, tamanho = em_voo.pop(tarefa)
+                if not tarefa.result():
+                    raise RuntimeError(
+                        f"Lote a partir da linha {posicao} não foi aceito pela API")
+                concluidos[posicao] = tamanho
+            while confirmadas in concluidos:
+                confirmadas += concluidos.pop(confirmadas)
+            _salvar_checkpoint(checkpoint, {"linhas": confirmadas})
+            print(f"\r📤 {confirmadas} transações enviadas", end="", flush=True)
+
+    try:
+        lote: List[tuple] = []
+        posicao = confirmadas
+        for indice, item in enumerate(_ler_linhas(entrada)):
+            if indice < confirmadas:
+                continue
+            lote.append(_para_envio(item))
+            if len(lote) >= tamanho_lote:
+                await aguardar(simultaneas - 1)
+                em_voo[asyncio.ensure_future(_enviar_com_retry(lote))] = (posicao, len(lote))
+                posicao += len(lote)
+                lote = []
+        if lote:
+            await aguardar(simultaneas - 1)
+            em_voo[asyncio.ensure_future(_enviar_com_retry(lote))] = (posicao, len(lote))
+        await aguardar(0)
+    finally:
+        for tarefa in em_voo:
+            tarefa.cancel()
+        await close_http_client()
+
+    _remover(checkpoint)
+    print()
+    return {"arquivo": entrada, "transacoes": confirmadas,
+            "segundos": round(time.perf_counter() - inicio, 2)}
+
+# ======================================================
+# LIMPEZA (COM BACKUP ANTES)
+# ======================================================
+
+
+def caminho_backup(retomar: bool = True) -> str:
+    """
+    Arquivo padrão de backup: o mais recente com exportação interrompida
+    (checkpoint em BACKUP_DIR), para rodar o mesmo comando continuar de onde
+    parou; senão, um novo com data e hora.
+    """
+    if retomar:
+        interrompidos = glob.glob(os.path.join(BACKUP_DIR, "planilha-*.jsonl.gz.checkpoint.json"))
+        if interrompidos:
+            ultimo = max(interrompidos, key=os.path.getmtime)
+            saida = ultimo[:-len(".checkpoint.json")]
+            print(f"⏯️  Retomando a exportação interrompida: {saida}")
+            return saida
+    return os.path.join(BACKUP_DIR, f"planilha-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz")
+
+
+async def limpar(backup: bool = True) -> bool:
+    print("=" * 60)
+    print("⚠️  ATENÇÃO: LIMPEZA DE DADOS")
+    print("=" * 60)
+    print()
+    print("Isso vai deletar PERMANENTEMENTE:")
+    print("   📊 Todas as transações")
+    print("   🎯 Todas as metas")
+    print("   💳 Todas as dívidas")
+    print()
+
+    if backup:
+        print("💾 Fazendo backup das transações antes de limpar...")
+        try:
+            resumo = await exportar(caminho_backup())
+        except Exception as e:
+            print(f"\n❌ Backup falhou ({e}). Nada foi deletado.")
+            return False
+        print(f"✅ Backup: {resumo['transacoes']} transações em {resumo['arquivo']}")
+        print(f"   Para desfazer: python admin.py restaurar {resumo['arquivo']}")
+        print("   (metas e dívidas não entram no backup)")
+    else:
+        print("⚠️  SEM BACKUP: NÃO É POSSÍVEL DESFAZER!")
+    print()
+
+    confirmacao = input("Digite 'LIMPAR' em MAIÚSCULAS para confirmar: ")
+    if confirmacao != "LIMPAR":
+        print("\n❌ Operação cancelada! Nenhum dado foi deletado.")
+        return False
+
+    print("\n🔄 Limpando dados...")
+    try:
+        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as http:
+            response = await http.delete(API_CLEAR_URL)
+    except httpx.TimeoutException:
+        print("\n❌ Timeout - Servidor demorou muito para responder")
+        return False
+    except httpx.HTTPError:
+        print("\n❌ Erro de conexão - Verifique sua internet")
+        return False
+
+    if response.status_code != 200:
+        print(f"\n❌ Erro: {response.status_code}")
+        print(f"   Detalhes: {response.text}")
+        return False
+
+    data = response.json()
+    print("\n" + "=" * 60)
+    print("✅ DADOS DELETADOS COM SUCESSO!")
+    print("=" * 60)
+    print(f"\n📊 Transações deletadas: {data.get('transactions_deleted')}")
+    print(f"🎯 Metas deletadas: {data.get('metas_deleted')}")
+    print(f"💳 Dívidas deletadas: {data.get('dividas_deleted')}")
+    print("\n✨ O site está limpo e pronto para uso real!\n")
+    return True
+
+# ======================================================
+# CLI
+# ======================================================
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup, restauração e limpeza da planilha")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    p = comandos.add_parser("exportar", help="exporta todas as transações (JSONL/.gz)")
+    p.add_argument("saida", nargs="?", help="arquivo de saída (padrão: a exportação interrompida "
+                                            "mais recente ou backups/planilha-<data>.jsonl.gz)")
+    p.add_argument("--por-pagina", type=int, default=ADMIN_PAGE_SIZE)
+    p.add_argument("--simultaneas", type=int, default=ADMIN_CONCURRENCY)
+    p.add_argument("--do-zero", action="store_true", help="ignora checkpoint existente")
+
+    p = comandos.add_parser("restaurar", help="envia para a planilha um arquivo exportado")
+    p.add_argument("entrada")
+    p.add_argument("--lote", type=int, default=100)
+    p.add_argument("--simultaneas", type=int, default=ADMIN_CONCURRENCY)
+    p.add_argument("--do-zero", action="store_true", help="ignora checkpoint existente")
+
+    p = comandos.add_parser("limpar", help="apaga tudo da planilha (faz backup antes)")
+    p.add_argument("--sem-backup", action="store_true")
+
+    args = parser.parse_args()
+    try:
+        if args.comando == "exportar":
+            resumo = asyncio.run(exportar(
+                args.saida or caminho_backup(retomar=not args.do_zero),
+                args.por_pagina, args.simultaneas,
+                retomar=not args.do_zero))
+            print(f"✅ Exportação concluída: {resumo}")
+        elif args.comando == "restaurar":
+            resumo = asyncio.run(restaurar(
+                args.entrada, args.lote, args.simultaneas, retomar=not args.do_zero))
+            print(f"✅ Restauração concluída: {resumo}")
+        else:
+            sys.exit(0 if asyncio.run(limpar(backup=not args.sem_backup)) else 1)
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrompido. Rode o mesmo comando para continuar do checkpoint.")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\n❌ {e}\n   Rode o mesmo comando para continuar do checkpoint.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+from log import log
+from config import (
+    SCHEDULER_MAX_PER_USER, SCHEDULER_MAX_CONCURRENCY, SCHEDULER_MAX_PENDING
+)
+
+# ======================================================
+# AGENDADOR: ORDEM POR USUÁRIO, PARALELO ENTRE USUÁRIOS
+# ======================================================
+# Mensagens do mesmo user_id rodam uma de cada vez, na ordem de chegada
+# (asyncio.Lock acorda quem espera em ordem FIFO): "almoço 30" seguido de
+# "2" nunca lê/grava o estado pendente ao mesmo tempo. Usuários diferentes
+# só disputam o limite global de execuções simultâneas.
+# A garantia vale dentro de um processo: com vários workers, o gateway
+# precisa mandar o mesmo usuário sempre para o mesmo worker.
+
+
+class FilaCheia(Exception):
+    """Usuário (ou o servidor) com mensagens demais aguardando"""
+
+
+class _FilaUsuario:
+    __slots__ = ("lock", "ocupacao")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.ocupacao = 0  # em execução + aguardando
+
+
+class AgendadorUsuarios:
+    def __init__(self, max_por_usuario: int, max_simultaneas: int, max_pendentes: int):
+        self.max_por_usuario = max_por_usuario
+        self.max_pendentes = max_pendentes
+        self._filas: Dict[str, _FilaUsuario] = {}
+        self._global = asyncio.Semaphore(max_simultaneas)
+
+        self.pendentes = 0
+        self.em_execucao = 0
+        self.concluidas = 0
+        self.rejeitadas = 0
+
+    async def executar(self, user_id: str, funcao: Callable[..., Awaitable], *args,
+                       limitar: bool = True):
+        """
+        Executa `funcao(*args)` na vez do usuário. Com `limitar`, recusa com
+        FilaCheia quando a fila do usuário ou o total de pendentes está no limite
+        (tarefas internas, como o refino de categoria, passam sem limite).
+        """
+        fila = self._filas.get(user_id)
+        if limitar and (
+            (fila and fila.ocupacao >= self.max_por_usuario)
+            or self.pendentes >= self.max_pendentes
+        ):
+            self.rejeitadas += 1
+            log.warning("🚦 Fila cheia para %s (%d aguardando)",
+                        user_id, fila.ocupacao if fila else 0)
+            raise FilaCheia(user_id)
+
+        if fila is None:
+            fila = self._filas[user_id] = _FilaUsuario()
+        fila.ocupacao += 1
+        self.pendentes += 1
+        try:
+            async with fila.lock:
+                async with self._global:
+                    self.em_execucao += 1
+                    try:
+                        return await funcao(*args)
+                    finally:
+                        self.em_execucao -= 1
+                        self.concluidas += 1
+        finally:
+            self.pendentes -= 1
+            fila.ocupacao -= 1
+            if fila.ocupacao == 0 and self._filas.get(user_id) is fila:
+                del self._filas[user_id]
+
+    def estatisticas(self) -> dict:
+        return {
+            "usuarios_ativos": len(self._filas),
+            "pendentes": self.pendentes,
+            "em_execucao": self.em_execucao,
+            "concluidas": self.concluidas,
+            "rejeitadas": self.rejeitadas,
+        }
+
+
+agendador = AgendadorUsuarios(
+    SCHEDULER_MAX_PER_USER, SCHEDULER_MAX_CONCURRENCY, SCHEDULER_MAX_PENDING)
@@ -1,104 +1,90 @@
-import re
+import asyncio
+import threading
+import uuid
 from datetime import datetime
-from openai import OpenAI
+from typing import Awaitable, Callable, List, Optional
 import json
+import re
 
-# Cliente OpenAI
-client = None
-try:
-    from config import OPENAI_API_KEY
-    if OPENAI_API_KEY:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-except:
-    pass
-
-# Mapeamento fixo (FALLBACK se GPT falhar)
-MAPEAMENTO_FALLBACK = {
-    'uber': ('Transporte', 'Uber'),
-    'taxi': ('Transporte', 'Táxi'),
-    '99': ('Transporte', '99'),
-    'gasolina': ('Transporte', 'Gasolina'),
-    'almoco': ('Alimentação', 'Almoço'),
-    'almoço': ('Alimentação', 'Almoço'),
-    'jantar': ('Alimentação', 'Jantar'),
-    'lanche': ('Alimentação', 'Lanche'),
-    'ifood': ('Alimentação', 'iFood'),
-    'supermercado': ('Alimentação', 'Supermercado'),
-    'farmacia': ('Saúde', 'Farmácia'),
-    'farmácia': ('Saúde', 'Farmácia'),
-    'remedio': ('Saúde', 'Remédio'),
-    'shopee': ('Shopping', 'Shopee'),
-    'amazon': ('Shopping', 'Amazon'),
-    'cinema': ('Lazer', 'Cinema'),
-    'netflix': ('Lazer', 'Netflix'),
-    'luz': ('Contas', 'Luz'),
-    'agua': ('Contas', 'Água'),
-    'internet': ('Contas', 'Internet'),
-    'salario': ('Salário', 'Salário'),
-    'salário': ('Salário', 'Salário'),
-}
+from cache_categorias import cache as cache_categorias, normalizar_mensagem
+from regras import motor_regras
+from lexico import analisar, Lexico
+from limites import LimiteExcedido
+import classificador
+from lote_gpt import MicroLote
+from log import log
+from metricas import medir, registrar_uso_openai, categorias_fonte
+from config import (
+    OPENAI_API_KEY, PARSE_BUDGET_MS, REFINE_TIMEOUT, EXTRACTION_MODE,
+    GPT_BATCH_ENABLED, GPT_BATCH_MAX_SIZE, GPT_BATCH_MAX_WAIT_MS
+)
+
+# Refinamentos em background (referência forte até terminarem)
+_refinos = set()
+
+# ======================================================
+# CLIENTE OPENAI COMPARTILHADO (CRIADO NO PRIMEIRO USO)
+# ======================================================
+# Um único cliente assíncrono (texto e áudio), com pool de conexões próprio.
+# O pacote openai é o import mais pesado do app (~0,5s): só é carregado
+# quando alguém precisa do cliente (ou no preaquecimento do startup).
+
+_openai = None
+_openai_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Retorna o AsyncOpenAI compartilhado, ou None sem OPENAI_API_KEY"""
+    global _openai
+    if _openai is None and OPENAI_API_KEY:
+        # O preaquecimento cria em uma thread; o lock evita dois clientes
+        with _openai_lock:
+            if _openai is None:
+                from openai import AsyncOpenAI
+                _openai = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _openai
+
+
+async def close_openai_client():
+    """Fecha o pool de conexões do OpenAI (shutdown do app)"""
+    global _openai
+    if _openai is not None:
+        await _openai.close()
+        _openai = None
 
 
 def extrair_valor(mensagem: str) -> float:
-    """Extrai o valor numérico da mensagem"""
-    mensagem_limpa = mensagem.replace('R$', '').replace('r$', '')
-    match = re.search(r'(\d+[.,]?\d*)', mensagem_limpa)
-
-    if match:
-        valor_str = match.group(1).replace(',', '.')
-        return float(valor_str)
-
-    return 0.0
+    """Extrai o valor numérico da mensagem ("1.234,56", "R$ 2 mil"...)"""
+    return analisar(mensagem).valor
 
 
 def identificar_tipo(mensagem: str) -> str:
     """Identifica se é Gasto ou Receita"""
-    mensagem_lower = mensagem.lower()
-
-    palavras_receita = ['recebi', 'ganhei', 'recebido', 'ganho',
-                        'receita', 'salário', 'salario', 'entrada', 'pix de']
-
-    for palavra in palavras_receita:
-        if palavra in mensagem_lower:
-            return 'Receita'
-
-    return 'Gasto'
+    return analisar(mensagem).tipo
 
 
 def identificar_categoria_fallback(mensagem: str) -> tuple:
-    """Usa o mapeamento fixo como fallback"""
-    mensagem_lower = mensagem.lower()
-
-    for palavra_chave, (categoria, subcategoria) in MAPEAMENTO_FALLBACK.items():
-        if palavra_chave in mensagem_lower:
-            return categoria, subcategoria
-
-    return 'Outros', 'Geral'
+    """Usa as regras de palavra-chave como fallback"""
+    return motor_regras.classificar(mensagem) or ('Outros', 'Geral')
 
 
-def identificar_categoria_gpt(mensagem: str) -> tuple:
-    """
-    USA GPT PARA CATEGORIZAR! 🤖
-    Aprende com qualquer categoria que você criar!
-    """
-    if not client:
-        print("⚠️ GPT não disponível, usando fallback")
-        return identificar_categoria_fallback(mensagem)
+CATEGORIAS_DISPONIVEIS = [
+    "Alimentação", "Transporte", "Saúde", "Lazer",
+    "Shopping", "Contas", "Moradia", "Educação",
+    "Pet", "Investimentos", "Beleza", "Vestuário",
+    "Salário", "Freelance", "Outros"
+]
 
-    try:
-        categorias_disponiveis = [
-            "Alimentação", "Transporte", "Saúde", "Lazer",
-            "Shopping", "Contas", "Moradia", "Educação",
-            "Pet", "Investimentos", "Beleza", "Vestuário",
-            "Salário", "Freelance", "Outros"
-        ]
 
-        prompt = f"""Você é um assistente que categoriza gastos financeiros.
+@medir("identificar_categoria_gpt")
+async def _consultar_gpt(mensagem: str) -> tuple:
+    """Chamada real ao GPT (levanta exceção se falhar)"""
+    prompt = f"""Você é um assistente que categoriza gastos financeiros.
 
 Mensagem do usuário: "{mensagem}"
 
 Categorias disponíveis:
-{', '.join(categorias_disponiveis)}
+{', '.join(CATEGORIAS_DISPONIVEIS)}
 
 Analise a mensagem e retorne APENAS um JSON no formato:
 {{"categoria": "nome_da_categoria", "subcategoria": "detalhe_especifico"}}
@@ -110,76 +96,426 @@ Exemplos:
 
 Responda APENAS com o JSON, nada mais."""
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Você é um assistente de categorização financeira. Responda sempre com JSON válido."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=100
-        )
+    response = await get_openai_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "Você é um assistente de categorização financeira. Responda sempre com JSON válido."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        max_tokens=100
+    )
+    registrar_uso_openai("categorizacao", response)
+
+    resposta = response.choices[0].message.content.strip()
+
+    # Remove markdown se houver
+    if '```json' in resposta:
+        resposta = resposta.split('```json')[1].split('```')[0].strip()
+    elif '```' in resposta:
+        resposta = resposta.split('```')[1].split('```')[0].strip()
+
+    resultado = json.loads(resposta)
+    categoria = resultado.get('categoria', 'Outros')
+    subcategoria = resultado.get('subcategoria', 'Geral')
+
+    log.debug("🤖 GPT: %s / %s", categoria, subcategoria)
+    return categoria, subcategoria
+
+
+@medir("identificar_categoria_gpt_lote")
+async def _consultar_gpt_lote(mensagens: list) -> list:
+    """
+    Categoriza várias mensagens em UMA chamada ao GPT.
+    Retorna uma lista alinhada com `mensagens` ((categoria, subcategoria) ou None).
+    """
+    if len(mensagens) == 1:
+        return [await _consultar_gpt(mensagens[0])]
+
+    itens = "\n".join(f'{i}. "{m}"' for i, m in enumerate(mensagens, 1))
+    prompt = f"""Categorize cada gasto financeiro abaixo.
+
+Categorias disponíveis:
+{', '.join(CATEGORIAS_DISPONIVEIS)}
+
+Mensagens:
+{itens}
+
+Retorne APENAS um JSON no formato:
+{{"resultados": [{{"i": 1, "categoria": "nome_da_categoria", "subcategoria": "detalhe_especifico"}}]}}
+com um item para cada mensagem, na mesma numeração."""
+
+    response = await get_openai_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "Você é um assistente de categorização financeira. Responda sempre com JSON válido."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        max_tokens=40 * len(mensagens) + 20,
+        response_format={"type": "json_object"}
+    )
+    registrar_uso_openai("categorizacao_lote", response)
+
+    resultado = json.loads(response.choices[0].message.content)
+    respostas = [None] * len(mensagens)
+    for item in resultado.get("resultados", []):
+        indice = int(item.get("i", 0)) - 1
+        if 0 <= indice < len(mensagens):
+            respostas[indice] = (item.get("categoria", "Outros"),
+                                 item.get("subcategoria", "Geral"))
+
+    log.debug("🤖 GPT (lote de %d): %d categorizadas",
+              len(mensagens), sum(r is not None for r in respostas))
+    return respostas
+
+
+lote_gpt = MicroLote(_consultar_gpt_lote, GPT_BATCH_MAX_SIZE, GPT_BATCH_MAX_WAIT_MS)
+
+
+async def _categoria_gpt(mensagem: str) -> tuple:
+    """Uma mensagem, via micro-lote quando habilitado"""
+    if GPT_BATCH_ENABLED:
+        return await lote_gpt.submeter(mensagem)
+    return await _consultar_gpt(mensagem)
+
+
+# ======================================================
+# EXTRAÇÃO ESTRUTURADA (EXTRACTION_MODE=llm)
+# ======================================================
+# Uma chamada devolve a transação inteira num JSON validado pelo schema
+# (strict): sem cercas de markdown, sem json.loads falhando. O prompt de
+# sistema é fixo (prefixo reaproveitável pelo cache de prompt da OpenAI);
+# só a mensagem do usuário muda de uma chamada para outra.
+
+MEIOS_EXTRACAO = ["Pix", "Débito", "Crédito", "Dinheiro"]
+
+_SCHEMA_EXTRACAO = {
+    "type": "object",
+    "properties": {
+        "tipo": {"type": "string", "enum": ["Gasto", "Receita"]},
+        "valor": {"type": ["number", "null"]},
+        "categoria": {"type": "string", "enum": CATEGORIAS_DISPONIVEIS},
+        "subcategoria": {"type": "string"},
+        "meio": {"type": ["string", "null"], "enum": MEIOS_EXTRACAO + [None]},
+        "parcelas": {"type": ["integer", "null"]},
+    },
+    "required": ["tipo", "valor", "categoria", "subcategoria", "meio", "parcelas"],
+    "additionalProperties": False,
+}
+
+_PROMPT_EXTRACAO = (
+    "Extraia a transação financeira da mensagem (português do Brasil).\n"
+    "tipo: Gasto ou Receita (recebi, ganhei, salário, me pagaram = Receita).\n"
+    "valor: total em reais; null se não houver.\n"
+    "subcategoria: detalhe curto (ex.: Uber, Ração, Aluguel).\n"
+    "meio: só se estiver dito ou for inequívoco (cartão de crédito, espécie...); senão null.\n"
+    "parcelas: número de parcelas se dito (à vista = 1); senão null."
+)
+
+
+@medir("extrair_transacao_gpt")
+async def _consultar_extracao(mensagem: str) -> tuple:
+    """
+    Chamada real de extração (levanta exceção se falhar).
+    Retorna (tipo, valor, categoria, subcategoria, meio, parcelas).
+    """
+    response = await get_openai_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": _PROMPT_EXTRACAO},
+            {"role": "user", "content": mensagem}
+        ],
+        temperature=0,
+        max_tokens=80,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "transacao", "strict": True, "schema": _SCHEMA_EXTRACAO}
+        }
+    )
+    registrar_uso_openai("extracao", response)
+
+    resposta = response.choices[0].message
+    if getattr(resposta, "refusal", None):
+        raise ValueError(f"extração recusada: {resposta.refusal}")
+
+    dados = json.loads(resposta.content)
+    usage = getattr(response, "usage", None)
+    log.debug("🤖 GPT (extração, %s tokens): %s",
+              getattr(usage, "total_tokens", "?"), dados)
+    return (dados["tipo"], dados["valor"], dados["categoria"], dados["subcategoria"],
+            dados["meio"], dados["parcelas"])
+
+
+# Números por extenso (sem "um"/"uma", que quase sempre são artigo).
+# Aplicado ao texto já normalizado (minúsculo e sem acentos).
+_RE_NUMERO_EXTENSO = re.compile(
+    r"\b(?:dois|duas|tres|quatro|cinco|seis|sete|oito|nove|dez|onze|doze|treze"
+    r"|quatorze|catorze|quinze|dezesseis|dezessete|dezoito|dezenove|vinte|trinta"
+    r"|quarenta|cinquenta|sessenta|setenta|oitenta|noventa|cem|cento|duzent[oa]s"
+    r"|trezent[oa]s|quatrocent[oa]s|quinhent[oa]s|seiscent[oa]s|setecent[oa]s"
+    r"|oitocent[oa]s|novecent[oa]s|mil)\b")
+
+
+async def _tentar_extracao(mensagem: str,
+                           permitir: Optional[Callable[[], bool]] = None) -> Optional[dict]:
+    """
+    Extração via cache (mesma chave da categoria, com prefixo próprio).
+    A chave ignora números escritos com dígitos, então "presente 50" e
+    "presente" dividem a entrada: valor/parcelas guardados só valem se a
+    mensagem tem número por extenso ("cinquenta reais", "três vezes"),
+    que faz parte da chave; dígitos o léxico sempre lê do texto.
+    None se indisponível, se falhar ou se `permitir()` negar.
+    """
+    if not OPENAI_API_KEY:
+        return None
+
+    async def calcular(texto):
+        if permitir is not None and not permitir():
+            raise LimiteExcedido("llm")
+        return await _consultar_extracao(texto)
+
+    try:
+        tipo, valor, categoria, subcategoria, meio, parcelas = \
+            await cache_categorias.obter_ou_calcular(mensagem, calcular, prefixo="extracao|")
+    except LimiteExcedido:
+        log.info("🚦 Limite de GPT atingido, extraindo só com regras")
+        return None
+    except Exception as e:
+        log.warning("⚠️ Extração pelo GPT falhou: %s, usando fallback", e)
+        return None
+
+    if not _RE_NUMERO_EXTENSO.search(normalizar_mensagem(mensagem)):
+        valor = parcelas = None
+    return {"tipo": tipo, "valor": valor, "categoria": categoria,
+            "subcategoria": subcategoria, "meio": meio, "parcelas": parcelas}
 
-        resposta = response.choices[0].message.content.strip()
 
-        # Remove markdown se houver
-        if '```json' in resposta:
-            resposta = resposta.split('```json')[1].split('```')[0].strip()
-        elif '```' in resposta:
-            resposta = resposta.split('```')[1].split('```')[0].strip()
+async def _tentar_gpt(mensagem: str,
+                      permitir: Optional[Callable[[], bool]] = None) -> Optional[tuple]:
+    """
+    GPT via cache; None se indisponível, se falhar ou se `permitir()`
+    (consultado só quando não há cache) negar por limite de uso
+    """
+    if not OPENAI_API_KEY:
+        log.debug("⚠️ GPT não disponível, usando fallback")
+        return None
 
-        resultado = json.loads(resposta)
-        categoria = resultado.get('categoria', 'Outros')
-        subcategoria = resultado.get('subcategoria', 'Geral')
+    async def calcular(texto):
+        if permitir is not None and not permitir():
+            raise LimiteExcedido("llm")
+        return await _categoria_gpt(texto)
 
-        print(f"🤖 GPT: {categoria} / {subcategoria}")
-        return categoria, subcategoria
+    try:
+        return await cache_categorias.obter_ou_calcular(mensagem, calcular)
 
+    except LimiteExcedido:
+        log.info("🚦 Limite de GPT atingido, categorizando só por regras")
+        return None
     except Exception as e:
-        print(f"⚠️ GPT falhou: {e}, usando fallback")
-        return identificar_categoria_fallback(mensagem)
+        log.warning("⚠️ GPT falhou: %s, usando fallback", e)
+        return None
+
+
+async def identificar_categoria_gpt(mensagem: str) -> tuple:
+    """
+    USA GPT PARA CATEGORIZAR! 🤖
+    Aprende com qualquer categoria que você criar!
+    Mensagens equivalentes ("almoço 25" / "Almoco 30") saem do cache.
+    """
+    return await _tentar_gpt(mensagem) or identificar_categoria_fallback(mensagem)
+
+
+def _categoria_local(mensagem: str) -> Optional[tuple]:
+    """Regras -> classificador local; (categoria, subcategoria, fonte) ou None"""
+    regra = motor_regras.classificar(mensagem)
+    if regra:
+        return regra[0], regra[1], 'regra'
+
+    local = classificador.classificar(mensagem)
+    if local:
+        return local[0], local[1], 'modelo'
+    return None
+
+
+async def _interpretar(mensagem: str, lexico: Lexico,
+                       permitir_gpt: Optional[Callable[[], bool]] = None) -> tuple:
+    """
+    (categoria, subcategoria, fonte, campos extraídos pelo GPT).
+    Modo local: só a categoria passa pelo GPT. Modo llm: regras/modelo
+    com valor no texto resolvem sem GPT; senão UMA extração estruturada
+    traz tudo (a categoria das regras, se houver, continua valendo).
+    """
+    if EXTRACTION_MODE != "llm":
+        return (*await categorizar(mensagem, permitir_gpt), {})
+
+    local = _categoria_local(mensagem)
+    if local and lexico.valor > 0:
+        return (*local, {})
+
+    campos = await _tentar_extracao(mensagem, permitir_gpt)
+    if local:
+        return (*local, campos or {})
+    if campos:
+        return campos["categoria"], campos["subcategoria"], 'gpt', campos
+
+    categoria, subcategoria = identificar_categoria_fallback(mensagem)
+    return categoria, subcategoria, 'fallback', {}
+
+
+def _combinar(lexico: Lexico, campos: dict) -> tuple:
+    """
+    Léxico + extração do GPT: o que o léxico leu do texto vale; o GPT
+    preenche o que faltou. Retorna (tipo, valor, meio, parcelas).
+    """
+    valor = lexico.valor or float(campos.get("valor") or 0)
+    # Receita é explícita nos dois; Gasto no léxico é só o padrão
+    tipo = "Receita" if "Receita" in (lexico.tipo, campos.get("tipo")) else "Gasto"
+    parcelas = lexico.parcelas
+    if parcelas is None and campos.get("parcelas"):
+        parcelas = max(1, int(campos["parcelas"]))
+    meio = lexico.meio
+    if meio == "Pendente":
+        meio = campos.get("meio") or ("Crédito" if parcelas and parcelas > 1 else "Pendente")
+    return tipo, max(0.0, valor), meio, parcelas
+
+
+async def categorizar(mensagem: str,
+                      permitir_gpt: Optional[Callable[[], bool]] = None) -> tuple:
+    """
+    Regras -> classificador local -> GPT -> fallback.
+    Retorna (categoria, subcategoria, fonte).
+    """
+    local = _categoria_local(mensagem)
+    if local:
+        return local
+
+    gpt = await _tentar_gpt(mensagem, permitir_gpt)
+    if gpt:
+        return gpt[0], gpt[1], 'gpt'
+
+    categoria, subcategoria = identificar_categoria_fallback(mensagem)
+    return categoria, subcategoria, 'fallback'
+
+
+async def preaquecer_categorias(mensagens: List[str],
+                                permitir_gpt: Optional[Callable[[], bool]] = None) -> int:
+    """
+    Categoriza de uma vez as mensagens de um lote (ex.: backlog do gateway).
+    Textos equivalentes viram uma consulta só e os inéditos vão juntos
+    para o micro-lote do GPT; o processamento depois sai do cache.
+    Respostas curtas ("2", "12") e comandos ficam de fora.
+    Retorna quantas mensagens distintas foram categorizadas.
+    """
+    distintas = {}
+    for mensagem in mensagens:
+        texto = mensagem.strip()
+        if texto.startswith("/"):
+            continue
+        lexico = analisar(texto)
+        if lexico.valor <= 0 or not any(len(t) >= 3 for t in lexico.tokens):
+            continue
+        distintas.setdefault(normalizar_mensagem(texto), (texto, lexico))
+
+    # Mesmo caminho do parse_message (no modo llm, a extração completa)
+    await asyncio.gather(*(_interpretar(t, lexico, permitir_gpt)
+                           for t, lexico in distintas.values()),
+                         return_exceptions=True)
+    return len(distintas)
 
 
 def identificar_meio_pagamento(mensagem: str) -> str:
     """Identifica o meio de pagamento na mensagem"""
-    mensagem_lower = mensagem.lower()
+    return analisar(mensagem).meio
 
-    if 'pix' in mensagem_lower:
-        return 'Pix'
-    elif 'debito' in mensagem_lower or 'débito' in mensagem_lower:
-        return 'Débito'
-    elif 'credito' in mensagem_lower or 'crédito' in mensagem_lower:
-        return 'Crédito'
-    elif 'dinheiro' in mensagem_lower:
-        return 'Dinheiro'
 
-    return 'Pendente'
+async def _refinar_depois(tarefa: asyncio.Task, transacao_id: str, mensagem: str,
+                          ao_refinar: Callable[..., Awaitable]):
+    """
+    Espera a categorização que estourou o prazo e repassa o resultado.
+    Sem resultado melhor (fallback, erro ou REFINE_TIMEOUT), avisa com
+    categoria None: a transação retida na outbox pode seguir como está.
+    """
+    categoria = subcategoria = None
+    fonte = 'fallback'
+    try:
+        # shield: a tarefa pode estar sendo aguardada por outras mensagens (single-flight)
+        categoria, subcategoria, fonte, _ = await asyncio.wait_for(
+            asyncio.shield(tarefa), REFINE_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.info("⏱️ Refinamento passou de %.0fs, mantendo o fallback", REFINE_TIMEOUT)
+    except Exception as e:
+        log.warning("⚠️ Refinamento de categoria falhou: %s", e)
+    if fonte == 'fallback':
+        categoria = subcategoria = None
+    try:
+        await ao_refinar(transacao_id, mensagem, categoria, subcategoria, fonte)
+    except Exception as e:
+        log.warning("⚠️ Refinamento de categoria falhou: %s", e)
 
 
-def parse_message(mensagem: str) -> dict:
+@medir("parse_message")
+async def parse_message(mensagem: str,
+                        ao_refinar: Optional[Callable[..., Awaitable]] = None,
+                        permitir_gpt: Optional[Callable[[], bool]] = None) -> dict:
     """
     Analisa mensagem com INTELIGÊNCIA ARTIFICIAL! 🤖
+    A categorização corre em paralelo com os extratores locais, limitada a
+    PARSE_BUDGET_MS. Se estourar, usa o fallback e chama
+    `ao_refinar(id, mensagem, categoria, subcategoria, fonte)` quando o GPT responder
+    (ou com categoria None se não houver refinamento até REFINE_TIMEOUT).
+    `permitir_gpt()` decide, na falta de cache, se ainda há orçamento para o GPT.
     """
-    tipo = identificar_tipo(mensagem)
-    valor = extrair_valor(mensagem)
+    transacao_id = uuid.uuid4().hex
 
-    # USA GPT! 🚀
-    categoria, subcategoria = identificar_categoria_gpt(mensagem)
+    # Valor, tipo, meio e parcelas numa passada só pelo texto
+    lexico = analisar(mensagem)
 
-    meio = identificar_meio_pagamento(mensagem)
+    # Regras e modelo local primeiro; GPT só quando nenhum decidir 🚀
+    tarefa = asyncio.ensure_future(_interpretar(mensagem, lexico, permitir_gpt))
+
+    provisoria = False
+    campos = {}
+    try:
+        if PARSE_BUDGET_MS > 0:
+            categoria, subcategoria, fonte, campos = await asyncio.wait_for(
+                asyncio.shield(tarefa), PARSE_BUDGET_MS / 1000)
+        else:
+            categoria, subcategoria, fonte, campos = await tarefa
+    except asyncio.TimeoutError:
+        log.info("⏱️ Categorização passou de %.0fms, usando fallback", PARSE_BUDGET_MS)
+        categoria, subcategoria = identificar_categoria_fallback(mensagem)
+        fonte = 'fallback'
+        provisoria = True
+        if ao_refinar:
+            refino = asyncio.create_task(
+                _refinar_depois(tarefa, transacao_id, mensagem, ao_refinar))
+            _refinos.add(refino)
+            refino.add_done_callback(_refinos.discard)
+
+    tipo, valor, meio, parcelas = _combinar(lexico, campos)
+    rotulo = [categoria, subcategoria]
+    categorias_fonte.inc(fonte)
 
     if tipo == 'Receita' and categoria == 'Outros':
         categoria = 'Salário'
         subcategoria = 'Salário'
 
     return {
+        'id': transacao_id,
         'tipo': tipo.upper(),
         'valor': valor,
         'categoria': categoria,
         'subcategoria': subcategoria,
         'meio': meio,
         'descricao': mensagem,
-        'parcelado': 'Não',
-        'total_parcelas': 1,
-        'data_compra': datetime.now()
+        'parcelado': 'Sim' if (parcelas or 1) > 1 else 'Não',
+        'total_parcelas': parcelas or 1,
+        # Parcelas já ditas na mensagem ("em 3x", "à vista"): não pergunta de novo
+        'parcelas_informadas': parcelas is not None,
+        'data_compra': datetime.now(),
+        'fonte_categoria': fonte,
+        'categoria_provisoria': provisoria,
+        # Rótulo original (antes de ajustes do bot), usado para treino
+        'rotulo': rotulo
     }
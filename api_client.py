@@ -1,124 +1,362 @@
-import requests
+import asyncio
+import hashlib
+import time
+import httpx
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-from typing import Dict, Any
-import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from log import log
+from metricas import medir, retries, falhas, hedges
+from saude_upstream import SaudeUpstream, CircuitoAberto
+from config import (
+    API_BASE_URL, API_URL, API_BULK_URL, API_BULK_ENABLED, HTTP_TIMEOUT,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, SAVE_CONCURRENCY, API_WRITE_CONCURRENCY,
+    API_BREAKER_FAILURES, API_BREAKER_OPEN_SECONDS, API_BREAKER_MAX_OPEN_SECONDS,
+    API_TIMEOUT_MIN, API_HEDGE_ENABLED, API_HEDGE_MIN_MS
+)
+
+# ======================================================
+# CLIENTE HTTP COMPARTILHADO (KEEP-ALIVE)
+# ======================================================
+
+_http: Optional[httpx.AsyncClient] = None
+_envios: Optional[asyncio.Semaphore] = None
+# Vira False na primeira resposta 404/405/501 da rota de lote
+_lote_suportado = API_BULK_ENABLED
+
+# Visão compartilhada da saúde da API (disjuntor + timeout adaptativo)
+saude_api = SaudeUpstream(
+    "API planilha", API_BREAKER_FAILURES, API_BREAKER_OPEN_SECONDS,
+    API_BREAKER_MAX_OPEN_SECONDS, API_TIMEOUT_MIN, HTTP_TIMEOUT)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Retorna o cliente HTTP assíncrono compartilhado (pool de conexões)"""
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE
+            )
+        )
+    return _http
+
+
+def _limite_envios() -> asyncio.Semaphore:
+    """Teto global de POSTs individuais em voo (criado junto com o pool)"""
+    global _envios
+    if _envios is None:
+        _envios = asyncio.Semaphore(API_WRITE_CONCURRENCY)
+    return _envios
+
+
+async def _requisitar(metodo: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Uma requisição à API passando pelo disjuntor, com o timeout adaptativo.
+    Timeout, erro de conexão e 5xx contam como falha; outras respostas,
+    como sucesso (a API está de pé). Disjuntor aberto: CircuitoAberto.
+    """
+    sonda = saude_api.permitir()
+    inicio = time.perf_counter()
+    try:
+        response = await get_http_client().request(
+            metodo, url, timeout=saude_api.timeout(), **kwargs)
+    except (asyncio.CancelledError, httpx.PoolTimeout):
+        # Leitura duplicada perdedora ou espera por conexão do pool local:
+        # não diz nada sobre a saúde da API
+        saude_api.liberar_sonda(sonda)
+        raise
+    except httpx.HTTPError:
+        saude_api.registrar_falha(time.perf_counter() - inicio, sonda)
+        raise
+
+    if response.status_code >= 500:
+        saude_api.registrar_falha(time.perf_counter() - inicio, sonda)
+    else:
+        saude_api.registrar_sucesso(time.perf_counter() - inicio)
+    return response
+
+
+async def close_http_client():
+    """Fecha o pool de conexões (shutdown do app)"""
+    global _http, _envios
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+    _envios = None
+
+
+def _data_base(data: Dict[str, Any]) -> datetime:
+    """Data da compra (datetime ou ISO vindo da outbox)"""
+    data_compra = data.get("data_compra")
+    if isinstance(data_compra, datetime):
+        return data_compra
+    if isinstance(data_compra, str):
+        try:
+            return datetime.fromisoformat(data_compra)
+        except ValueError:
+            pass
+    return datetime.now()
+
+
+def _chave_idempotencia(data: Dict[str, Any], data_base: datetime,
+                        parcela: int, total_parcelas: int) -> str:
+    """Chave determinística: a mesma compra/parcela gera sempre a mesma chave"""
+    base = "|".join([
+        str(data.get("user_id", "")),
+        str(data.get("descricao", "")),
+        f"{float(data.get('valor', 0)):.2f}",
+        data_base.isoformat(),
+        f"{parcela}/{total_parcelas}"
+    ])
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:32]
+
+
+def montar_transacoes(data: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Monta de uma vez todas as transações (parcelas) a enviar.
+    Retorna uma lista de (chave_idempotencia, payload).
+    """
+    # Normaliza o tipo
+    tipo = data.get("tipo", "Gasto")
+    if tipo.upper() == "GASTO":
+        tipo = "Gasto"
+    elif tipo.upper() == "RECEITA":
+        tipo = "Receita"
+
+    # Normaliza parcelado
+    total_parcelas = max(1, int(data.get("total_parcelas", 1)))
+    parcelado = "Sim" if total_parcelas > 1 else "Não"
+
+    valor_total = float(data.get("valor", 0))
+    data_base = _data_base(data)
+
+    transaction_data = {
+        "tipo": tipo,
+        "valor": valor_total,
+        "categoria": data.get("categoria", "Geral"),
+        "subcategoria": data.get("subcategoria", "") or "",
+        "meio_pagamento": data.get("meio", "Pix"),
+        "parcelado": parcelado,
+        "parcela_atual": 1,
+        "total_parcelas": total_parcelas,
+        "descricao": data.get("descricao", ""),
+        "data": data_base.isoformat(),
+        "origem": data.get("origem", "WhatsApp")
+    }
+
+    if total_parcelas == 1:
+        chave = _chave_idempotencia(data, data_base, 1, 1)
+        return [(chave, transaction_data)]
+
+    # Cronograma de parcelas: cada parcela em um mês diferente!
+    valor_parcela = valor_total / total_parcelas
+    transacoes = []
+    for parcela in range(1, total_parcelas + 1):
+        parcela_data = transaction_data.copy()
+        parcela_data["valor"] = valor_parcela
+        parcela_data["parcela_atual"] = parcela
+        parcela_data["descricao"] = f"{data.get('descricao', '')} ({parcela}/{total_parcelas})"
+        parcela_data["data"] = (
+            data_base + relativedelta(months=parcela - 1)).isoformat()
+
+        chave = _chave_idempotencia(data, data_base, parcela, total_parcelas)
+        transacoes.append((chave, parcela_data))
+
+    return transacoes
+
 
-# URL da API da planilha web
-API_URL = "https://financial-details-1.preview.emergentagent.com/api/transactions"
+# 4xx que dizem respeito ao pedido em si: reenviar o mesmo payload não adianta.
+# Fora: 401/403 (credencial, se corrige no servidor), 408/425/429 (passageiros), 409 (já salva)
+_NAO_DEFINITIVOS = frozenset([401, 403, 408, 409, 425, 429])
 
 
-def save_to_api(data: Dict[str, Any]) -> bool:
+def recusa_definitiva(status: int) -> bool:
+    return 400 <= status < 500 and status not in _NAO_DEFINITIVOS
+
+
+@medir("enviar_transacao")
+async def enviar_transacao(chave: str, payload: Dict[str, Any]) -> Optional[bool]:
     """
-    Envia transação para a API da planilha web
+    Envia UMA transação (uma tentativa) com o cabeçalho Idempotency-Key.
+    Reenvios com a mesma chave não duplicam a linha na planilha.
+    True = aceita, False = falhou (tentar de novo), None = recusada pela
+    API (4xx definitivo: reenviar não adianta).
     """
     try:
-        # Normaliza o tipo
-        tipo = data.get("tipo", "Gasto")
-        if tipo.upper() == "GASTO":
-            tipo = "Gasto"
-        elif tipo.upper() == "RECEITA":
-            tipo = "Receita"
-
-        # Normaliza parcelado
-        total_parcelas = int(data.get("total_parcelas", 1))
-        parcelado = "Sim" if total_parcelas > 1 else "Não"
-
-        # Prepara os dados
-        transaction_data = {
-            "tipo": tipo,
-            "valor": float(data.get("valor", 0)),
-            "categoria": data.get("categoria", "Geral"),
-            "subcategoria": data.get("subcategoria", "") or "",
-            "meio_pagamento": data.get("meio", "Pix"),
-            "parcelado": parcelado,
-            "parcela_atual": 1,
-            "total_parcelas": total_parcelas,
-            "descricao": data.get("descricao", ""),
-            "origem": "WhatsApp"
-        }
-
-        print(f"📤 Enviando para API: {transaction_data}")
-
-        # Se for parcelado, cria múltiplas transações
-        if total_parcelas > 1:
-            valor_parcela = float(data.get("valor", 0)) / total_parcelas
-            data_base = datetime.now()
-
-            for parcela in range(1, total_parcelas + 1):
-                parcela_data = transaction_data.copy()
-                parcela_data["valor"] = valor_parcela
-                parcela_data["parcela_atual"] = parcela
-                parcela_data["descricao"] = f"{data.get('descricao', '')} ({parcela}/{total_parcelas})"
-
-                # Cada parcela em um mês diferente!
-                data_parcela = data_base + relativedelta(months=parcela - 1)
-                parcela_data["data"] = data_parcela.isoformat()
-
-                print(
-                    f"📅 Parcela {parcela}/{total_parcelas} → {data_parcela.strftime('%m/%Y')}")
-
-                # Retry logic (tenta 3 vezes)
-                for tentativa in range(3):
-                    try:
-                        response = requests.post(
-                            API_URL, json=parcela_data, timeout=30)
-
-                        if response.status_code == 200:
-                            print(
-                                f"✅ Parcela {parcela}/{total_parcelas} salva!")
-                            break
-                        else:
-                            print(
-                                f"❌ Erro ao salvar parcela {parcela}: {response.status_code}")
-                            if tentativa < 2:
-                                time.sleep(2)
-                            else:
-                                return False
-                    except requests.exceptions.Timeout:
-                        print(
-                            f"⏱️ Timeout na parcela {parcela}, tentativa {tentativa + 1}/3")
-                        if tentativa < 2:
-                            time.sleep(2)
-                        else:
-                            return False
+        async with _limite_envios():
+            response = await _requisitar(
+                "POST", API_URL, json=payload, headers={"Idempotency-Key": chave})
 
+        # 409 = chave já processada pela API (reenvio de algo já salvo)
+        if response.status_code in (200, 201, 409):
+            log.debug("✅ Transação salva! (%s/%s)",
+                      payload["parcela_atual"], payload["total_parcelas"])
             return True
 
-        else:
-            # Transação única
-            response = requests.post(
-                API_URL, json=transaction_data, timeout=30)
+        log.warning("❌ Erro ao salvar: %s", response.status_code)
+        falhas.inc("enviar_transacao")
+        return None if recusa_definitiva(response.status_code) else False
+
+    except CircuitoAberto:
+        log.debug("⏸️ API fora do ar (disjuntor aberto), transação %s fica para depois", chave)
+        return False
+    except httpx.TimeoutException:
+        log.warning("⏱️ Timeout ao salvar transação %s", chave)
+        falhas.inc("enviar_transacao")
+        return False
+    except Exception as e:
+        log.error("❌ Erro ao salvar na API: %s", e)
+        falhas.inc("enviar_transacao")
+        return False
+
 
-            if response.status_code == 200:
-                print(f"✅ Transação salva com sucesso!")
-                return True
+@medir("enviar_lote")
+async def enviar_lote(transacoes: List[Tuple[str, Dict[str, Any]]]) -> List[Optional[bool]]:
+    """
+    Envia várias transações em UMA requisição (cada uma leva sua chave de
+    idempotência). Sem rota de lote na API, envia uma a uma em paralelo
+    (no máximo API_WRITE_CONCURRENCY em voo, somando todos os lotes).
+    Retorna, na mesma ordem, o resultado de cada uma (como enviar_transacao).
+    """
+    global _lote_suportado
+    if len(transacoes) > 1 and _lote_suportado:
+        corpo = {"transactions": [
+            {**payload, "idempotency_key": chave} for chave, payload in transacoes]}
+        try:
+            response = await _requisitar("POST", API_BULK_URL, json=corpo)
+            if response.status_code in (200, 201, 207):
+                return _resultado_lote(response, len(transacoes))
+            # 4xx = a API não entende a rota/corpo do lote (408/429 são passageiros)
+            if (400 <= response.status_code < 500 and response.status_code not in (408, 429)) \
+                    or response.status_code == 501:
+                log.info("ℹ️ API recusou o envio em lote (%s), usando envios individuais",
+                         response.status_code)
+                _lote_suportado = False
             else:
-                print(f"❌ Erro ao salvar: {response.status_code}")
-                return False
+                log.warning("❌ Erro ao salvar lote: %s", response.status_code)
+                falhas.inc("enviar_lote")
+                return [False] * len(transacoes)
+        except CircuitoAberto:
+            return [False] * len(transacoes)
+        except Exception as e:
+            log.error("❌ Erro ao salvar lote na API: %s", e)
+            falhas.inc("enviar_lote")
+            return [False] * len(transacoes)
+
+    return list(await asyncio.gather(
+        *(enviar_transacao(chave, payload) for chave, payload in transacoes)))
+
+
+def _resultado_lote(response: httpx.Response, total: int) -> List[Optional[bool]]:
+    """
+    Lê o status por item ({"results": [{"status": 201}, ...]}) quando a API
+    devolve; sem detalhe, 2xx vale para o lote inteiro.
+    """
+    try:
+        itens = response.json().get("results")
+    except (ValueError, AttributeError):
+        itens = None
+    if not isinstance(itens, list) or len(itens) != total:
+        return [True] * total
+    resultados: List[Optional[bool]] = []
+    for item in itens:
+        status = int(item.get("status", 201))
+        resultados.append(True if status in (200, 201, 409)
+                          else None if recusa_definitiva(status) else False)
+    return resultados
 
+
+@medir("save_to_api")
+async def save_to_api(data: Dict[str, Any]) -> bool:
+    """
+    Envia transação para a API da planilha web.
+    Parcelas vão em paralelo (limite SAVE_CONCURRENCY), com até 3 tentativas
+    e backoff com jitter; com o disjuntor aberto desiste na hora.
+    """
+    try:
+        transacoes = montar_transacoes(data)
     except Exception as e:
-        print(f"❌ Erro ao salvar na API: {e}")
+        log.error("❌ Erro ao montar transação: %s", e)
         return False
 
+    log.debug("📤 Enviando para API: %d transação(ões)", len(transacoes))
+    limite = asyncio.Semaphore(SAVE_CONCURRENCY)
+
+    async def enviar_com_retry(chave, payload):
+        async with limite:
+            for tentativa in range(3):
+                resultado = await enviar_transacao(chave, payload)
+                if resultado:
+                    return True
+                # Recusada pela API: outra tentativa teria a mesma resposta
+                if resultado is not None and tentativa < 2 and saude_api.disponivel():
+                    retries.inc("save_to_api")
+                    await asyncio.sleep(saude_api.backoff(tentativa))
+                else:
+                    return False
+            return False
 
-def get_month_summary(mes: int = None, ano: int = None) -> tuple:
-    """Busca o resumo do mês da API"""
+    resultados = await asyncio.gather(
+        *(enviar_com_retry(chave, payload) for chave, payload in transacoes))
+    return all(resultados)
+
+
+async def _get_com_hedge(url: str, params: dict) -> httpx.Response:
+    """
+    GET idempotente com leitura duplicada: se a primeira demora bem mais
+    que o normal, dispara uma segunda e fica com a que responder primeiro.
+    """
+    primeira = asyncio.ensure_future(_requisitar("GET", url, params=params))
+    if not API_HEDGE_ENABLED:
+        return await primeira
+
+    feitas, _ = await asyncio.wait(
+        {primeira}, timeout=saude_api.atraso_hedge(API_HEDGE_MIN_MS / 1000))
+    if feitas or not saude_api.disponivel():
+        return await primeira
+
+    hedges.inc("get_month_summary")
+    tarefas = {primeira, asyncio.ensure_future(_requisitar("GET", url, params=params))}
+    erro: Optional[BaseException] = None
+    try:
+        while tarefas:
+            feitas, tarefas = await asyncio.wait(tarefas, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in feitas:
+                if tarefa.exception() is None:
+                    return tarefa.result()
+                erro = tarefa.exception()
+        raise erro
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+@medir("get_month_summary")
+async def get_month_summary(mes: int = None, ano: int = None) -> tuple:
+    """
+    Busca o resumo do mês da API.
+    Com o disjuntor aberto levanta CircuitoAberto (quem chama decide o fallback).
+    """
     try:
         now = datetime.now()
         mes = mes or now.month
         ano = ano or now.year
 
-        summary_url = f"https://financial-details-1.preview.emergentagent.com/api/dashboard/summary?mes={mes}&ano={ano}"
-        response = requests.get(summary_url, timeout=30)
+        params = {"mes": mes, "ano": ano}
+        # As duas leituras são independentes: em paralelo
+        response, cat_response = await asyncio.gather(
+            _get_com_hedge(f"{API_BASE_URL}/dashboard/summary", params),
+            _get_com_hedge(f"{API_BASE_URL}/charts/category", params)
+        )
 
         if response.status_code == 200:
             data = response.json()
             total = data.get("despesas", 0) + data.get("contas", 0)
 
-            category_url = f"https://financial-details-1.preview.emergentagent.com/api/charts/category?mes={mes}&ano={ano}"
-            cat_response = requests.get(category_url, timeout=30)
-
             categorias = {}
             if cat_response.status_code == 200:
                 cat_data = cat_response.json()
@@ -128,8 +366,11 @@ def get_month_summary(mes: int = None, ano: int = None) -> tuple:
         else:
             return 0.0, {}
 
+    except CircuitoAberto:
+        raise
     except Exception as e:
-        print(f"❌ Erro ao buscar resumo: {e}")
+        log.error("❌ Erro ao buscar resumo: %s", e)
+        falhas.inc("get_month_summary")
         return 0.0, {}
 
 
@@ -0,0 +1,286 @@
+"""
+Benchmark de ponta a ponta do bot.
+
+Sobe os servidores falsos (bench/mocks.py) e o app em processos separados,
+com bancos locais em um diretório temporário, e dispara conversas
+realistas em paralelo. No fim imprime vazão e percentis de latência
+por tipo de requisição.
+
+    python -m bench.carga --usuarios 50 --duracao 30
+    python -m bench.carga --mix simples=40,meio=20,parcelado=10,resumo=15,audio=15
+    BENCH_LATENCIA_GPT_MS=1500 BENCH_ERRO_API=0.1 python -m bench.carga --json antes.json
+
+As variáveis BENCH_* (ver bench/mocks.py) controlam latência e erros simulados.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Itens com regra (sem GPT) e itens "novos" (vão para o GPT falso)
+ITENS_REGRA = ["uber", "almoço", "ifood", "farmácia", "netflix", "gasolina", "shopee"]
+ITENS_NOVOS = ["ração", "curso", "presente", "ferramenta", "livro", "corte de cabelo"]
+
+MIX_PADRAO = "simples=40,meio=20,parcelado=10,resumo=15,audio=15"
+
+# ======================================================
+# PROCESSOS (MOCKS + APP)
+# ======================================================
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _subir(modulo: str, porta: int, env: dict, saude: str, workers: int = 1) -> subprocess.Popen:
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", modulo, "--port", str(porta),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=RAIZ, env=env
+    )
+    limite = time.time() + 30
+    while time.time() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"{modulo} encerrou ao iniciar")
+        try:
+            if httpx.get(f"http://127.0.0.1:{porta}{saude}", timeout=1).status_code == 200:
+                return processo
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    processo.kill()
+    raise RuntimeError(f"{modulo} não respondeu em 30s")
+
+# ======================================================
+# CONVERSAS
+# ======================================================
+
+
+# Só consoantes: o sufixo nunca forma palavra que o léxico reconheça
+# (meio, receita, "e"/"mais" de vários itens)
+_LETRAS_SUFIXO = "bcdfghjklmnpqrstvwxz"
+
+
+def _item(taxa_novos: float) -> str:
+    if random.random() < taxa_novos:
+        # Sufixo único e alfabético: normalizar_mensagem remove dígitos, então um
+        # sufixo numérico cairia sempre na mesma chave do cache de categorias
+        # (e o léxico o leria como valor ou parcelas)
+        sufixo = "".join(random.choice(_LETRAS_SUFIXO) for _ in range(6))
+        return f"{random.choice(ITENS_NOVOS)} {sufixo}"
+    return random.choice(ITENS_REGRA)
+
+
+async def _texto(http, base, user_id, texto, rotulo, medir):
+    inicio = time.perf_counter()
+    try:
+        r = await http.post(f"{base}/message", json={"user_id": user_id, "text": texto})
+        ok = r.status_code == 200 and "Erro interno" not in r.json().get("reply", "")
+    except httpx.HTTPError:
+        ok = False
+    medir(rotulo, time.perf_counter() - inicio, ok)
+
+
+async def conversa_simples(http, base, user_id, medir, taxa_novos):
+    await _texto(http, base, user_id, f"{_item(taxa_novos)} {random.randint(5, 300)} pix",
+                 "gasto_completo", medir)
+
+
+async def conversa_meio(http, base, user_id, medir, taxa_novos):
+    await _texto(http, base, user_id, f"{_item(taxa_novos)} {random.randint(5, 300)}",
+                 "gasto_sem_meio", medir)
+    await _texto(http, base, user_id, random.choice(["1", "2"]), "resposta_meio", medir)
+
+
+async def conversa_parcelado(http, base, user_id, medir, taxa_novos):
+    await _texto(http, base, user_id, f"{_item(taxa_novos)} {random.randint(300, 5000)}",
+                 "gasto_sem_meio", medir)
+    await _texto(http, base, user_id, "3", "resposta_credito", medir)
+    await _texto(http, base, user_id, "12", "resposta_parcelas", medir)
+
+
+async def conversa_resumo(http, base, user_id, medir, taxa_novos):
+    await _texto(http, base, user_id, "/resumo", "resumo", medir)
+
+
+async def conversa_audio(http, base, user_id, medir, taxa_novos):
+    # Bytes aleatórios: não cai no cache de transcrições
+    audio = base64.b64encode(os.urandom(16 * 1024)).decode()
+    inicio = time.perf_counter()
+    try:
+        r = await http.post(f"{base}/audio/mensagem/base64",
+                            json={"user_id": user_id, "data": audio, "mimetype": "audio/ogg"})
+        ok = r.status_code == 200 and "reply" in r.json()
+    except httpx.HTTPError:
+        ok = False
+    medir("audio", time.perf_counter() - inicio, ok)
+
+
+CONVERSAS = {
+    "simples": conversa_simples,
+    "meio": conversa_meio,
+    "parcelado": conversa_parcelado,
+    "resumo": conversa_resumo,
+    "audio": conversa_audio,
+}
+
+# ======================================================
+# EXECUÇÃO E RELATÓRIO
+# ======================================================
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+async def executar(base: str, usuarios: int, duracao: float, mix: dict, taxa_novos: float) -> dict:
+    latencias = defaultdict(list)
+    erros = defaultdict(int)
+
+    def medir(rotulo, segundos, ok):
+        latencias[rotulo].append(segundos)
+        if not ok:
+            erros[rotulo] += 1
+
+    nomes, pesos = zip(*mix.items())
+    limite = time.perf_counter() + duracao
+    conversas = 0
+
+    async def usuario(indice):
+        nonlocal conversas
+        user_id = f"bench{indice}"
+        while time.perf_counter() < limite:
+            cenario = random.choices(nomes, pesos)[0]
+            await CONVERSAS[cenario](http, base, user_id, medir, taxa_novos)
+            conversas += 1
+
+    limites = httpx.Limits(max_connections=usuarios, max_keepalive_connections=usuarios)
+    async with httpx.AsyncClient(timeout=120, limits=limites) as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario(i) for i in range(usuarios)))
+        decorrido = time.perf_counter() - inicio
+
+    total = sum(len(v) for v in latencias.values())
+    return {
+        "usuarios": usuarios,
+        "segundos": round(decorrido, 2),
+        "conversas": conversas,
+        "requisicoes": total,
+        "req_por_segundo": round(total / decorrido, 2),
+        "erros": sum(erros.values()),
+        "por_tipo": {
+            rotulo: {
+                "n": len(valores),
+                "erros": erros[rotulo],
+                "p50_ms": round(_percentil(valores, 50) * 1000, 1),
+                "p90_ms": round(_percentil(valores, 90) * 1000, 1),
+                "p99_ms": round(_percentil(valores, 99) * 1000, 1),
+                "max_ms": round(max(valores) * 1000, 1),
+            }
+            for rotulo, valores in sorted(latencias.items())
+        }
+    }
+
+
+def imprimir(relatorio: dict):
+    print()
+    print("=" * 72)
+    print(f"📊 {relatorio['requisicoes']} requisições em {relatorio['segundos']}s "
+          f"({relatorio['req_por_segundo']} req/s, {relatorio['usuarios']} usuários, "
+          f"{relatorio['erros']} erros)")
+    print("=" * 72)
+    print(f"{'tipo':<20}{'n':>7}{'erros':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for rotulo, d in relatorio["por_tipo"].items():
+        print(f"{rotulo:<20}{d['n']:>7}{d['erros']:>7}{d['p50_ms']:>10}"
+              f"{d['p90_ms']:>10}{d['p99_ms']:>10}{d['max_ms']:>10}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do bot com mocks locais")
+    parser.add_argument("--usuarios", type=int, default=20, help="usuários simultâneos")
+    parser.add_argument("--duracao", type=float, default=20, help="segundos de carga")
+    parser.add_argument("--mix", default=MIX_PADRAO, help="cenario=peso,...")
+    parser.add_argument("--novos", type=float, default=0.3,
+                        help="fração de itens sem regra (vão ao GPT falso)")
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn do app")
+    parser.add_argument("--json", help="salva o relatório neste arquivo")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = {nome: float(peso) for nome, peso in
+           (item.split("=") for item in args.mix.split(","))}
+    desconhecidos = set(mix) - set(CONVERSAS)
+    if desconhecidos:
+        parser.error(f"cenários desconhecidos: {', '.join(desconhecidos)}")
+
+    porta_mocks, porta_app = _porta_livre(), _porta_livre()
+    dados = tempfile.mkdtemp(prefix="bench-bot-")
+    env = dict(os.environ)
+    env.update({
+        "API_BASE_URL": f"http://127.0.0.1:{porta_mocks}/api",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{porta_mocks}/v1",
+        "OPENAI_API_KEY": "bench",
+        "OUTBOX_PATH": os.path.join(dados, "outbox.db"),
+        "LEDGER_PATH": os.path.join(dados, "ledger.db"),
+        "CLASSIFIER_PATH": os.path.join(dados, "classificador.db"),
+        "STATE_SQLITE_PATH": os.path.join(dados, "estado.db"),
+        "CATEGORY_CACHE_PATH": "",
+        # Os mocks têm a rota de lote
+        "API_BULK_ENABLED": env.get("API_BULK_ENABLED", "1"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        # Mede capacidade, não os limites por usuário (RATE_LIMIT_ENABLED=1 para incluí-los)
+        "RATE_LIMIT_ENABLED": env.get("RATE_LIMIT_ENABLED", "0"),
+    })
+
+    processos = []
+    try:
+        processos.append(_subir("bench.mocks:app", porta_mocks, env, "/api/bench/contadores"))
+        if args.workers > 1:
+            # Diálogos pendentes precisam ser vistos por todos os workers
+            env["STATE_BACKEND"] = "sqlite"
+        processos.append(_subir("main:app", porta_app, env, "/ready", args.workers))
+
+        relatorio = asyncio.run(executar(
+            f"http://127.0.0.1:{porta_app}", args.usuarios, args.duracao, mix, args.novos))
+        relatorio["mocks"] = httpx.get(
+            f"http://127.0.0.1:{porta_mocks}/api/bench/contadores").json()
+        relatorio["config"] = {k: v for k, v in env.items() if k.startswith("BENCH_")}
+
+        imprimir(relatorio)
+        print(f"🧪 Mocks: {relatorio['mocks']}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(relatorio, f, ensure_ascii=False, indent=2)
+            print(f"💾 Relatório salvo em {args.json}")
+    finally:
+        # App primeiro: a outbox não tenta enviar para mocks já encerrados
+        for processo in reversed(processos):
+            processo.terminate()
+            try:
+                processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+
+
+if __name__ == "__main__":
+    main()
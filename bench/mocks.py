@@ -0,0 +1,179 @@
+"""
+Servidores falsos para benchmark: API da planilha + OpenAI (chat e Whisper).
+
+    BENCH_LATENCIA_API_MS=80 BENCH_LATENCIA_GPT_MS=600 BENCH_ERRO_API=0.05 \
+        uvicorn bench.mocks:app --port 9100
+
+Variáveis (latência média em ms, com jitter de ±BENCH_JITTER; erro = fração 0..1):
+BENCH_LATENCIA_API_MS, BENCH_LATENCIA_GPT_MS, BENCH_LATENCIA_STT_MS,
+BENCH_ERRO_API, BENCH_ERRO_GPT, BENCH_ERRO_STT, BENCH_JITTER
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCIA_API = float(os.getenv("BENCH_LATENCIA_API_MS", "80")) / 1000
+LATENCIA_GPT = float(os.getenv("BENCH_LATENCIA_GPT_MS", "600")) / 1000
+LATENCIA_STT = float(os.getenv("BENCH_LATENCIA_STT_MS", "1500")) / 1000
+ERRO_API = float(os.getenv("BENCH_ERRO_API", "0"))
+ERRO_GPT = float(os.getenv("BENCH_ERRO_GPT", "0"))
+ERRO_STT = float(os.getenv("BENCH_ERRO_STT", "0"))
+JITTER = float(os.getenv("BENCH_JITTER", "0.3"))
+# Transações já "na planilha" ao subir (para testar exportação)
+HISTORICO = int(os.getenv("BENCH_HISTORICO", "0"))
+
+app = FastAPI()
+contadores = {"transacoes": 0, "chat": 0, "audio": 0, "erros": 0}
+_chaves_vistas = set()
+_transacoes = [
+    {"id": f"h{i}", "tipo": "Gasto", "valor": float(i % 300 + 1), "categoria": "Outros",
+     "subcategoria": "Bench", "meio_pagamento": "Pix", "descricao": f"histórico {i}"}
+    for i in range(HISTORICO)
+]
+
+
+def _guardar(payload: dict):
+    _transacoes.append({"id": f"t{len(_transacoes)}", **payload})
+
+
+async def _simular(latencia: float, taxa_erro: float):
+    await asyncio.sleep(max(0.0, latencia * random.uniform(1 - JITTER, 1 + JITTER)))
+    if random.random() < taxa_erro:
+        contadores["erros"] += 1
+        return JSONResponse(status_code=500, content={"detail": "erro simulado"})
+    return None
+
+
+# ======================================================
+# API DA PLANILHA
+# ======================================================
+
+
+@app.post("/api/transactions")
+async def criar_transacao(request: Request):
+    erro = await _simular(LATENCIA_API, ERRO_API)
+    if erro:
+        return erro
+    chave = request.headers.get("idempotency-key")
+    if chave and chave in _chaves_vistas:
+        return JSONResponse(status_code=409, content={"detail": "duplicada"})
+    _chaves_vistas.add(chave)
+    _guardar(await request.json())
+    contadores["transacoes"] += 1
+    return {"ok": True}
+
+
+@app.post("/api/transactions/bulk")
+async def criar_transacoes(request: Request):
+    corpo = await request.json()
+    erro = await _simular(LATENCIA_API, ERRO_API)
+    if erro:
+        return erro
+    resultados = []
+    for transacao in corpo["transactions"]:
+        chave = transacao.get("idempotency_key")
+        if chave and chave in _chaves_vistas:
+            resultados.append({"status": 409})
+            continue
+        _chaves_vistas.add(chave)
+        _guardar({k: v for k, v in transacao.items() if k != "idempotency_key"})
+        contadores["transacoes"] += 1
+        resultados.append({"status": 201})
+    return {"results": resultados}
+
+
+@app.get("/api/transactions")
+async def listar_transacoes(skip: int = 0, limit: int = 100):
+    erro = await _simular(LATENCIA_API, ERRO_API)
+    return erro or _transacoes[skip:skip + limit]
+
+
+@app.delete("/api/admin/clear-all")
+async def limpar_tudo():
+    total = len(_transacoes)
+    _transacoes.clear()
+    _chaves_vistas.clear()
+    return {"transactions_deleted": total, "metas_deleted": 0, "dividas_deleted": 0}
+
+
+@app.get("/api/dashboard/summary")
+async def resumo():
+    erro = await _simular(LATENCIA_API, ERRO_API)
+    return erro or {"despesas": 1234.5, "contas": 300.0}
+
+
+@app.get("/api/charts/category")
+async def por_categoria():
+    erro = await _simular(LATENCIA_API, ERRO_API)
+    return erro or [{"name": "Alimentação", "value": 900.0}, {"name": "Transporte", "value": 634.5}]
+
+
+@app.get("/api/bench/contadores")
+async def ver_contadores():
+    return contadores
+
+# ======================================================
+# OPENAI
+# ======================================================
+
+
+def _resposta_chat(conteudo: str, prompt: str) -> dict:
+    return {
+        "id": f"chatcmpl-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o-mini",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": conteudo},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(conteudo) // 4,
+            "total_tokens": (len(prompt) + len(conteudo)) // 4
+        }
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat(request: Request):
+    corpo = await request.json()
+    erro = await _simular(LATENCIA_GPT, ERRO_GPT)
+    if erro:
+        return erro
+    contadores["chat"] += 1
+
+    prompt = corpo["messages"][-1]["content"]
+    itens = re.findall(r'^(\d+)\. "', prompt, re.MULTILINE)
+    if corpo.get("response_format", {}).get("type") == "json_schema":
+        # Extração estruturada (EXTRACTION_MODE=llm)
+        conteudo = json.dumps({"tipo": "Gasto", "valor": None, "categoria": "Outros",
+                               "subcategoria": "Bench", "meio": None, "parcelas": None})
+    elif itens:
+        conteudo = json.dumps({"resultados": [
+            {"i": int(i), "categoria": "Outros", "subcategoria": "Bench"} for i in itens]})
+    else:
+        conteudo = json.dumps({"categoria": "Outros", "subcategoria": "Bench"})
+    return _resposta_chat(conteudo, prompt)
+
+
+@app.get("/v1/models")
+async def modelos():
+    # Usado pelo preaquecimento do app (abre a conexão com a "OpenAI")
+    return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]}
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcrever():
+    erro = await _simular(LATENCIA_STT, ERRO_STT)
+    if erro:
+        return erro
+    contadores["audio"] += 1
+    return {"text": f"mercado {random.randint(10, 300)} no débito"}
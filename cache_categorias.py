@@ -0,0 +1,161 @@
+import asyncio
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config import CATEGORY_CACHE_SIZE, CATEGORY_CACHE_TTL, CATEGORY_CACHE_PATH
+
+# ======================================================
+# CACHE DE CATEGORIAS (LRU + SQLITE OPCIONAL + SINGLE-FLIGHT)
+# ======================================================
+
+_RE_VALOR = re.compile(r"r\$|\d+(?:[.,]\d+)*")
+_RE_NAO_PALAVRA = re.compile(r"[^\w\s]")
+_RE_ESPACOS = re.compile(r"\s+")
+
+
+def remover_acentos(texto: str) -> str:
+    """'Almoço' -> 'Almoco'"""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def normalizar_mensagem(mensagem: str) -> str:
+    """
+    Chave do cache: sem números/valores, sem acentos, minúscula.
+    'Almoço R$ 25,90' e 'almoco 30' viram a mesma chave: 'almoco'
+    """
+    texto = remover_acentos(mensagem.lower())
+    texto = _RE_VALOR.sub(" ", texto)
+    texto = _RE_NAO_PALAVRA.sub(" ", texto)
+    return _RE_ESPACOS.sub(" ", texto).strip()
+
+
+class CacheCategorias:
+    """
+    Cache em dois níveis para (categoria, subcategoria):
+    - memória: LRU limitado a `max_itens`
+    - disco (opcional): SQLite com TTL, sobrevive a restart
+    Consultas idênticas simultâneas compartilham a mesma chamada (single-flight).
+    """
+
+    def __init__(self, max_itens: int, ttl: float, caminho: str = ""):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._memoria: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._em_voo: Dict[str, asyncio.Future] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.coalescidas = 0
+
+        if caminho:
+            self._conn = sqlite3.connect(
+                caminho, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS categorias (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    expira_em REAL NOT NULL
+                )
+            """)
+
+    def _lembrar(self, chave: str, valor: Tuple[str, str]):
+        self._memoria[chave] = valor
+        self._memoria.move_to_end(chave)
+        if len(self._memoria) > self.max_itens:
+            self._memoria.popitem(last=False)
+
+    def obter(self, chave: str) -> Optional[Tuple[str, str]]:
+        valor = self._memoria.get(chave)
+        if valor is not None:
+            self._memoria.move_to_end(chave)
+            self.hits_memoria += 1
+            return valor
+
+        if self._conn is not None:
+            linha = self._conn.execute(
+                "SELECT valor, expira_em FROM categorias WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha and linha[1] > time.time():
+                valor = tuple(json.loads(linha[0]))
+                self._lembrar(chave, valor)
+                self.hits_disco += 1
+                return valor
+
+        return None
+
+    def guardar(self, chave: str, valor: Tuple[str, str]):
+        self._lembrar(chave, valor)
+        if self._conn is not None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO categorias (chave, valor, expira_em) VALUES (?, ?, ?)",
+                (chave, json.dumps(list(valor)), time.time() + self.ttl)
+            )
+
+    async def obter_ou_calcular(
+        self, mensagem: str,
+        calcular: Callable[[str], Awaitable[Tuple[str, str]]],
+        prefixo: str = ""
+    ) -> Tuple[str, str]:
+        """
+        Retorna do cache ou chama `calcular(mensagem)` uma única vez por chave.
+        Exceções de `calcular` não são cacheadas e chegam a todos que esperavam.
+        `prefixo` separa outros tipos de resultado (ex.: extração completa).
+        """
+        chave = normalizar_mensagem(mensagem)
+        if not chave:
+            return await calcular(mensagem)
+        chave = prefixo + chave
+
+        valor = self.obter(chave)
+        if valor is not None:
+            return valor
+
+        em_voo = self._em_voo.get(chave)
+        if em_voo is not None:
+            self.coalescidas += 1
+            return await asyncio.shield(em_voo)
+
+        self.misses += 1
+        futuro = asyncio.get_running_loop().create_future()
+        self._em_voo[chave] = futuro
+        try:
+            valor = tuple(await calcular(mensagem))
+            self.guardar(chave, valor)
+            futuro.set_result(valor)
+            return valor
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                e_seguidores = RuntimeError("consulta de categoria cancelada")
+            else:
+                e_seguidores = e
+            futuro.set_exception(e_seguidores)
+            # Evita "Future exception was never retrieved" sem seguidores
+            futuro.exception()
+            raise
+        finally:
+            del self._em_voo[chave]
+
+    def estatisticas(self) -> dict:
+        # Coalescidas também economizaram uma chamada ao GPT
+        hits = self.hits_memoria + self.hits_disco + self.coalescidas
+        consultas = hits + self.misses
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "coalescidas": self.coalescidas,
+            "itens_memoria": len(self._memoria),
+            "taxa_acerto": round(hits / consultas, 4) if consultas else 0.0
+        }
+
+
+cache = CacheCategorias(
+    CATEGORY_CACHE_SIZE, CATEGORY_CACHE_TTL, CATEGORY_CACHE_PATH)
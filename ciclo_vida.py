@@ -0,0 +1,177 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ai_parser import get_openai_client
+from api_client import _requisitar, saude_api
+from saude_upstream import ABERTO
+import classificador
+import ledger
+import outbox
+from log import log
+from metricas import Medidor
+from config import API_URL, OPENAI_API_KEY, PREWARM_ENABLED, PREWARM_TIMEOUT
+
+# ======================================================
+# CICLO DE VIDA: COLD START, PREAQUECIMENTO E PRONTIDÃO
+# ======================================================
+# A plataforma adormece instâncias ociosas e a primeira mensagem depois
+# disso paga o cold start. Aqui ficam:
+# - os tempos de import, startup, preaquecimento e da primeira requisição;
+# - o preaquecimento (em background no startup): import do openai, treino
+#   do classificador local e conexões (DNS + TLS) com OpenAI e API da planilha;
+# - a prontidão (/ready): o app está de pé e como estão as dependências.
+
+# Rotas de sonda (health check da plataforma, Prometheus): não contam
+# como "primeira requisição" de usuário
+ROTAS_SONDA = frozenset(["/", "/ready", "/stats", "/metrics"])
+
+tempos: Dict[str, float] = {}
+primeira_rota: Optional[str] = None
+preaquecimento: Dict[str, Any] = {"estado": "desligado" if not PREWARM_ENABLED else "pendente"}
+dependencias: Dict[str, Dict[str, Any]] = {}
+_tarefa: Optional[asyncio.Task] = None
+
+
+def registrar_etapa(etapa: str, segundos: float):
+    tempos[etapa] = round(segundos, 4)
+    log.info("⏱️ Cold start: %s em %.3fs", etapa, segundos)
+
+
+def aguardando_primeira_requisicao() -> bool:
+    return primeira_rota is None
+
+
+def registrar_requisicao(rota: str, segundos: float):
+    """Latência da primeira requisição de verdade (a que sente o cold start)"""
+    global primeira_rota
+    if primeira_rota is None and rota not in ROTAS_SONDA:
+        primeira_rota = rota
+        registrar_etapa("primeira_requisicao", segundos)
+
+# ======================================================
+# PREAQUECIMENTO
+# ======================================================
+
+
+async def _aquecer_openai() -> str:
+    client = await asyncio.to_thread(get_openai_client)
+    if client is None:
+        return "sem OPENAI_API_KEY"
+    from openai import APIStatusError
+    try:
+        await client.models.list()
+    except APIStatusError as e:
+        # Respondeu (mesmo com erro): DNS/TLS já estão no pool
+        return f"HTTP {e.status_code}"
+    return "ok"
+
+
+async def _aquecer_api() -> str:
+    response = await _requisitar("GET", API_URL, params={"skip": 0, "limit": 1})
+    if response.status_code >= 500:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return f"HTTP {response.status_code}"
+
+
+async def _aquecer_classificador() -> str:
+    modelo = await asyncio.to_thread(classificador.carregar)
+    return "ok" if modelo is not None else "desligado"
+
+
+async def _etapa(nome: str, aquecer: Callable[[], Awaitable[str]]):
+    inicio = time.perf_counter()
+    try:
+        detalhe = await asyncio.wait_for(aquecer(), timeout=PREWARM_TIMEOUT)
+        dependencias[nome] = {"ok": True, "detalhe": detalhe}
+    except Exception as e:
+        dependencias[nome] = {"ok": False, "detalhe": str(e) or type(e).__name__}
+        log.warning("⚠️ Preaquecimento de %s falhou: %s", nome, dependencias[nome]["detalhe"])
+    dependencias[nome]["segundos"] = round(time.perf_counter() - inicio, 3)
+
+
+async def _preaquecer():
+    inicio = time.perf_counter()
+    preaquecimento["estado"] = "em_andamento"
+    # SQLite local: abre as conexões agora, não na primeira mensagem
+    ledger.pendentes_sincronizacao()
+    outbox.pendentes()
+    await asyncio.gather(
+        _etapa("openai", _aquecer_openai),
+        _etapa("classificador", _aquecer_classificador),
+        _etapa("api_planilha", _aquecer_api),
+    )
+    preaquecimento["estado"] = "concluido"
+    registrar_etapa("preaquecimento", time.perf_counter() - inicio)
+
+
+def iniciar_preaquecimento():
+    """Dispara o preaquecimento em background (startup do app)"""
+    global _tarefa
+    if PREWARM_ENABLED and (_tarefa is None or _tarefa.done()):
+        _tarefa = asyncio.create_task(_preaquecer())
+
+
+async def parar_preaquecimento():
+    global _tarefa
+    if _tarefa is not None:
+        _tarefa.cancel()
+        try:
+            await _tarefa
+        except asyncio.CancelledError:
+            pass
+        _tarefa = None
+
+# ======================================================
+# PRONTIDÃO
+# ======================================================
+
+
+def _verificar_local() -> Dict[str, Any]:
+    try:
+        return {"ok": True, "outbox_pendentes": outbox.pendentes(),
+                "ledger_aguardando_envio": ledger.pendentes_sincronizacao()}
+    except Exception as e:
+        return {"ok": False, "detalhe": str(e)}
+
+
+def prontidao() -> Tuple[bool, Dict[str, Any]]:
+    """
+    Pronto = armazenamento local acessível e preaquecimento terminado.
+    API da planilha e OpenAI fora do ar não tiram o app do ar (a outbox
+    segura as gravações, as regras categorizam): aparecem como degradadas.
+    """
+    local = _verificar_local()
+    api = {
+        "ok": saude_api.estado != ABERTO,
+        "disjuntor": saude_api.estado,
+        "preaquecimento": dependencias.get("api_planilha"),
+    }
+    sonda_openai = dependencias.get("openai")
+    openai = {
+        "ok": bool(OPENAI_API_KEY) and (sonda_openai is None or sonda_openai["ok"]),
+        "configurada": bool(OPENAI_API_KEY),
+        "preaquecimento": sonda_openai,
+    }
+
+    pronto = local["ok"] and preaquecimento["estado"] in ("concluido", "desligado")
+    return pronto, {
+        "pronto": pronto,
+        "degradado": [nome for nome, dep in (("api_planilha", api), ("openai", openai))
+                      if not dep["ok"]],
+        "dependencias": {"armazenamento": local, "api_planilha": api, "openai": openai,
+                         "classificador": classificador.estatisticas()},
+        "inicializacao": estatisticas(),
+    }
+
+
+def estatisticas() -> dict:
+    return {
+        "tempos_s": dict(tempos),
+        "primeira_rota": primeira_rota,
+        "preaquecimento": preaquecimento["estado"],
+    }
+
+
+Medidor("bot_inicializacao_segundos", "Tempos do cold start (import, startup, preaquecimento...)",
+        ["etapa"], funcao=lambda: {(etapa,): segundos for etapa, segundos in tempos.items()})
@@ -0,0 +1,336 @@
+import importlib.util
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from cache_categorias import normalizar_mensagem
+from config import (
+    CLASSIFIER_ENABLED, CLASSIFIER_PATH,
+    CLASSIFIER_THRESHOLD, CLASSIFIER_MIN_EXAMPLES
+)
+
+# ======================================================
+# CLASSIFICADOR LOCAL (SEM GPT)
+# ======================================================
+# Vetor = n-gramas de caracteres (3 a 5) com hashing em DIMENSOES posições,
+# peso log(1 + tf) * idf. Cada CATEGORIA (conjunto fechado, o do prompt)
+# tem um centróide; a previsão é o centróide de maior similaridade de cosseno.
+# A subcategoria (texto livre do GPT, sem limite de valores) não vira
+# centróide: sai de uma votação das palavras da mensagem dentro da categoria.
+
+DIMENSOES = 2 ** 14
+NGRAMAS = (3, 4, 5)
+# Subcategorias distintas guardadas por categoria (as mais novas são ignoradas)
+MAX_SUBCATEGORIAS = 64
+# idf recalculado (reconstrução completa) a cada 10% de exemplos novos
+FATOR_REFRESH_IDF = 1.1
+
+# numpy só é importado no primeiro treino (~85ms a menos no import do app)
+np = None
+NUMPY_DISPONIVEL = importlib.util.find_spec("numpy") is not None
+
+
+def _carregar_numpy() -> bool:
+    """Importa numpy sob demanda; False se não estiver instalado"""
+    global np
+    if np is None and NUMPY_DISPONIVEL:
+        import numpy
+        np = numpy
+    return np is not None
+
+
+def _indices(texto: str) -> List[int]:
+    texto = f" {normalizar_mensagem(texto)} "
+    return [
+        zlib.crc32(texto[i:i + n].encode("utf-8")) % DIMENSOES
+        for n in NGRAMAS
+        for i in range(len(texto) - n + 1)
+    ]
+
+
+def _palavras(texto: str) -> List[str]:
+    return [p for p in normalizar_mensagem(texto).split() if len(p) >= 3]
+
+
+class ClassificadorLocal:
+    """
+    Centróides incrementais por categoria: aprender() atualiza só a linha
+    do rótulo, prever() é um produto matriz-vetor pequeno (categorias × DIMENSOES)
+    """
+
+    def __init__(self, limiar: float, min_exemplos: int):
+        self.limiar = limiar
+        self.min_exemplos = min_exemplos
+        self.categorias: List[str] = []
+        self._indice_categoria: Dict[str, int] = {}
+        # Capacidade cresce em dobro: sem cópia a cada categoria nova
+        self._somas = np.zeros((8, DIMENSOES), dtype=np.float32)
+        self._centroides = np.zeros((8, DIMENSOES), dtype=np.float32)
+        self._contagens = np.zeros(8, dtype=np.int64)
+        self._df = np.zeros(DIMENSOES, dtype=np.float32)
+        self._n_docs = 0
+        self._idf = None
+        self._docs_idf = 0
+
+        # categoria -> subcategoria normalizada -> nome; e votos por palavra
+        self._subcategorias: Dict[str, Dict[str, str]] = {}
+        self._frequencia_sub: Dict[str, Counter] = {}
+        self._votos: Dict[str, Dict[str, Counter]] = {}
+
+        self.consultas = 0
+        self.confiantes = 0
+
+    def _tf(self, texto: str):
+        indices = _indices(texto)
+        if not indices:
+            return None
+        return np.log1p(np.bincount(indices, minlength=DIMENSOES).astype(np.float32))
+
+    def _linha(self, categoria: str) -> int:
+        linha = self._indice_categoria.get(categoria)
+        if linha is None:
+            linha = len(self.categorias)
+            if linha == len(self._contagens):
+                novo = 2 * linha
+                for nome in ("_somas", "_centroides"):
+                    matriz = np.zeros((novo, DIMENSOES), dtype=np.float32)
+                    matriz[:linha] = getattr(self, nome)
+                    setattr(self, nome, matriz)
+                contagens = np.zeros(novo, dtype=np.int64)
+                contagens[:linha] = self._contagens
+                self._contagens = contagens
+            self.categorias.append(categoria)
+            self._indice_categoria[categoria] = linha
+            self._subcategorias[categoria] = {}
+            self._frequencia_sub[categoria] = Counter()
+            self._votos[categoria] = {}
+        return linha
+
+    def _aprender_subcategoria(self, texto: str, categoria: str, subcategoria: str):
+        conhecidas = self._subcategorias[categoria]
+        chave = " ".join(subcategoria.lower().split())
+        if chave not in conhecidas:
+            if len(conhecidas) >= MAX_SUBCATEGORIAS:
+                return
+            conhecidas[chave] = subcategoria.strip()
+        self._frequencia_sub[categoria][chave] += 1
+        votos = self._votos[categoria]
+        for palavra in set(_palavras(texto)):
+            votos.setdefault(palavra, Counter())[chave] += 1
+
+    def aprender(self, texto: str, categoria: str, subcategoria: str):
+        tf = self._tf(texto)
+        if tf is None:
+            return
+
+        linha = self._linha(categoria)
+        self._somas[linha] += tf
+        self._contagens[linha] += 1
+        self._df += tf > 0
+        self._n_docs += 1
+        self._aprender_subcategoria(texto, categoria, subcategoria)
+
+        if self._idf is None or self._n_docs >= self._docs_idf * FATOR_REFRESH_IDF:
+            self._preparar()
+        else:
+            self._atualizar_centroide(linha)
+
+    def _atualizar_centroide(self, linha: int):
+        """Só a linha que mudou, com o idf atual (recalculado de tempos em tempos)"""
+        if self._contagens[linha] < self.min_exemplos:
+            # Rótulos com poucos exemplos não são previstos
+            self._centroides[linha] = 0
+            return
+        centroide = self._somas[linha] * self._idf
+        norma = np.linalg.norm(centroide)
+        self._centroides[linha] = centroide / norma if norma else 0
+
+    def _preparar(self):
+        self._idf = (np.log((1 + self._n_docs) / (1 + self._df)) + 1).astype(np.float32)
+        self._docs_idf = self._n_docs
+        for linha in range(len(self.categorias)):
+            self._atualizar_centroide(linha)
+
+    def _subcategoria(self, texto: str, categoria: str) -> str:
+        """Subcategoria mais votada pelas palavras da mensagem (ou a mais comum)"""
+        votos = self._votos[categoria]
+        placar = Counter()
+        for palavra in set(_palavras(texto)):
+            placar.update(votos.get(palavra, ()))
+        escolhida = (placar or self._frequencia_sub[categoria]).most_common(1)
+        if not escolhida:
+            return categoria
+        return self._subcategorias[categoria][escolhida[0][0]]
+
+    def prever(self, texto: str) -> Tuple[Optional[Tuple[str, str]], float]:
+        """Retorna (rótulo, confiança). Rótulo None se não houver modelo."""
+        if not self.categorias:
+            return None, 0.0
+        tf = self._tf(texto)
+        if tf is None:
+            return None, 0.0
+
+        vetor = tf * self._idf
+        norma = np.linalg.norm(vetor)
+        if norma == 0:
+            return None, 0.0
+
+        scores = self._centroides[:len(self.categorias)] @ (vetor / norma)
+        melhor = int(np.argmax(scores))
+        categoria = self.categorias[melhor]
+        return (categoria, self._subcategoria(texto, categoria)), float(scores[melhor])
+
+    def classificar(self, texto: str) -> Optional[Tuple[str, str]]:
+        """Rótulo se a confiança passar do limiar, senão None (vai pro GPT)"""
+        self.consultas += 1
+        rotulo, confianca = self.prever(texto)
+        if rotulo is not None and confianca >= self.limiar:
+            self.confiantes += 1
+            return rotulo
+        return None
+
+    def estatisticas(self) -> dict:
+        return {
+            "exemplos": self._n_docs,
+            "rotulos": len(self.categorias),
+            "subcategorias": sum(len(s) for s in self._subcategorias.values()),
+            "consultas": self.consultas,
+            "confiantes": self.confiantes,
+            "taxa_uso": round(self.confiantes / self.consultas, 4) if self.consultas else 0.0
+        }
+
+
+# ======================================================
+# EXEMPLOS ROTULADOS (SQLITE)
+# ======================================================
+
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(
+            CLASSIFIER_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS exemplos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                descricao TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                subcategoria TEXT NOT NULL,
+                criado_em REAL NOT NULL
+            )
+        """)
+    return _conn
+
+
+def carregar_exemplos() -> List[Tuple[str, str, str]]:
+    return _get_conn().execute(
+        "SELECT descricao, categoria, subcategoria FROM exemplos ORDER BY id"
+    ).fetchall()
+
+
+def treinar(exemplos: List[Tuple[str, str, str]]) -> "ClassificadorLocal":
+    _carregar_numpy()
+    modelo = ClassificadorLocal(CLASSIFIER_THRESHOLD, CLASSIFIER_MIN_EXAMPLES)
+    for descricao, categoria, subcategoria in exemplos:
+        modelo.aprender(descricao, categoria, subcategoria)
+    return modelo
+
+
+# Treinado no primeiro uso (ou no preaquecimento do startup), não no import:
+# com muitos exemplos o treino levaria segundos do cold start
+modelo: Optional[ClassificadorLocal] = None
+_lock_treino = threading.Lock()
+
+
+def carregar() -> Optional[ClassificadorLocal]:
+    """Treina o modelo com os exemplos salvos (uma vez só)"""
+    global modelo
+    if modelo is None and CLASSIFIER_ENABLED and _carregar_numpy():
+        with _lock_treino:
+            if modelo is None:
+                modelo = treinar(carregar_exemplos())
+    return modelo
+
+
+def classificar(mensagem: str) -> Optional[Tuple[str, str]]:
+    """(categoria, subcategoria) com confiança suficiente, ou None"""
+    if carregar() is None:
+        return None
+    return modelo.classificar(mensagem)
+
+
+def aprender(descricao: str, categoria: str, subcategoria: str):
+    """Registra um exemplo rotulado pelo GPT e atualiza o modelo na hora"""
+    if carregar() is None:
+        return
+    _get_conn().execute(
+        "INSERT INTO exemplos (descricao, categoria, subcategoria, criado_em) VALUES (?, ?, ?, ?)",
+        (descricao, categoria, subcategoria, time.time())
+    )
+    modelo.aprender(descricao, categoria, subcategoria)
+
+
+def estatisticas() -> dict:
+    if not CLASSIFIER_ENABLED or not NUMPY_DISPONIVEL:
+        return {"ativo": False}
+    if modelo is None:
+        return {"ativo": True, "carregado": False}
+    return {"ativo": True, "carregado": True, **modelo.estatisticas()}
+
+
+def avaliar(exemplos: List[Tuple[str, str, str]], fracao_teste: float = 0.2) -> dict:
+    """
+    Treina com os exemplos mais antigos e mede contra os rótulos do GPT
+    nos mais recentes (divisão cronológica).
+    """
+    corte = int(len(exemplos) * (1 - fracao_teste))
+    treino, teste = exemplos[:corte], exemplos[corte:]
+    avaliado = treinar(treino)
+
+    acertos_cat = acertos_total = confiantes = acertos_confiantes = 0
+    for descricao, categoria, subcategoria in teste:
+        rotulo, confianca = avaliado.prever(descricao)
+        if rotulo is None:
+            continue
+        acertou = rotulo == (categoria, subcategoria)
+        acertos_cat += rotulo[0] == categoria
+        acertos_total += acertou
+        if confianca >= avaliado.limiar:
+            confiantes += 1
+            acertos_confiantes += acertou
+
+    n = len(teste) or 1
+    return {
+        "treino": len(treino),
+        "teste": len(teste),
+        "acuracia_categoria": round(acertos_cat / n, 4),
+        "acuracia_categoria_sub": round(acertos_total / n, 4),
+        "cobertura_no_limiar": round(confiantes / n, 4),
+        "acuracia_no_limiar": round(acertos_confiantes / confiantes, 4) if confiantes else 0.0
+    }
+
+
+if __name__ == "__main__":
+    if not _carregar_numpy():
+        print("❌ numpy não instalado")
+        sys.exit(1)
+
+    comando = sys.argv[1] if len(sys.argv) > 1 else "avaliar"
+    exemplos = carregar_exemplos()
+
+    if comando == "treinar":
+        inicio = time.perf_counter()
+        treinado = treinar(exemplos)
+        print(f"✅ Treinado em {time.perf_counter() - inicio:.3f}s: {treinado.estatisticas()}")
+    elif comando == "avaliar":
+        print(f"📊 Avaliação (limiar {CLASSIFIER_THRESHOLD}): {avaliar(exemplos)}")
+    else:
+        print("Uso: python classificador.py [treinar|avaliar]")
+        sys.exit(1)
@@ -7,4 +7,149 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 # URL da API da Planilha
-API_URL = "https://financial-details-1.preview.emergentagent.com/api/transactions"
+API_BASE_URL = os.getenv(
+    "API_BASE_URL", "https://financial-details-1.preview.emergentagent.com/api")
+API_URL = f"{API_BASE_URL}/transactions"
+# Envio em lote (uma requisição para várias transações). Desligado por padrão:
+# a API da planilha não tem rota de lote. Ligado e a rota recusar o pedido
+# (4xx que não seja 408/429, ou 501), volta sozinho para envios individuais.
+API_BULK_ENABLED = os.getenv("API_BULK_ENABLED", "0") == "1"
+API_BULK_URL = os.getenv("API_BULK_URL", f"{API_URL}/bulk")
+
+# Pool de conexões HTTP compartilhado com a API da planilha
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+# Saúde da API da planilha: disjuntor, timeout adaptativo e leituras duplicadas
+API_BREAKER_FAILURES = int(os.getenv("API_BREAKER_FAILURES", "5"))
+API_BREAKER_OPEN_SECONDS = float(os.getenv("API_BREAKER_OPEN_SECONDS", "15"))
+API_BREAKER_MAX_OPEN_SECONDS = float(os.getenv("API_BREAKER_MAX_OPEN_SECONDS", "300"))
+API_TIMEOUT_MIN = float(os.getenv("API_TIMEOUT_MIN", "2"))
+API_HEDGE_ENABLED = os.getenv("API_HEDGE_ENABLED", "1") == "1"
+API_HEDGE_MIN_MS = float(os.getenv("API_HEDGE_MIN_MS", "300"))
+
+# Outbox local (fila durável de envios para a planilha)
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.db")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+# Falhas de envio (com a API respondendo) até a parcela sair da fila e ir
+# para a tabela de recusadas. Recusa definitiva da API (4xx) vai na hora.
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "50"))
+
+# Envio de parcelas em paralelo (limite de POSTs simultâneos por compra)
+SAVE_CONCURRENCY = int(os.getenv("SAVE_CONCURRENCY", "4"))
+# Envios individuais simultâneos à API somando todas as origens (outbox,
+# importação, restauração). Fica abaixo de HTTP_MAX_CONNECTIONS: espera
+# por conexão do pool não vira timeout contado contra a API.
+API_WRITE_CONCURRENCY = int(os.getenv("API_WRITE_CONCURRENCY", "16"))
+
+# Cache de categorização (GPT): memória (LRU) + disco opcional (TTL)
+CATEGORY_CACHE_SIZE = int(os.getenv("CATEGORY_CACHE_SIZE", "2048"))
+CATEGORY_CACHE_TTL = float(os.getenv("CATEGORY_CACHE_TTL", str(30 * 24 * 3600)))
+CATEGORY_CACHE_PATH = os.getenv("CATEGORY_CACHE_PATH", "")
+
+# Regras de categorização por palavra-chave (arquivo JSON, recarregado a quente)
+RULES_PATH = os.getenv(
+    "RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "regras_categorias.json"))
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "5"))
+
+# Classificador local (TF-IDF de n-gramas + centróides), treinado com rótulos do GPT
+CLASSIFIER_ENABLED = os.getenv("CLASSIFIER_ENABLED", "1") == "1"
+CLASSIFIER_PATH = os.getenv("CLASSIFIER_PATH", "classificador.db")
+CLASSIFIER_THRESHOLD = float(os.getenv("CLASSIFIER_THRESHOLD", "0.6"))
+CLASSIFIER_MIN_EXAMPLES = int(os.getenv("CLASSIFIER_MIN_EXAMPLES", "3"))
+
+# Orçamento de latência da categorização (ms). Estourou: responde com fallback
+# e o resultado do GPT refina a transação em background. 0 = sem prazo.
+PARSE_BUDGET_MS = float(os.getenv("PARSE_BUDGET_MS", "800"))
+# Até quando (s) esperar o refinamento. Transações salvas com a categoria
+# provisória ficam retidas na outbox por esse tempo (a planilha não tem
+# rota de atualização: o que já foi enviado não é mais corrigido)
+REFINE_TIMEOUT = float(os.getenv("REFINE_TIMEOUT", "20"))
+
+# Micro-lotes de categorização: junta pedidos simultâneos em uma chamada ao GPT
+GPT_BATCH_ENABLED = os.getenv("GPT_BATCH_ENABLED", "1") == "1"
+GPT_BATCH_MAX_SIZE = int(os.getenv("GPT_BATCH_MAX_SIZE", "16"))
+GPT_BATCH_MAX_WAIT_MS = float(os.getenv("GPT_BATCH_MAX_WAIT_MS", "15"))
+
+# Extração: "local" = léxico + GPT só para a categoria;
+# "llm" = uma chamada com saída estruturada (tipo, valor, categoria,
+# subcategoria, meio, parcelas) quando regras/léxico não resolvem sozinhos
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "local").lower()
+
+# Estado das conversas pendentes: memory | sqlite | redis
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_TTL = float(os.getenv("STATE_TTL", "3600"))
+STATE_MAX_USERS = int(os.getenv("STATE_MAX_USERS", "10000"))
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "estado.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Livro-razão local (SQLite) para /resumo e /extrato sem depender da API
+LEDGER_PATH = os.getenv("LEDGER_PATH", "ledger.db")
+LEDGER_RECONCILE_INTERVAL = float(os.getenv("LEDGER_RECONCILE_INTERVAL", "900"))
+# Por quanto tempo (s) um mês conferido com a planilha responde /resumo só
+# com o ledger. Vencido, /resumo volta à API e confere de novo.
+LEDGER_COVERAGE_TTL = float(os.getenv("LEDGER_COVERAGE_TTL", "3600"))
+
+# Transcrição de áudio (Whisper): limite de upload e de chamadas simultâneas
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(25 * 1024 * 1024)))
+STT_MAX_CONCURRENCY = int(os.getenv("STT_MAX_CONCURRENCY", "4"))
+
+# Cache de transcrições por hash do conteúdo (áudio reenviado não vai ao Whisper)
+TRANSCRIPT_CACHE_TTL = float(os.getenv("TRANSCRIPT_CACHE_TTL", str(30 * 24 * 3600)))
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "5000"))
+
+# Logs (fila + thread própria, não bloqueia o request): DEBUG, INFO, WARNING, ERROR
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Agendador de mensagens: ordem garantida por usuário, paralelo entre usuários
+SCHEDULER_MAX_PER_USER = int(os.getenv("SCHEDULER_MAX_PER_USER", "8"))
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "64"))
+SCHEDULER_MAX_PENDING = int(os.getenv("SCHEDULER_MAX_PENDING", "1000"))
+
+# Endpoint /messages (replay de backlog do gateway): máximo de mensagens por lote
+BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", "1000"))
+
+# Mensagens já respondidas, por id do WhatsApp (reenvio do gateway não reprocessa)
+MESSAGE_DEDUPE_TTL = float(os.getenv("MESSAGE_DEDUPE_TTL", str(24 * 3600)))
+MESSAGE_DEDUPE_SIZE = int(os.getenv("MESSAGE_DEDUPE_SIZE", "20000"))
+
+# Limites de uso (token bucket por usuário + global). Estourou: degrada ou
+# responde na hora. RATE_*_BURST = capacidade do balde (rajada permitida).
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+RATE_MSG_PER_MIN_USER = float(os.getenv("RATE_MSG_PER_MIN_USER", "20"))
+RATE_MSG_BURST_USER = float(os.getenv("RATE_MSG_BURST_USER", "10"))
+RATE_MSG_PER_SEC_GLOBAL = float(os.getenv("RATE_MSG_PER_SEC_GLOBAL", "50"))
+RATE_MSG_BURST_GLOBAL = float(os.getenv("RATE_MSG_BURST_GLOBAL", "200"))
+RATE_LLM_PER_HOUR_USER = float(os.getenv("RATE_LLM_PER_HOUR_USER", "60"))
+RATE_LLM_BURST_USER = float(os.getenv("RATE_LLM_BURST_USER", "20"))
+RATE_LLM_PER_MIN_GLOBAL = float(os.getenv("RATE_LLM_PER_MIN_GLOBAL", "300"))
+RATE_LLM_BURST_GLOBAL = float(os.getenv("RATE_LLM_BURST_GLOBAL", "100"))
+RATE_STT_SECONDS_PER_HOUR_USER = float(os.getenv("RATE_STT_SECONDS_PER_HOUR_USER", "900"))
+RATE_STT_BURST_USER = float(os.getenv("RATE_STT_BURST_USER", "300"))
+RATE_STT_SECONDS_PER_MIN_GLOBAL = float(os.getenv("RATE_STT_SECONDS_PER_MIN_GLOBAL", "600"))
+RATE_STT_BURST_GLOBAL = float(os.getenv("RATE_STT_BURST_GLOBAL", "1200"))
+# Estimativa de duração do áudio pelo tamanho (voz do WhatsApp ~16 kbit/s)
+AUDIO_BYTES_PER_SECOND = float(os.getenv("AUDIO_BYTES_PER_SECOND", "2000"))
+
+# Ferramentas de administração (admin.py): exportação/restauração da planilha
+API_CLEAR_URL = os.getenv("API_CLEAR_URL", f"{API_BASE_URL}/admin/clear-all")
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "500"))
+ADMIN_CONCURRENCY = int(os.getenv("ADMIN_CONCURRENCY", "4"))
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+
+# Importação de extratos (importador.py): CSV/OFX em blocos
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "200"))
+IMPORT_UPLOAD_BATCH = int(os.getenv("IMPORT_UPLOAD_BATCH", "100"))
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+# Segundos até a outbox reenviar o que a importação não confirmou
+IMPORT_OUTBOX_DELAY = float(os.getenv("IMPORT_OUTBOX_DELAY", "60"))
+
+# Cold start: preaquecimento no startup (imports pesados, modelo local e
+# conexões com OpenAI/API) e prazo máximo de cada etapa
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_TIMEOUT = float(os.getenv("PREWARM_TIMEOUT", "10"))
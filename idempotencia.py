@@ -0,0 +1,57 @@
+from typing import Awaitable, Callable, Optional
+
+from state import criar_backend
+from log import log
+from config import MESSAGE_DEDUPE_TTL, MESSAGE_DEDUPE_SIZE
+
+# ======================================================
+# MENSAGENS IDEMPOTENTES (ID DA MENSAGEM DO WHATSAPP)
+# ======================================================
+# O gateway reenvia a mesma mensagem quando o request demora. Com o id,
+# o reenvio recebe a resposta já dada, sem novo parse/GPT/gravação.
+# Roda na vez do usuário (agendador): um reenvio que chega enquanto a
+# original ainda está em andamento espera a vez e encontra a resposta pronta.
+
+
+class RespostasProcessadas:
+    def __init__(self, ttl: float, max_itens: int):
+        self._respostas = criar_backend("respostas", ttl=ttl, max_itens=max_itens)
+        self.repetidas = 0
+
+    async def obter(self, user_id: str, message_id: Optional[str]) -> Optional[dict]:
+        """Resposta já dada para esta mensagem, ou None"""
+        if not message_id:
+            return None
+        resposta = await self._respostas.obter(f"{user_id}:{message_id}")
+        if resposta is not None:
+            self.repetidas += 1
+            log.info("♻️ Mensagem %s repetida, devolvendo a resposta anterior", message_id)
+        return resposta
+
+    async def executar_uma_vez(
+        self, user_id: str, message_id: Optional[str],
+        processar: Callable[..., Awaitable], *args,
+        guardar: Callable[[dict], bool] = lambda resposta: True
+    ):
+        """
+        Executa `processar(*args)` uma única vez por (user_id, message_id).
+        Só respostas dict aceitas por `guardar` ficam registradas; as demais
+        (erro interno, falha na transcrição) deixam o reenvio tentar de novo.
+        """
+        resposta = await self.obter(user_id, message_id)
+        if resposta is not None:
+            return resposta
+
+        resposta = await processar(*args)
+        if message_id and isinstance(resposta, dict) and guardar(resposta):
+            await self._respostas.definir(f"{user_id}:{message_id}", resposta)
+        return resposta
+
+    def estatisticas(self) -> dict:
+        return {
+            "registradas": self._respostas.tamanho(),
+            "repetidas": self.repetidas,
+        }
+
+
+respostas = RespostasProcessadas(MESSAGE_DEDUPE_TTL, MESSAGE_DEDUPE_SIZE)
@@ -0,0 +1,398 @@
+"""
+Importação de extratos (CSV ou OFX) direto para a planilha.
+
+    python importador.py extrato.csv --user 5511999999999@c.us [--cartao] [--meio Crédito]
+    python importador.py fatura.ofx --user 5511999999999@c.us
+
+Pipeline de geradores, um bloco de IMPORT_CHUNK_SIZE linhas por vez
+(memória constante, qualquer tamanho de arquivo):
+
+    ler lançamentos -> montar transações -> descartar as já salvas
+        -> categorizar o bloco (regras/classificador primeiro, o resto junto
+           no micro-lote do GPT) -> livro-razão + outbox -> envio em lote
+
+O envio usa a rota de lote da API com até IMPORT_CONCURRENCY lotes em voo.
+Cada linha também entra na outbox (adiada): o que a importação não
+conseguir confirmar o flusher reenvia depois. As chaves de idempotência
+vêm do próprio lançamento, então importar o mesmo extrato de novo não duplica.
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import re
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from ai_parser import categorizar
+from api_client import montar_transacoes, enviar_lote, close_http_client
+from outbox import enfileirar, confirmar_envio
+from lexico import analisar, normalizar, valor_br
+import classificador
+import ledger
+from log import log
+from config import (
+    IMPORT_CHUNK_SIZE, IMPORT_UPLOAD_BATCH, IMPORT_CONCURRENCY, IMPORT_OUTBOX_DELAY
+)
+
+# Cabeçalhos conhecidos (normalizados) de extratos de bancos e cartões
+COLUNAS = {
+    "data": ("data", "date", "dt", "data lancamento", "data da compra", "data movimento"),
+    "descricao": ("descricao", "title", "titulo", "description", "historico",
+                  "lancamento", "estabelecimento", "memo"),
+    "valor": ("valor", "amount", "value", "valor (r$)", "valor r$"),
+}
+
+FORMATOS_DATA = ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%y", "%d-%m-%Y", "%d.%m.%Y")
+
+_OFX_TRANSACAO = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.DOTALL | re.IGNORECASE)
+_OFX_CAMPO = re.compile(r"<(DTPOSTED|TRNAMT|MEMO|NAME|FITID)>([^<\r\n]*)", re.IGNORECASE)
+
+
+class ExtratoInvalido(ValueError):
+    """Arquivo que não é um CSV/OFX de extrato reconhecível"""
+
+# ======================================================
+# LEITURA (GERADORES)
+# ======================================================
+
+
+def _abrir_texto(arquivo: BinaryIO) -> TextIO:
+    """
+    Extratos brasileiros vêm em UTF-8 ou Latin-1: uma passada em pedaços
+    valida o UTF-8 (um acento perdido no fim do arquivo também conta)
+    """
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    codificacao = "utf-8-sig"
+    try:
+        for pedaco in iter(lambda: arquivo.read(64 * 1024), b""):
+            decodificador.decode(pedaco)
+        decodificador.decode(b"", final=True)
+    except UnicodeDecodeError:
+        codificacao = "latin-1"
+    arquivo.seek(0)
+    return io.TextIOWrapper(arquivo, encoding=codificacao, newline="")
+
+
+def _detectar_formato(texto: TextIO, nome: str) -> str:
+    if nome.lower().endswith(".ofx"):
+        return "ofx"
+    inicio = texto.read(4096)
+    texto.seek(0)
+    return "ofx" if "OFXHEADER" in inicio or "<OFX>" in inicio.upper() else "csv"
+
+
+def _valor(texto: str) -> float:
+    """'-1.234,56' | 'R$ 45,90' | '(12.50)' | '1,234.56' -> float com sinal"""
+    numero = texto.strip().replace("R$", "").replace("r$", "").replace(" ", "")
+    negativo = numero.startswith("-") or (numero.startswith("(") and numero.endswith(")"))
+    numero = numero.strip("-+()")
+    if "," in numero and "." in numero and numero.rfind(".") > numero.rfind(","):
+        numero = numero.replace(",", "")  # formato americano
+    valor = valor_br(numero)
+    return -valor if negativo else valor
+
+
+def _data(texto: str) -> datetime:
+    texto = texto.strip()
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto[:10], formato)
+        except ValueError:
+            continue
+    raise ValueError(f"data inválida: {texto!r}")
+
+
+def _mapear_colunas(cabecalho: List[str]) -> Dict[str, int]:
+    normalizados = [normalizar(c) for c in cabecalho]
+    mapa = {}
+    for campo, nomes in COLUNAS.items():
+        for indice, coluna in enumerate(normalizados):
+            if coluna in nomes:
+                mapa[campo] = indice
+                break
+    faltando = {"data", "descricao", "valor"} - set(mapa)
+    if faltando:
+        raise ExtratoInvalido(
+            f"CSV sem coluna de {', '.join(sorted(faltando))} (cabeçalho: {cabecalho})")
+    return mapa
+
+
+def ler_csv(texto: TextIO, inverter: bool = False) -> Iterator[Dict[str, Any]]:
+    amostra = texto.read(8192)
+    texto.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+    except csv.Error:
+        dialeto = csv.excel
+    linhas = csv.reader(texto, dialeto)
+
+    cabecalho = next(linhas, None)
+    if not cabecalho:
+        raise ExtratoInvalido("CSV vazio")
+    mapa = _mapear_colunas(cabecalho)
+
+    for numero, linha in enumerate(linhas, start=2):
+        if not any(c.strip() for c in linha):
+            continue
+        try:
+            valor = _valor(linha[mapa["valor"]])
+            yield {
+                "data": _data(linha[mapa["data"]]),
+                "descricao": " ".join(linha[mapa["descricao"]].split()),
+                "valor": -valor if inverter else valor,
+            }
+        except (ValueError, IndexError) as e:
+            yield {"erro": f"linha {numero}: {e}"}
+
+
+def ler_ofx(texto: TextIO) -> Iterator[Dict[str, Any]]:
+    """Lê os <STMTTRN> em pedaços: funciona com OFX em várias linhas ou em uma só"""
+    resto = ""
+    while True:
+        pedaco = texto.read(64 * 1024)
+        resto += pedaco
+        fim = 0
+        for m in _OFX_TRANSACAO.finditer(resto):
+            fim = m.end()
+            campos = {k.upper(): v.strip() for k, v in _OFX_CAMPO.findall(m.group(1))}
+            try:
+                yield {
+                    "data": datetime.strptime(campos.get("DTPOSTED", "")[:8], "%Y%m%d"),
+                    "descricao": " ".join(
+                        (campos.get("MEMO") or campos.get("NAME") or "").split()),
+                    "valor": _valor(campos.get("TRNAMT", "")),
+                }
+            except ValueError as e:
+                yield {"erro": f"transação OFX {campos.get('FITID', '?')}: {e}"}
+        resto = resto[fim:]
+        if not pedaco:
+            return
+
+
+def ler_lancamentos(arquivo: BinaryIO, nome: str = "", formato: Optional[str] = None,
+                    cartao: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Lançamentos do extrato: {data, descricao, valor} ou {erro}.
+    Valor negativo = saída de dinheiro (convenção do OFX). Fatura de cartão
+    em CSV lista as compras como positivas: com `cartao`, o sinal é invertido.
+    """
+    texto = _abrir_texto(arquivo)
+    formato = (formato or _detectar_formato(texto, nome)).lower()
+    if formato == "ofx":
+        return ler_ofx(texto)
+    if formato == "csv":
+        return ler_csv(texto, inverter=cartao)
+    raise ExtratoInvalido(f"Formato desconhecido: {formato}")
+
+# ======================================================
+# TRANSFORMAÇÃO
+# ======================================================
+
+
+def montar(lancamentos: Iterable[Dict[str, Any]], user_id: str, totais: Counter,
+           cartao: bool = False, meio: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Lançamento -> transação no formato do parse_message.
+    Negativo = gasto, positivo = receita. Na fatura de cartão (`cartao`)
+    as entradas (pagamento da fatura, estornos) ficam de fora.
+    """
+    # Lançamentos idênticos no mesmo dia (dois cafés de 8,00) são distintos:
+    # cada ocorrência ganha um segundo a mais na data, e a chave de
+    # idempotência (usuário|descrição|valor|data) continua estável entre importações
+    ocorrencias: Counter = Counter()
+
+    for lancamento in lancamentos:
+        totais["lidas"] += 1
+        if "erro" in lancamento:
+            totais["invalidas"] += 1
+            log.warning("⚠️ Importação: %s", lancamento["erro"])
+            continue
+
+        valor = lancamento["valor"]
+        if valor == 0 or (cartao and valor > 0) or not lancamento["descricao"]:
+            totais["ignoradas"] += 1
+            continue
+
+        descricao = lancamento["descricao"]
+        chave = (lancamento["data"], descricao, valor)
+        quando = lancamento["data"] + timedelta(seconds=ocorrencias[chave])
+        ocorrencias[chave] += 1
+
+        yield {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "tipo": "GASTO" if valor < 0 else "RECEITA",
+            "valor": abs(valor),
+            "meio": meio or ("Crédito" if cartao else _meio(descricao)),
+            "descricao": descricao,
+            "parcelado": "Não",
+            "total_parcelas": 1,
+            "data_compra": quando,
+            "origem": "Importação",
+        }
+
+
+def _meio(descricao: str) -> str:
+    meio = analisar(descricao).meio
+    return "Débito" if meio == "Pendente" else meio
+
+
+def _em_blocos(itens: Iterable, tamanho: int) -> Iterator[List]:
+    bloco = []
+    for item in itens:
+        bloco.append(item)
+        if len(bloco) >= tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+async def _categorizar_bloco(transacoes: List[Dict[str, Any]], totais: Counter,
+                             permitir_gpt: Optional[Callable[[], bool]]):
+    """
+    Uma categorização por descrição distinta, todas ao mesmo tempo: regras e
+    classificador resolvem na hora, o resto sai junto no micro-lote do GPT
+    """
+    descricoes = list({t["descricao"] for t in transacoes})
+    resultados = await asyncio.gather(*(categorizar(d, permitir_gpt) for d in descricoes))
+    rotulos = dict(zip(descricoes, resultados))
+
+    for t in transacoes:
+        categoria, subcategoria, fonte = rotulos[t["descricao"]]
+        t["categoria"] = categoria
+        t["subcategoria"] = subcategoria if subcategoria != categoria else t["descricao"].capitalize()
+        t["fonte_categoria"] = fonte
+        totais[f"categoria_{fonte}"] += 1
+
+    # Rótulos do GPT viram exemplos do classificador (próximos blocos saem locais)
+    for descricao, (categoria, subcategoria, fonte) in rotulos.items():
+        if fonte == "gpt":
+            classificador.aprender(descricao, categoria, subcategoria)
+
+# ======================================================
+# PIPELINE
+# ======================================================
+
+
+async def _enviar(parcelas: List[tuple], totais: Counter):
+    resultados = await enviar_lote(parcelas)
+    enviadas = [chave for (chave, _), ok in zip(parcelas, resultados) if ok]
+    if enviadas:
+        confirmar_envio(enviadas)
+    totais["enviadas"] += len(enviadas)
+    totais["na_outbox"] += len(parcelas) - len(enviadas)
+
+
+async def importar(arquivo: BinaryIO, user_id: str, nome: str = "",
+                   formato: Optional[str] = None, cartao: bool = False,
+                   meio: Optional[str] = None,
+                   permitir_gpt: Optional[Callable[[], bool]] = None,
+                   progresso: Optional[Callable[[Dict[str, int]], None]] = None,
+                   tamanho_bloco: int = IMPORT_CHUNK_SIZE,
+                   simultaneas: int = IMPORT_CONCURRENCY) -> Dict[str, Any]:
+    """Importa um extrato para o usuário. Retorna a contagem de cada etapa."""
+    inicio = time.perf_counter()
+    totais: Counter = Counter()
+    em_voo = set()
+
+    async def aguardar(ate: int):
+        while len(em_voo) > ate:
+            feitas, _ = await asyncio.wait(em_voo, return_when=asyncio.FIRST_COMPLETED)
+            em_voo.difference_update(feitas)
+            for tarefa in feitas:
+                tarefa.result()
+
+    lancamentos = ler_lancamentos(arquivo, nome, formato, cartao)
+    transacoes = montar(lancamentos, user_id, totais, cartao, meio)
+    try:
+        for bloco in _em_blocos(transacoes, tamanho_bloco):
+            chaves = {t["id"]: montar_transacoes(t)[0][0] for t in bloco}
+            existentes = ledger.chaves_existentes(list(chaves.values()))
+            novas = [t for t in bloco if chaves[t["id"]] not in existentes]
+            totais["repetidas"] += len(bloco) - len(novas)
+            if not novas:
+                continue
+
+            await _categorizar_bloco(novas, totais, permitir_gpt)
+
+            # Primeiro em disco (livro-razão + outbox adiada), depois a rede
+            parcelas = []
+            for t in novas:
+                ledger.registrar(t)
+                enfileirar(t, adiar=IMPORT_OUTBOX_DELAY)
+                parcelas.extend(montar_transacoes(t))
+            totais["importadas"] += len(novas)
+
+            for lote in _em_blocos(parcelas, IMPORT_UPLOAD_BATCH):
+                await aguardar(simultaneas - 1)
+                em_voo.add(asyncio.ensure_future(_enviar(lote, totais)))
+
+            if progresso:
+                progresso(dict(totais))
+        await aguardar(0)
+    finally:
+        for tarefa in em_voo:
+            tarefa.cancel()
+
+    resumo = dict(totais)
+    resumo["segundos"] = round(time.perf_counter() - inicio, 2)
+    log.info("📑 Importação de %s: %d lida(s), %d importada(s), %d repetida(s) em %.1fs",
+             user_id, totais["lidas"], totais["importadas"], totais["repetidas"],
+             resumo["segundos"])
+    return resumo
+
+# ======================================================
+# CLI
+# ======================================================
+
+
+def _mostrar(totais: Dict[str, int]):
+    print(f"\r📑 {totais.get('lidas', 0)} lidas | {totais.get('importadas', 0)} importadas | "
+          f"{totais.get('repetidas', 0)} repetidas | {totais.get('enviadas', 0)} enviadas",
+          end="", flush=True)
+
+
+async def _importar_arquivo(args) -> Dict[str, Any]:
+    try:
+        with open(args.arquivo, "rb") as arquivo:
+            return await importar(
+                arquivo, args.user, args.arquivo, args.formato, args.cartao, args.meio,
+                progresso=_mostrar, tamanho_bloco=args.bloco, simultaneas=args.simultaneas)
+    finally:
+        await close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa um extrato CSV/OFX para a planilha")
+    parser.add_argument("arquivo")
+    parser.add_argument("--user", required=True, help="user_id do WhatsApp (ex.: 5511...@c.us)")
+    parser.add_argument("--formato", choices=["csv", "ofx"], help="padrão: pela extensão/conteúdo")
+    parser.add_argument("--cartao", action="store_true",
+                        help="fatura de cartão: valores positivos são gastos")
+    parser.add_argument("--meio", help="meio de pagamento de todas as linhas (ex.: Crédito)")
+    parser.add_argument("--bloco", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--simultaneas", type=int, default=IMPORT_CONCURRENCY)
+    args = parser.parse_args()
+
+    try:
+        resumo = asyncio.run(_importar_arquivo(args))
+    except ExtratoInvalido as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrompido. Rode de novo: o que já foi importado é ignorado.")
+        sys.exit(130)
+    print(f"\n✅ Importação concluída: {resumo}")
+    if resumo.get("na_outbox"):
+        print(f"   {resumo['na_outbox']} transação(ões) ficaram na outbox e serão reenviadas pelo bot.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import asyncio
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from api_client import montar_transacoes, get_month_summary
+from saude_upstream import CircuitoAberto
+from log import log
+from config import LEDGER_PATH, LEDGER_RECONCILE_INTERVAL, LEDGER_COVERAGE_TTL
+
+# ======================================================
+# LIVRO-RAZÃO LOCAL (READ MODEL DA PLANILHA)
+# ======================================================
+# Cada parcela salva vira uma linha (mesma chave de idempotência da outbox).
+# Totais por usuário/mês/tipo/categoria são mantidos a cada escrita,
+# então /resumo é uma leitura indexada.
+#
+# A planilha também recebe lançamentos de fora do bot (e os anteriores ao
+# ledger). Por isso um mês só é respondido localmente depois de conferido:
+# a soma das parcelas já enviadas bate com a planilha, categoria a categoria
+# (tabela cobertura, válida por LEDGER_COVERAGE_TTL).
+
+_conn: Optional[sqlite3.Connection] = None
+_tarefa: Optional[asyncio.Task] = None
+ultima_reconciliacao: Dict[str, Any] = {}
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(
+            LEDGER_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript("""
+            CREATE TABLE IF NOT EXISTS transacoes (
+                chave TEXT PRIMARY KEY,
+                transacao_id TEXT,
+                user_id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                ano INTEGER NOT NULL,
+                mes INTEGER NOT NULL,
+                tipo TEXT NOT NULL,
+                valor REAL NOT NULL,
+                categoria TEXT NOT NULL,
+                subcategoria TEXT,
+                meio TEXT,
+                descricao TEXT,
+                -- 0 = aguardando envio, 1 = na planilha, -1 = recusada
+                sincronizada INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_transacoes_user_data ON transacoes (user_id, data);
+            CREATE INDEX IF NOT EXISTS idx_transacoes_user_mes_cat
+                ON transacoes (user_id, ano, mes, categoria);
+            CREATE INDEX IF NOT EXISTS idx_transacoes_transacao ON transacoes (transacao_id);
+
+            CREATE TABLE IF NOT EXISTS totais (
+                user_id TEXT NOT NULL,
+                ano INTEGER NOT NULL,
+                mes INTEGER NOT NULL,
+                tipo TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                total REAL NOT NULL,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY (user_id, ano, mes, tipo, categoria)
+            );
+
+            CREATE TABLE IF NOT EXISTS cobertura (
+                ano INTEGER NOT NULL,
+                mes INTEGER NOT NULL,
+                completa INTEGER NOT NULL,
+                conferida_em REAL NOT NULL,
+                PRIMARY KEY (ano, mes)
+            );
+        """)
+    return _conn
+
+
+def _somar(conn, user_id, ano, mes, tipo, categoria, valor, quantidade):
+    conn.execute("""
+        INSERT INTO totais (user_id, ano, mes, tipo, categoria, total, quantidade)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, ano, mes, tipo, categoria) DO UPDATE SET
+            total = total + excluded.total,
+            quantidade = quantidade + excluded.quantidade
+    """, (user_id, ano, mes, tipo, categoria, valor, quantidade))
+
+
+def registrar(data: Dict[str, Any]) -> int:
+    """Grava as parcelas da transação e atualiza os totais. Retorna quantas eram novas."""
+    conn = _get_conn()
+    user_id = str(data.get("user_id", ""))
+    novas = 0
+
+    conn.execute("BEGIN")
+    try:
+        for chave, payload in montar_transacoes(data):
+            quando = datetime.fromisoformat(payload["data"])
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO transacoes
+                (chave, transacao_id, user_id, data, ano, mes, tipo, valor,
+                 categoria, subcategoria, meio, descricao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (chave, data.get("id"), user_id, payload["data"], quando.year, quando.month,
+                  payload["tipo"], payload["valor"], payload["categoria"],
+                  payload["subcategoria"], payload["meio_pagamento"], payload["descricao"]))
+
+            if cursor.rowcount:
+                novas += 1
+                _somar(conn, user_id, quando.year, quando.month,
+                       payload["tipo"], payload["categoria"], payload["valor"], 1)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return novas
+
+
+def atualizar_categoria(transacao_id: str, categoria: str, subcategoria: str) -> int:
+    """Troca a categoria de uma transação movendo o valor entre os totais"""
+    conn = _get_conn()
+    conn.execute("BEGIN")
+    try:
+        linhas = conn.execute(
+            "SELECT user_id, ano, mes, tipo, categoria, valor FROM transacoes WHERE transacao_id = ?",
+            (transacao_id,)
+        ).fetchall()
+        for user_id, ano, mes, tipo, antiga, valor in linhas:
+            _somar(conn, user_id, ano, mes, tipo, antiga, -valor, -1)
+            _somar(conn, user_id, ano, mes, tipo, categoria, valor, 1)
+        conn.execute(
+            "UPDATE transacoes SET categoria = ?, subcategoria = ? WHERE transacao_id = ?",
+            (categoria, subcategoria, transacao_id)
+        )
+        conn.execute("DELETE FROM totais WHERE quantidade <= 0")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(linhas)
+
+
+def marcar_sincronizada(chave: str):
+    """Chamado pela outbox quando a parcela chegou na planilha"""
+    _get_conn().execute(
+        "UPDATE transacoes SET sincronizada = 1 WHERE chave = ?", (chave,))
+
+
+def marcar_recusada(chave: str):
+    """
+    A outbox desistiu da parcela (API recusou ou esgotou as tentativas):
+    sai dos totais e do extrato e não conta como "aguardando envio"
+    """
+    conn = _get_conn()
+    conn.execute("BEGIN")
+    try:
+        linha = conn.execute(
+            "SELECT user_id, ano, mes, tipo, categoria, valor FROM transacoes "
+            "WHERE chave = ? AND sincronizada = 0", (chave,)
+        ).fetchone()
+        if linha:
+            user_id, ano, mes, tipo, categoria, valor = linha
+            _somar(conn, user_id, ano, mes, tipo, categoria, -valor, -1)
+            conn.execute("DELETE FROM totais WHERE quantidade <= 0")
+            conn.execute("UPDATE transacoes SET sincronizada = -1 WHERE chave = ?", (chave,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def marcar_sincronizadas(chaves: List[str]):
+    conn = _get_conn()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "UPDATE transacoes SET sincronizada = 1 WHERE chave = ?", [(c,) for c in chaves])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def chaves_existentes(chaves: List[str]) -> Set[str]:
+    """Quais destas chaves de parcela já estão no livro-razão"""
+    conn = _get_conn()
+    existentes: Set[str] = set()
+    # Limite de parâmetros do SQLite: consulta em fatias
+    for inicio in range(0, len(chaves), 500):
+        fatia = chaves[inicio:inicio + 500]
+        marcadores = ",".join("?" * len(fatia))
+        existentes.update(chave for (chave,) in conn.execute(
+            f"SELECT chave FROM transacoes WHERE chave IN ({marcadores})", fatia))
+    return existentes
+
+
+def mes_coberto(mes: int, ano: int) -> bool:
+    """O ledger tem tudo o que a planilha tem neste mês (conferido há pouco)?"""
+    linha = _get_conn().execute(
+        "SELECT completa, conferida_em FROM cobertura WHERE ano = ? AND mes = ?", (ano, mes)
+    ).fetchone()
+    return bool(linha and linha[0] and linha[1] >= time.time() - LEDGER_COVERAGE_TTL)
+
+
+def gastos_por_envio(mes: int, ano: int, sincronizada: bool) -> Dict[str, float]:
+    """Gastos por categoria das parcelas já enviadas à planilha (ou ainda não)"""
+    return {
+        categoria: round(total, 2)
+        for categoria, total in _get_conn().execute(
+            "SELECT categoria, SUM(valor) FROM transacoes "
+            "WHERE ano = ? AND mes = ? AND tipo = 'Gasto' AND sincronizada = ? "
+            "GROUP BY categoria", (ano, mes, int(sincronizada)))
+        if round(total, 2) != 0
+    }
+
+
+def conferir_cobertura(mes: int, ano: int, total_remoto: float,
+                       cats_remotas: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+    """
+    Compara a planilha com as parcelas já enviadas do mês e marca se o
+    ledger cobre o mês. Parcelas ainda na outbox não contam como divergência.
+    Retorna as categorias divergentes.
+    """
+    cats_locais = gastos_por_envio(mes, ano, sincronizada=True)
+    divergentes = {
+        c: {"local": cats_locais.get(c, 0.0), "remoto": round(cats_remotas.get(c, 0.0), 2)}
+        for c in set(cats_locais) | set(cats_remotas)
+        if abs(cats_locais.get(c, 0.0) - cats_remotas.get(c, 0.0)) > 0.01
+    }
+    # Planilha vazia não confirma nada (pode ter sido falha na leitura)
+    completa = not divergentes and total_remoto > 0 and \
+        abs(sum(cats_locais.values()) - total_remoto) <= 0.01
+    _get_conn().execute(
+        "INSERT OR REPLACE INTO cobertura (ano, mes, completa, conferida_em) VALUES (?, ?, ?, ?)",
+        (ano, mes, int(completa), time.time())
+    )
+    return divergentes
+
+
+def resumo(mes: int, ano: int, user_id: Optional[str] = None) -> Tuple[float, Dict[str, float]]:
+    """Total de gastos do mês e gastos por categoria (mesma forma de get_month_summary)"""
+    sql = "SELECT categoria, SUM(total) FROM totais WHERE ano = ? AND mes = ? AND tipo = 'Gasto'"
+    params: list = [ano, mes]
+    if user_id is not None:
+        sql += " AND user_id = ?"
+        params.append(user_id)
+
+    categorias = {
+        categoria: round(total, 2)
+        for categoria, total in _get_conn().execute(sql + " GROUP BY categoria", params)
+        if round(total, 2) != 0
+    }
+    return round(sum(categorias.values()), 2), categorias
+
+
+def extrato(user_id: str, mes: Optional[int] = None, ano: Optional[int] = None,
+            limite: int = 15) -> List[Dict[str, Any]]:
+    """Últimas transações do usuário (opcionalmente de um mês)"""
+    sql = ("SELECT data, tipo, valor, categoria, subcategoria, meio, descricao "
+           "FROM transacoes WHERE user_id = ? AND sincronizada >= 0")
+    params: list = [user_id]
+    if mes and ano:
+        sql += " AND ano = ? AND mes = ?"
+        params += [ano, mes]
+    sql += " ORDER BY data DESC LIMIT ?"
+    params.append(limite)
+
+    colunas = ["data", "tipo", "valor", "categoria", "subcategoria", "meio", "descricao"]
+    return [dict(zip(colunas, linha)) for linha in _get_conn().execute(sql, params)]
+
+
+def pendentes_sincronizacao() -> int:
+    return _get_conn().execute(
+        "SELECT COUNT(*) FROM transacoes WHERE sincronizada = 0").fetchone()[0]
+
+# ======================================================
+# RECONCILIAÇÃO COM A API
+# ======================================================
+
+
+async def reconciliar(mes: Optional[int] = None, ano: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Confere o mês (todos os usuários) com a planilha e renova a cobertura.
+    A planilha pode ter lançamentos feitos fora do bot: enquanto divergir,
+    /resumo desse mês continua vindo da API.
+    """
+    agora = datetime.now()
+    mes, ano = mes or agora.month, ano or agora.year
+
+    total_remoto, cats_remotas = await get_month_summary(mes, ano)
+    total_local, _ = resumo(mes, ano)
+    divergentes = conferir_cobertura(mes, ano, total_remoto, cats_remotas)
+
+    ultima_reconciliacao.clear()
+    ultima_reconciliacao.update({
+        "mes": f"{mes:02d}/{ano}",
+        "total_local": total_local,
+        "total_remoto": round(total_remoto, 2),
+        "aguardando_envio": pendentes_sincronizacao(),
+        "coberto": mes_coberto(mes, ano),
+        "categorias_divergentes": divergentes,
+        "em": agora.isoformat(timespec="seconds")
+    })
+    if divergentes:
+        log.warning("⚖️ Reconciliação %02d/%d: %d categoria(s) divergente(s)",
+                    mes, ano, len(divergentes))
+    return dict(ultima_reconciliacao)
+
+
+async def _loop_reconciliacao():
+    while True:
+        await asyncio.sleep(LEDGER_RECONCILE_INTERVAL)
+        try:
+            await reconciliar()
+        except CircuitoAberto:
+            log.info("⏸️ Reconciliação adiada: API da planilha fora do ar")
+        except Exception as e:
+            log.error("❌ Erro na reconciliação: %s", e)
+
+
+def iniciar_reconciliacao():
+    global _tarefa
+    if LEDGER_RECONCILE_INTERVAL > 0 and (_tarefa is None or _tarefa.done()):
+        _tarefa = asyncio.create_task(_loop_reconciliacao())
+
+
+async def parar_reconciliacao():
+    global _tarefa
+    if _tarefa is not None:
+        _tarefa.cancel()
+        try:
+            await _tarefa
+        except asyncio.CancelledError:
+            pass
+        _tarefa = None
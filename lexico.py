@@ -0,0 +1,275 @@
+import re
+from typing import List, Optional, Tuple
+
+from cache_categorias import remover_acentos
+
+# ======================================================
+# LÉXICO: UMA PASSADA PELA MENSAGEM
+# ======================================================
+# Uma regex compilada percorre o texto normalizado uma única vez e
+# preenche um registro compacto com tudo o que o fluxo precisa:
+# valor (formatos brasileiros), tipo, meio de pagamento e parcelas.
+#
+#   "R$ 1.234,56 no débito"   -> 1234.56, Débito
+#   "tv 2 mil em 10x"         -> 2000.0, Crédito, 10 parcelas
+#   "geladeira 12x de 250"    -> 3000.0, Crédito, 12 parcelas
+#   "recebi pix de 150"       -> 150.0, Receita, Pix
+#   "2 pizzas R$ 80"          -> 80.0 (o 2 é quantidade)
+#
+# Inteiro no começo, depois de verbo de lançamento ou de "e", seguido de
+# palavra que não é preposição nem meio, é quantidade ("2 pizzas",
+# "comprei 3 camisas", "e 1 refri"); só vira valor se não houver outro.
+# Valor, entre os demais números: o marcado como dinheiro (r$, reais, mil);
+# senão o último, se fecha a frase ("2 pizzas 80 no pix"); senão o primeiro.
+
+_NUMERO = r"(?:r\$\s*)?(?:\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)"
+
+_PADRAO = re.compile(rf"""
+    (?P<parcelas>\b(?P<vezes>\d{{1,2}})\s*(?:x|vezes|parcelas?)\b
+        (?:\s+de\s+(?P<valor_parcela>{_NUMERO}))?)
+  | (?P<parcelado>\bparcel\w*\s+(?:em\s+)?(?P<vezes_parcelado>\d{{1,2}})\s*(?:x|vezes)?\b
+        (?!\s*(?:[.,]\d|mil\b|k\b)))
+  | (?P<a_vista>\ba\s+vista\b)
+  | (?P<pix_de>\bpix\s+de\b)
+  | (?P<valor>{_NUMERO})(?:\s*(?P<milhar>mil|k)\b)?(?:\s*(?P<moeda>reais|real|contos?|pilas?)\b)?
+  | (?P<palavra>[a-z]+)
+""", re.VERBOSE)
+
+_MILHARES = re.compile(r"\d{1,3}(?:\.\d{3})+")
+
+PALAVRAS_RECEITA = frozenset([
+    "recebi", "recebido", "recebida", "ganhei", "ganho", "ganhos",
+    "receita", "receitas", "salario", "salarios", "entrada", "entradas",
+])
+
+# Palavras que podem vir depois do valor sem tirá-lo do fim da frase
+_FECHO = frozenset(["no", "na", "em", "de", "via", "pelo", "pela",
+                    "pix", "debito", "credito", "dinheiro", "cartao"])
+
+# Verbos que abrem um lançamento ("gastei 10 no pão e paguei 20 de luz")
+VERBOS_LANCAMENTO = frozenset(["gastei", "paguei", "comprei", "recebi", "ganhei", "transferi"])
+# Depois deles (ou do começo, ou de "e") um inteiro pode ser quantidade
+_ABRE_ITEM = VERBOS_LANCAMENTO | {"e", "mais"}
+# Palavras que, logo depois do número, mostram que ele é valor ("20 na padaria")
+_APOS_VALOR = _FECHO | {"do", "da", "dos", "das", "nos", "nas", "a", "ao", "pro", "pra",
+                        "para", "com", "por"}
+
+# Ordem de prioridade quando a mensagem cita mais de um meio
+MEIOS = (("pix", "Pix"), ("debito", "Débito"), ("credito", "Crédito"), ("dinheiro", "Dinheiro"))
+
+
+def normalizar(texto: str) -> str:
+    """Minúscula, sem acentos e com espaços únicos"""
+    return " ".join(remover_acentos(texto.lower()).split())
+
+
+def valor_br(texto: str) -> float:
+    """'R$ 1.234,56' -> 1234.56 | '12.50' -> 12.5 | '1.500' -> 1500.0"""
+    numero = texto.replace("r$", "").replace("R$", "").strip()
+    if "," in numero:
+        return float(numero.replace(".", "").replace(",", "."))
+    if _MILHARES.fullmatch(numero):
+        return float(numero.replace(".", ""))
+    return float(numero)
+
+
+class Lexico:
+    """Registro com as características extraídas de uma mensagem"""
+    __slots__ = ("texto", "normalizado", "tokens", "valor", "tipo", "meio", "parcelas",
+                 "so_quantidade")
+
+    def __init__(self, texto: str, normalizado: str, tokens: Tuple[str, ...],
+                 valor: float, tipo: str, meio: str, parcelas: Optional[int],
+                 so_quantidade: bool = False):
+        self.texto = texto
+        self.normalizado = normalizado
+        self.tokens = tokens
+        self.valor = valor
+        self.tipo = tipo
+        self.meio = meio
+        # None = não informado; 1 = à vista
+        self.parcelas = parcelas
+        # O valor saiu de um número que parecia quantidade ("comprei 2 pães")
+        self.so_quantidade = so_quantidade
+
+    def __repr__(self):
+        return (f"Lexico(valor={self.valor}, tipo={self.tipo!r}, "
+                f"meio={self.meio!r}, parcelas={self.parcelas})")
+
+
+def analisar(texto: str) -> Lexico:
+    """
+    Extrai valor, tipo, meio e parcelas em uma única varredura
+    (exemplos conferidos com `python -m doctest lexico.py`)
+
+    >>> analisar("R$ 1.234,56 no débito")
+    Lexico(valor=1234.56, tipo='Gasto', meio='Débito', parcelas=None)
+    >>> analisar("tv 2 mil em 10x")
+    Lexico(valor=2000.0, tipo='Gasto', meio='Crédito', parcelas=10)
+    >>> analisar("geladeira 12x de 250")
+    Lexico(valor=3000.0, tipo='Gasto', meio='Crédito', parcelas=12)
+    >>> analisar("recebi pix de 150")
+    Lexico(valor=150.0, tipo='Receita', meio='Pix', parcelas=None)
+    >>> analisar("2 pizzas R$ 80").valor, analisar("comprei 3 camisas por 90 reais").valor
+    (80.0, 90.0)
+    >>> analisar("2 pizzas 80 no pix").valor, analisar("almoço 35 com 2 amigos").valor
+    (80.0, 35.0)
+    >>> analisar("2 pizzas 80 hoje").valor, analisar("gastei 10 no pão").valor
+    (80.0, 10.0)
+    >>> lexico = analisar("comprei 2 pães")
+    >>> lexico.valor, lexico.so_quantidade
+    (2.0, True)
+    >>> analisar("12 vezes de 99,90").valor
+    1198.8
+    """
+    normalizado = normalizar(texto)
+    tokens = []
+    # Números candidatos a valor: [valor, marcado como dinheiro, quantidade]
+    candidatos = []
+    # Candidato que vira quantidade se a próxima palavra não for preposição
+    quantidade = None
+    abre_item = True
+    fecha_frase = False
+    valor_parcela = None
+    parcelas = None
+    receita = False
+    meios = set()
+
+    for m in _PADRAO.finditer(normalizado):
+        palavra = m.group("palavra")
+        if quantidade is not None and palavra and palavra not in _APOS_VALOR:
+            candidatos[quantidade][2] = True
+        quantidade = None
+        depois_de_abertura, abre_item = abre_item, palavra in _ABRE_ITEM
+        if palavra:
+            tokens.append(palavra)
+            if palavra not in _FECHO:
+                fecha_frase = False
+            if palavra in PALAVRAS_RECEITA:
+                receita = True
+            elif palavra in ("pix", "debito", "credito", "dinheiro"):
+                meios.add(palavra)
+        elif m.group("valor"):
+            numero = valor_br(m.group("valor"))
+            if m.group("milhar"):
+                numero *= 1000
+            marcado = bool(m.group("milhar") or m.group("moeda")
+                           or m.group("valor").startswith("r$"))
+            if depois_de_abertura and not marcado and m.group("valor").isdigit():
+                quantidade = len(candidatos)
+            candidatos.append([numero, marcado, False])
+            fecha_frase = True
+        elif m.group("parcelas"):
+            parcelas = int(m.group("vezes"))
+            if m.group("valor_parcela"):
+                valor_parcela = valor_br(m.group("valor_parcela"))
+        elif m.group("parcelado"):
+            parcelas = int(m.group("vezes_parcelado"))
+        elif m.group("a_vista"):
+            parcelas = 1
+        elif m.group("pix_de"):
+            receita = True
+            meios.add("pix")
+            tokens.extend(("pix", "de"))
+
+    valor = None
+    valores = [c for c in candidatos if not c[2]]
+    if valores:
+        marcados = [numero for numero, marcado, _ in valores if marcado]
+        if marcados:
+            valor = marcados[0]
+        elif fecha_frase:
+            valor = valores[-1][0]
+        else:
+            valor = valores[0][0]
+
+    # "12x de 250": o valor informado é o da parcela
+    if valor is None and valor_parcela is not None and parcelas:
+        valor = valor_parcela * parcelas
+    # Só sobrou quantidade: ainda é o melhor palpite para mensagem única
+    so_quantidade = valor is None and bool(candidatos)
+    if so_quantidade:
+        valor = candidatos[0][0]
+    if valor is not None:
+        valor = round(valor, 2)
+
+    if parcelas is not None and parcelas < 1:
+        parcelas = None
+
+    meio = next((nome for chave, nome in MEIOS if chave in meios), "Pendente")
+    # Parcelou: só pode ter sido no crédito
+    if parcelas and parcelas > 1 and meio == "Pendente":
+        meio = "Crédito"
+
+    return Lexico(texto, normalizado, tuple(tokens), valor or 0.0,
+                  "Receita" if receita else "Gasto", meio, parcelas, so_quantidade)
+
+
+# ======================================================
+# VÁRIOS LANÇAMENTOS NA MESMA MENSAGEM
+# ======================================================
+#   "uber 20, almoço 35 e mercado 120 no débito" -> 3 itens
+#   "gastei 10 no pão e 20 na padaria"            -> 2 itens (20 seguido de "na" é valor)
+#   "paguei 50 de luz e água"                     -> 1 item (só um valor)
+#   "comprei 2 pães e 1 café 15"                  -> 1 item (2 pães não tem valor próprio)
+#   "2 pizzas 80 e 1 refri 10"                    -> 2 itens (2 e 1 são quantidades)
+# Cada trecho só vira item com valor próprio; o valor é o mesmo que
+# analisar() dá ao trecho, então o item é gravado com o número escolhido aqui.
+
+# Vírgula seguida de dígito é decimal ("35,50"), não separador
+_SEPARADOR = re.compile(r"(\s*(?:[;\n]|,(?!\d)|\s(?:e|mais|\+)\s)\s*)", re.IGNORECASE)
+
+
+def _e_item(trecho: str) -> bool:
+    """Tem valor (não só quantidade) e alguma palavra que descreva o lançamento"""
+    lexico = analisar(trecho)
+    return (lexico.valor > 0 and not lexico.so_quantidade
+            and any(len(t) >= 3 for t in lexico.tokens))
+
+
+def dividir_itens(texto: str) -> List[str]:
+    """
+    Quebra a mensagem em lançamentos, cada um com seu valor. Trechos sem
+    valor vão para o item seguinte ("almoço e janta 35") ou, no fim, para
+    o anterior ("..., tudo no débito"). Na dúvida, a mensagem fica inteira.
+
+    >>> dividir_itens("mercado 120, 80 de gasolina no pix")
+    ['mercado 120', '80 de gasolina no pix']
+    >>> dividir_itens("gastei 10 no pão e 20 na padaria")
+    ['gastei 10 no pão', '20 na padaria']
+    >>> [analisar(item).valor for item in dividir_itens("paguei 1.500 de aluguel e 200 de condomínio")]
+    [1500.0, 200.0]
+    >>> [analisar(item).valor for item in dividir_itens("2 pizzas 80 e 1 refri 10 no pix")]
+    [80.0, 10.0]
+    >>> dividir_itens("uber 20, almoço 35, tudo no débito")
+    ['uber 20', 'almoço 35, tudo no débito']
+    >>> dividir_itens("gastei 100 no mercado e recebi 50 do joão")
+    ['gastei 100 no mercado', 'recebi 50 do joão']
+    >>> dividir_itens("2 pizzas e 1 refri 80"), dividir_itens("comprei 2 pães e 1 café 15")
+    (['2 pizzas e 1 refri 80'], ['comprei 2 pães e 1 café 15'])
+    >>> dividir_itens("paguei 50 de luz e água"), dividir_itens("almoço e janta 35")
+    (['paguei 50 de luz e água'], ['almoço e janta 35'])
+    """
+    texto = texto.strip()
+    partes = _SEPARADOR.split(texto)
+    itens: List[str] = []
+    sem_valor, separador_antes = "", ""
+
+    for i in range(0, len(partes), 2):
+        trecho = partes[i]
+        separador = partes[i - 1] if i else ""
+        if not _e_item(trecho):
+            if sem_valor:
+                sem_valor += separador + trecho
+            else:
+                sem_valor, separador_antes = trecho, separador
+            continue
+
+        if sem_valor:
+            trecho, separador = sem_valor + separador + trecho, separador_antes
+            sem_valor = ""
+        itens.append(trecho)
+
+    if sem_valor and itens:
+        itens[-1] += separador_antes + sem_valor
+    return itens if len(itens) > 1 else [texto]
@@ -0,0 +1,137 @@
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from log import log
+from metricas import Contador
+from config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_MAX_USERS,
+    RATE_MSG_PER_MIN_USER, RATE_MSG_BURST_USER, RATE_MSG_PER_SEC_GLOBAL, RATE_MSG_BURST_GLOBAL,
+    RATE_LLM_PER_HOUR_USER, RATE_LLM_BURST_USER, RATE_LLM_PER_MIN_GLOBAL, RATE_LLM_BURST_GLOBAL,
+    RATE_STT_SECONDS_PER_HOUR_USER, RATE_STT_BURST_USER,
+    RATE_STT_SECONDS_PER_MIN_GLOBAL, RATE_STT_BURST_GLOBAL
+)
+
+# ======================================================
+# LIMITES DE USO (TOKEN BUCKET POR USUÁRIO + GLOBAL)
+# ======================================================
+# Cada recurso (mensagens, chamadas ao GPT, segundos de Whisper) tem um
+# balde por usuário e um global. Um pedido só passa se couber nos dois.
+# Estourou: quem chama degrada (só regras, sem GPT) ou responde rápido.
+
+limitados = Contador(
+    "bot_limitados_total", "Pedidos barrados por limite de uso", ["recurso", "escopo"])
+
+
+class LimiteExcedido(Exception):
+    """Orçamento do recurso esgotado (por usuário ou global)"""
+
+
+class Balde:
+    """Token bucket: até `capacidade` fichas, repostas a `taxa` fichas/segundo"""
+    __slots__ = ("capacidade", "taxa", "fichas", "atualizado")
+
+    def __init__(self, capacidade: float, taxa: float):
+        self.capacidade = capacidade
+        self.taxa = taxa
+        self.fichas = capacidade
+        self.atualizado = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def cabe(self, custo: float) -> bool:
+        self._repor()
+        return self.fichas >= custo
+
+    def consumir(self, custo: float):
+        self.fichas -= custo
+
+
+class Limitador:
+    """
+    Baldes de um recurso: um por user_id (os mais antigos saem acima de
+    `max_usuarios`) e um global. `permitir(None)` consulta só o global.
+    """
+
+    def __init__(self, recurso: str, capacidade_usuario: float, taxa_usuario: float,
+                 capacidade_global: float, taxa_global: float,
+                 max_usuarios: int = RATE_LIMIT_MAX_USERS, ativo: bool = RATE_LIMIT_ENABLED):
+        self.recurso = recurso
+        self.capacidade_usuario = capacidade_usuario
+        self.taxa_usuario = taxa_usuario
+        self.max_usuarios = max_usuarios
+        self.ativo = ativo
+        self._global = Balde(capacidade_global, taxa_global)
+        self._usuarios: "OrderedDict[str, Balde]" = OrderedDict()
+        self.barrados_por_usuario: Counter = Counter()
+        self.barrados_global = 0
+
+    def _balde(self, user_id: str) -> Balde:
+        balde = self._usuarios.get(user_id)
+        if balde is None:
+            balde = self._usuarios[user_id] = Balde(self.capacidade_usuario, self.taxa_usuario)
+            while len(self._usuarios) > self.max_usuarios:
+                self._usuarios.popitem(last=False)
+        else:
+            self._usuarios.move_to_end(user_id)
+        return balde
+
+    def permitir(self, user_id: Optional[str], custo: float = 1) -> bool:
+        """Consome `custo` dos baldes do usuário e global, se couber nos dois"""
+        if not self.ativo:
+            return True
+
+        balde = self._balde(user_id) if user_id is not None else None
+        if balde is not None and not balde.cabe(custo):
+            self._registrar(user_id, "usuario")
+            return False
+        if not self._global.cabe(custo):
+            self._registrar(user_id, "global")
+            return False
+
+        if balde is not None:
+            balde.consumir(custo)
+        self._global.consumir(custo)
+        return True
+
+    def _registrar(self, user_id: Optional[str], escopo: str):
+        limitados.inc(self.recurso, escopo)
+        if escopo == "global":
+            self.barrados_global += 1
+        if user_id is not None:
+            self.barrados_por_usuario[user_id] += 1
+            if len(self.barrados_por_usuario) > 2 * self.max_usuarios:
+                self.barrados_por_usuario = Counter(
+                    dict(self.barrados_por_usuario.most_common(self.max_usuarios)))
+        log.info("🚦 Limite de %s (%s) atingido para %s", self.recurso, escopo, user_id or "-")
+
+    def estatisticas(self) -> dict:
+        return {
+            "ativo": self.ativo,
+            "fichas_globais": round(self._global.fichas, 1),
+            "barrados_global": self.barrados_global,
+            "mais_barrados": dict(self.barrados_por_usuario.most_common(10)),
+        }
+
+
+# Mensagens recebidas (texto ou áudio já transcrito)
+mensagens = Limitador(
+    "mensagens", RATE_MSG_BURST_USER, RATE_MSG_PER_MIN_USER / 60,
+    RATE_MSG_BURST_GLOBAL, RATE_MSG_PER_SEC_GLOBAL)
+
+# Chamadas ao GPT (só as que passam do cache)
+llm = Limitador(
+    "llm", RATE_LLM_BURST_USER, RATE_LLM_PER_HOUR_USER / 3600,
+    RATE_LLM_BURST_GLOBAL, RATE_LLM_PER_MIN_GLOBAL / 60)
+
+# Segundos de áudio enviados ao Whisper (estimados pelo tamanho do arquivo)
+stt = Limitador(
+    "stt_segundos", RATE_STT_BURST_USER, RATE_STT_SECONDS_PER_HOUR_USER / 3600,
+    RATE_STT_BURST_GLOBAL, RATE_STT_SECONDS_PER_MIN_GLOBAL / 60)
+
+
+def estatisticas() -> dict:
+    return {l.recurso: l.estatisticas() for l in (mensagens, llm, stt)}
@@ -0,0 +1,38 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+from config import LOG_LEVEL
+
+# ======================================================
+# LOGGER NÃO BLOQUEANTE
+# ======================================================
+# O request só enfileira o registro; a escrita no stdout acontece
+# na thread do QueueListener. Mensagens abaixo de LOG_LEVEL são
+# descartadas antes de formatar (use log.debug("... %s", valor)).
+
+
+def _configurar() -> logging.Logger:
+    logger = logging.getLogger("bot")
+    if logger.handlers:
+        return logger
+
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+    fila = queue.SimpleQueue()
+    saida = logging.StreamHandler(sys.stdout)
+    saida.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s [%(module)s] %(message)s"))
+
+    ouvinte = logging.handlers.QueueListener(fila, saida)
+    ouvinte.start()
+    atexit.register(ouvinte.stop)
+
+    logger.addHandler(logging.handlers.QueueHandler(fila))
+    return logger
+
+
+log = _configurar()
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+# ======================================================
+# MICRO-LOTES (JUNTA PEDIDOS SIMULTÂNEOS EM UMA CHAMADA)
+# ======================================================
+
+
+class MicroLote:
+    """
+    Acumula pedidos por até `max_espera_ms` (ou até `max_itens`) e resolve
+    todos com uma única chamada `processar(lista) -> lista de resultados`.
+    Se um resultado vier None, o pedido correspondente recebe exceção.
+    """
+
+    def __init__(self, processar: Callable[[List[str]], Awaitable[List[Optional[Tuple]]]],
+                 max_itens: int, max_espera_ms: float):
+        self.processar = processar
+        self.max_itens = max_itens
+        self.max_espera = max_espera_ms / 1000
+        self._fila: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tarefas = set()
+
+        self.lotes = 0
+        self.itens = 0
+        self.maior_lote = 0
+
+    async def submeter(self, item: str):
+        futuro = asyncio.get_running_loop().create_future()
+        self._fila.append((item, futuro))
+
+        if len(self._fila) >= self.max_itens:
+            self._disparar()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_espera, self._disparar)
+
+        return await futuro
+
+    def _disparar(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        lote, self._fila = self._fila, []
+        if lote:
+            tarefa = asyncio.ensure_future(self._executar(lote))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _executar(self, lote: List[Tuple[str, asyncio.Future]]):
+        self.lotes += 1
+        self.itens += len(lote)
+        self.maior_lote = max(self.maior_lote, len(lote))
+        try:
+            resultados = await self.processar([item for item, _ in lote])
+        except Exception as e:
+            resultados = e
+
+        for i, (_, futuro) in enumerate(lote):
+            if futuro.done():
+                continue
+            if isinstance(resultados, Exception):
+                futuro.set_exception(resultados)
+            elif i < len(resultados) and resultados[i] is not None:
+                futuro.set_result(resultados[i])
+            else:
+                futuro.set_exception(ValueError("item sem resultado no lote"))
+
+    def estatisticas(self) -> dict:
+        return {
+            "lotes": self.lotes,
+            "itens": self.itens,
+            "maior_lote": self.maior_lote,
+            "media_por_lote": round(self.itens / self.lotes, 2) if self.lotes else 0.0
+        }
@@ -1,21 +1,69 @@
-from fastapi import FastAPI, UploadFile, File
+import time
+# Tempo de import do app (relatado no /ready): começa antes de tudo
+_INICIO_IMPORT = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from openai import OpenAI
-import tempfile
-import os
+from typing import List, Optional
+import asyncio
+import base64
+import binascii
+import io
+import re
+from functools import partial
 from datetime import datetime
 
-from ai_parser import parse_message
-from api_client import save_to_api, get_month_summary
-from state import get_pending, set_pending, clear_pending
-from config import OPENAI_API_KEY
+# OpenAI: o mesmo cliente assíncrono do ai_parser (texto e áudio), criado sob demanda
+from ai_parser import (
+    parse_message, preaquecer_categorias, lote_gpt, get_openai_client, close_openai_client
+)
+from api_client import get_month_summary, close_http_client, saude_api
+from saude_upstream import CircuitoAberto
+from outbox import (
+    enfileirar, enfileirar_lote, atualizar_categoria, liberar,
+    iniciar_flusher, parar_flusher, pendentes, recusadas
+)
+from cache_categorias import cache as cache_categorias
+import classificador
+import ledger
+import limites
+from limites import LimiteExcedido
+from state import get_pending, set_pending, clear_pending, user_states
+from config import REFINE_TIMEOUT, AUDIO_MAX_BYTES, AUDIO_BYTES_PER_SECOND, BATCH_MAX_MESSAGES, IMPORT_MAX_BYTES
+from transcricao import transcritor, tamanho_arquivo
+from agendador import agendador, FilaCheia
+from idempotencia import respostas as ja_respondidas
+from importador import importar, ExtratoInvalido
+from lexico import dividir_itens
+import ciclo_vida
+from log import log
+from metricas import medir, Medidor, exportar as exportar_metricas
 
 # ======================================================
-# APP + OPENAI
+# APP
 # ======================================================
 
 app = FastAPI()
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+
+
+@app.on_event("startup")
+async def startup():
+    inicio = time.perf_counter()
+    iniciar_flusher()
+    ledger.iniciar_reconciliacao()
+    # Import pesado, modelo local e conexões: em background, fora do caminho da 1ª mensagem
+    ciclo_vida.iniciar_preaquecimento()
+    ciclo_vida.registrar_etapa("startup", time.perf_counter() - inicio)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await ciclo_vida.parar_preaquecimento()
+    await parar_flusher()
+    await ledger.parar_reconciliacao()
+    await close_http_client()
+    await close_openai_client()
 
 # ======================================================
 # MODELS
@@ -25,6 +73,31 @@ client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 class Message(BaseModel):
     user_id: str
     text: str
+    # Id da mensagem no WhatsApp: reenvios com o mesmo id não reprocessam
+    message_id: Optional[str] = None
+
+
+class MessageBatch(BaseModel):
+    messages: List[Message]
+
+
+class AudioMessage(BaseModel):
+    user_id: str
+    data: str
+    mimetype: Optional[str] = None
+    message_id: Optional[str] = None
+
+
+# /resumo, /extrato, /resumo 03/2026, /extrato 3/2026
+RE_COMANDO_PERIODO = re.compile(r"^(/resumo|/extrato)(?:\s+(\d{1,2})/(\d{4}))?$")
+
+MSG_ERRO_INTERNO = "❌ Erro interno. Tente novamente."
+MSG_FILA_CHEIA = ("⏳ Ainda estou processando suas mensagens anteriores. "
+                  "Aguarde um instante e envie de novo.")
+MSG_LIMITE_MENSAGENS = ("🐢 Muitas mensagens em pouco tempo. "
+                        "Aguarde um instante e envie de novo.")
+MSG_LIMITE_AUDIO = ("🎙️ Limite de áudios por agora atingido. "
+                    "Mande por texto ou tente mais tarde.")
 
 # ======================================================
 # UTIL - FORMATAÇÃO DE MENSAGEM
@@ -66,17 +139,155 @@ def format_success_msg(data):
 
     return msg
 
+
+def format_lote_msg(itens):
+    """Uma resposta só para os vários lançamentos de uma mensagem"""
+    gastos = sum(float(t.get("valor", 0)) for t in itens if t.get("tipo") != "RECEITA")
+    receitas = sum(float(t.get("valor", 0)) for t in itens if t.get("tipo") == "RECEITA")
+
+    msg = f"🧾 *{len(itens)} LANÇAMENTOS REGISTRADOS*\n\n"
+    for t in itens:
+        emoji = "📥" if t.get("tipo") == "RECEITA" else "💸"
+        total_parcelas = int(t.get("total_parcelas", 1))
+        parcelas = f" ({total_parcelas}x)" if total_parcelas > 1 and t.get("tipo") != "RECEITA" else ""
+        msg += (f"{emoji} R$ {float(t.get('valor', 0)):.2f}{parcelas} • {t.get('meio')} • "
+                f"_{t.get('categoria')}_ — {t.get('descricao')}\n")
+
+    msg += "\n"
+    if gastos:
+        msg += f"💵 *Total de gastos:* R$ {gastos:.2f}\n"
+    if receitas:
+        msg += f"💰 *Total de receitas:* R$ {receitas:.2f}\n"
+    msg += f"\n🚀 _Planilha atualizada!_"
+
+    return msg
+
+
+def format_extrato(transacoes, mes, ano):
+    """Lista as transações do mês, da mais recente para a mais antiga"""
+    if not transacoes:
+        return f"📭 Nenhuma transação em {mes}/{ano}."
+
+    msg = f"🧾 *EXTRATO DE {mes}/{ano}*\n\n"
+    for t in transacoes:
+        dia = datetime.fromisoformat(t["data"]).strftime("%d/%m")
+        sinal = "+" if t["tipo"] == "Receita" else "-"
+        msg += f"• {dia} {sinal}R$ {t['valor']:.2f} _{t['categoria']}_ — {t['descricao']}\n"
+    return msg
+
+# ======================================================
+# PERSISTÊNCIA
+# ======================================================
+
+
+def _aprender(data):
+    if data.get("fonte_categoria") == "gpt" and data.get("rotulo"):
+        categoria, subcategoria = data["rotulo"]
+        classificador.aprender(data.get("descricao", ""), categoria, subcategoria)
+
+
+# Categoria provisória (GPT ainda respondendo): a outbox segura o envio até
+# o refinamento chegar. Folga para a vez do usuário no agendador.
+RETENCAO_PROVISORIA = REFINE_TIMEOUT + 5
+
+
+def salvar_transacao(data):
+    """
+    Grava no livro-razão local, enfileira na outbox e, se a categoria
+    veio do GPT, usa a transação como exemplo para o classificador local
+    """
+    ledger.registrar(data)
+    enfileirar(data, adiar=RETENCAO_PROVISORIA if data.get("categoria_provisoria") else 0)
+    _aprender(data)
+
+
+def salvar_transacoes(itens):
+    """Como salvar_transacao, mas os itens entram na outbox de uma vez (um envio em lote)"""
+    for data in itens:
+        ledger.registrar(data)
+    definitivos = [t for t in itens if not t.get("categoria_provisoria")]
+    provisorios = [t for t in itens if t.get("categoria_provisoria")]
+    if definitivos:
+        enfileirar_lote(definitivos)
+    if provisorios:
+        enfileirar_lote(provisorios, adiar=RETENCAO_PROVISORIA)
+    for data in itens:
+        _aprender(data)
+
+
+def ajustar_subcategoria(data):
+    """Subcategoria igual à categoria não informa nada: usa a descrição"""
+    if data.get("subcategoria") == data.get("categoria"):
+        detalhe = str(data.get("descricao", "")).strip().capitalize()
+        if detalhe:
+            data["subcategoria"] = detalhe
+
+
+async def refinar_categoria(user_id, transacao_id, descricao, categoria, subcategoria, fonte):
+    """
+    Aplica a categoria do GPT que chegou depois do prazo de resposta:
+    na transação pendente do usuário ou nas parcelas ainda na outbox.
+    Categoria None = não houve refinamento: só libera o envio.
+    Roda na vez do usuário, como as mensagens (não disputa o estado pendente).
+    """
+    await agendador.executar(
+        user_id, _aplicar_refino, user_id, transacao_id, descricao,
+        categoria, subcategoria, fonte, limitar=False)
+
+
+async def _aplicar_refino(user_id, transacao_id, descricao, categoria, subcategoria, fonte):
+    pending = await get_pending(user_id)
+    # Pendente pode ser uma transação ou um lote de itens aguardando o meio
+    alvo = None
+    if pending:
+        alvo = next((t for t in pending.get("itens") or [pending] if t.get("id") == transacao_id), None)
+    if alvo is not None and categoria is None:
+        alvo["categoria_provisoria"] = False
+        await set_pending(user_id, pending)
+        return
+    if alvo is not None:
+        alvo["categoria"] = categoria
+        alvo["subcategoria"] = subcategoria
+        alvo["fonte_categoria"] = fonte
+        alvo["categoria_provisoria"] = False
+        alvo["rotulo"] = [categoria, subcategoria]
+        if alvo.get("tipo") == "RECEITA":
+            alvo["subcategoria"] = categoria
+        else:
+            ajustar_subcategoria(alvo)
+        await set_pending(user_id, pending)
+        log.info("🔄 Categoria refinada (pendente): %s / %s", categoria, subcategoria)
+        return
+
+    if categoria is None:
+        liberar(transacao_id)
+        return
+
+    alteradas = atualizar_categoria(transacao_id, categoria, subcategoria)
+    if not alteradas:
+        # Já foi para a planilha (a API não tem rota de atualização):
+        # o ledger fica igual à planilha, só o classificador aprende
+        log.warning("⚠️ Refinamento de %s sem parcelas na outbox (já enviadas?): categoria mantida", transacao_id)
+    else:
+        ledger.atualizar_categoria(transacao_id, categoria, subcategoria)
+        log.info("🔄 Categoria refinada (%d parcela(s) na outbox): %s / %s",
+                 alteradas, categoria, subcategoria)
+
+    # Já salva com o fallback: o rótulo do GPT ainda serve de treino
+    if fonte == "gpt":
+        classificador.aprender(descricao, categoria, subcategoria)
+
 # ======================================================
 # TEXTO (WHATSAPP)
 # ======================================================
 
 
-@app.post("/message")
-def receive_message(msg: Message):
-    user_id = msg.user_id
-    pending = get_pending(user_id)
+@medir("receive_message")
+async def processar_mensagem(user_id: str, text: str) -> dict:
+    """Fluxo completo de uma mensagem de texto (ou áudio já transcrito)"""
+    pending = await get_pending(user_id)
 
-    print(f"DEBUG COMPLETO: {pending}")
+    log.debug("DEBUG COMPLETO: %s", pending)
 
     # ----------------------------------
     # 1. Lógica de Estados Pendentes
@@ -85,7 +296,7 @@ def receive_message(msg: Message):
         # PASSO: Preencher Meio de Pagamento (PRIMEIRO!)
         meio_pendente = pending.get("meio")
         if not meio_pendente or str(meio_pendente).lower() in ["none", "pendente"]:
-            texto = msg.text.strip().title()
+            texto = text.strip().title()
             if texto == "1":
                 texto = "Pix"
             elif texto == "2":
@@ -93,10 +304,19 @@ def receive_message(msg: Message):
             elif texto == "3":
                 texto = "Crédito"
 
+            if pending.get("itens"):
+                # Lote: o meio vale para os itens que não disseram o seu
+                for item in pending["itens"]:
+                    if item.get("meio") == "Pendente":
+                        item["meio"] = texto
+                salvar_transacoes(pending["itens"])
+                await clear_pending(user_id)
+                return {"reply": format_lote_msg(pending["itens"])}
+
             pending["meio"] = texto
-            if "Crédito" in texto:
+            if "Crédito" in texto and not pending.get("parcelas_informadas"):
                 pending["parcelado"] = "Pendente"
-                set_pending(user_id, pending)
+                await set_pending(user_id, pending)
                 return {
                     "reply": (
                         "💳 *CARTÃO DE CRÉDITO SELECIONADO*\n"
@@ -108,46 +328,72 @@ def receive_message(msg: Message):
                     )
                 }
 
-            save_to_api(pending)
+            salvar_transacao(pending)
             msg_final = format_success_msg(pending)
-            clear_pending(user_id)
+            await clear_pending(user_id)
             return {"reply": msg_final}
 
         # PASSO: Preencher Parcelas (DEPOIS!)
         if str(pending.get("parcelado")).lower() == "pendente":
             try:
-                vezes = int(msg.text.strip())
+                vezes = int(text.strip())
                 pending["total_parcelas"] = vezes
                 pending["parcelado"] = "Sim" if vezes > 1 else "Não"
 
-                save_to_api(pending)
+                salvar_transacao(pending)
                 msg_final = format_success_msg(pending)
-                clear_pending(user_id)
+                await clear_pending(user_id)
                 return {"reply": msg_final}
             except:
                 return {"reply": "❌ Por favor, digite apenas o número de parcelas (ex: 3)."}
 
     # ----------------------------------
-    # 2. Comandos (Resumo)
+    # 2. Comandos (Resumo / Extrato)
     # ----------------------------------
 
-    texto_limpo = msg.text.strip().lower()
+    texto_limpo = text.strip().lower()
     # Comando: Cancelar
     if texto_limpo in ["/cancelar", "cancelar", "/cancel", "cancel"]:
-        clear_pending(user_id)
+        await clear_pending(user_id)
         return {
             "reply": (
                 "❌ *Operação Cancelada*\n\n"
                 "Tudo foi limpo! Pode enviar uma nova transação. 😊"
             )
         }
-    if texto_limpo == "/resumo":
+    comando = RE_COMANDO_PERIODO.match(texto_limpo)
+    if comando:
+        nome, mes, ano = comando.group(1), comando.group(2), comando.group(3)
+        agora = datetime.now()
+        mes = int(mes) if mes else agora.month
+        ano = int(ano) if ano else agora.year
+        if not 1 <= mes <= 12:
+            return {"reply": "🤔 Mês inválido. Use por exemplo: /resumo 03/2026"}
+
+        if nome == "/extrato":
+            return {"reply": format_extrato(ledger.extrato(user_id, mes, ano), mes, ano)}
+
         try:
-            total, cats = get_month_summary()
-            resumo_msg = f"📊 *RESUMO DE {datetime.now().month}/{datetime.now().year}*\n\n💰 *Total:* R$ {total:.2f}\n\n📂 *Categorias:*\n"
+            # Livro-razão local só para meses conferidos com a planilha;
+            # nos demais, a API (com o que ainda está na outbox somado)
+            aviso = ""
+            if ledger.mes_coberto(mes, ano):
+                total, cats = ledger.resumo(mes, ano)
+            else:
+                try:
+                    total, cats = await get_month_summary(mes, ano)
+                    ledger.conferir_cobertura(mes, ano, total, cats)
+                    for c, v in ledger.gastos_por_envio(mes, ano, sincronizada=False).items():
+                        cats[c] = round(cats.get(c, 0.0) + v, 2)
+                        total += v
+                except CircuitoAberto:
+                    # Planilha fora do ar: responde na hora com o que há localmente
+                    total, cats = ledger.resumo(mes, ano)
+                    aviso = "\n⚠️ _Planilha indisponível: resumo só com os registros locais._"
+            resumo_msg = f"📊 *RESUMO DE {mes}/{ano}*\n\n💰 *Total:* R$ {total:.2f}\n\n📂 *Categorias:*\n"
             for c, v in sorted(cats.items(), key=lambda x: x[1], reverse=True):
                 resumo_msg += f"• {c}: R$ {v:.2f}\n"
-            return {"reply": resumo_msg}
+            return {"reply": resumo_msg + aviso}
         except:
             return {"reply": "⚠️ Erro ao gerar resumo."}
 
@@ -155,62 +401,33 @@ def receive_message(msg: Message):
     # 3. Lógica para Nova Mensagem
     # ----------------------------------
     try:
-        parsed = parse_message(msg.text)
+        # "uber 20, almoço 35 e mercado 120": vários lançamentos, uma resposta
+        itens = dividir_itens(text)
+        if len(itens) > 1:
+            return await processar_varios(user_id, itens)
+
+        # Sem orçamento de GPT: categoriza só com regras/modelo local
+        parsed = await parse_message(
+            text, ao_refinar=partial(refinar_categoria, user_id),
+            permitir_gpt=partial(limites.llm.permitir, user_id))
+        parsed["user_id"] = user_id
 
         # --- BLOCO PARA SALVAR RECEITA DIRETO ---
         if parsed.get("tipo") == "RECEITA":
             parsed["meio"] = parsed.get("meio") if parsed.get(
                 "meio") and parsed.get("meio") != "Pendente" else "Pix"
             parsed["subcategoria"] = parsed.get("categoria", "Receita")
-            save_to_api(parsed)
+            salvar_transacao(parsed)
             return {"reply": format_success_msg(parsed)}
 
-        # --- SE FALAR "CRÉDITO" NA FRASE, SALVA DIRETO EM 1X ---
+        # --- CRÉDITO NA FRASE: SALVA DIRETO (EM 1X OU NAS PARCELAS DITAS, "EM 3X") ---
         if parsed.get("tipo") == "GASTO" and parsed.get("meio") == "Crédito":
-            parsed["parcelado"] = "Não"
-            parsed["total_parcelas"] = 1
-            save_to_api(parsed)
+            salvar_transacao(parsed)
             return {"reply": format_success_msg(parsed)}
 
-        # FORÇAR RECEITA MANUALMENTE
-        palavras_receita = ["recebi", "ganhei",
-                            "salário", "salario", "entrada", "pix de"]
-        if any(palavra in texto_limpo for palavra in palavras_receita):
-            parsed["tipo"] = "RECEITA"
-            if parsed["valor"] == 0:
-                import re
-                numeros = re.findall(r'\d+', texto_limpo)
-                if numeros:
-                    parsed["valor"] = float(numeros[0])
-
-        print(f"DEBUG IA: {parsed}")
-
-        desc_baixa = str(parsed.get("descricao", "")).lower()
-
-        if "farmácia" in desc_baixa or "remédio" in desc_baixa:
-            parsed["categoria"] = "Saúde"
-            parsed["subcategoria"] = "Farmácia"
-        elif "uber" in desc_baixa or "99" in desc_baixa:
-            parsed["categoria"] = "Transporte"
-            parsed["subcategoria"] = "Aplicativo"
-
-        if "shopee" in desc_baixa or "shoope" in desc_baixa:
-            parsed["categoria"] = "Shopping"
-            parsed["subcategoria"] = "Shopee"
-        elif "mercado livre" in desc_baixa or "mercadolivre" in desc_baixa:
-            parsed["categoria"] = "Shopping"
-            parsed["subcategoria"] = "Mercado Livre"
-        elif "aliexpress" in desc_baixa or "aliespress" in desc_baixa:
-            parsed["categoria"] = "Shopping"
-            parsed["subcategoria"] = "AliExpress"
-        elif "amazon" in desc_baixa:
-            parsed["categoria"] = "Shopping"
-            parsed["subcategoria"] = "Amazon"
-
-        if parsed.get("subcategoria") == parsed.get("categoria"):
-            detalhe = str(parsed.get("descricao", "")).strip().capitalize()
-            if detalhe:
-                parsed["subcategoria"] = detalhe
+        log.debug("DEBUG IA: %s", parsed)
+
+        ajustar_subcategoria(parsed)
 
         valor = float(parsed.get("valor", 0))
         if valor <= 0:
@@ -218,7 +435,7 @@ def receive_message(msg: Message):
 
         meio_novo = parsed.get("meio")
         if not meio_novo or str(meio_novo).lower() in ["none", "pendente"]:
-            set_pending(user_id, parsed)
+            await set_pending(user_id, parsed)
             return {
                 "reply": (
                     f"✨ *Gasto Capturado!* ✨\n\n"
@@ -235,7 +452,7 @@ def receive_message(msg: Message):
             }
 
         if "Crédito" in str(parsed.get("meio")) and str(parsed.get("parcelado")).lower() == "pendente":
-            set_pending(user_id, parsed)
+            await set_pending(user_id, parsed)
             return {
                 "reply": (
                     "💳 *CARTÃO DE CRÉDITO SELECIONADO*\n"
@@ -247,43 +464,289 @@ def receive_message(msg: Message):
                 )
             }
 
-        save_to_api(parsed)
+        salvar_transacao(parsed)
         return {"reply": format_success_msg(parsed)}
 
     except Exception as e:
-        print(f"Erro: {e}")
-        return {"reply": "❌ Erro interno. Tente novamente."}
+        log.exception("Erro: %s", e)
+        return {"reply": MSG_ERRO_INTERNO}
+
+
+async def processar_varios(user_id: str, textos: List[str]) -> dict:
+    """
+    Vários lançamentos na mesma mensagem. Os itens são interpretados juntos
+    (as consultas ao GPT que sobrarem caem no mesmo micro-lote), o meio dito
+    uma vez vale para todos e a gravação sai num lote só. Crédito sem
+    parcelas ditas vai à vista: não há pergunta de parcelas item a item.
+    """
+    itens = await asyncio.gather(*(
+        parse_message(texto, ao_refinar=partial(refinar_categoria, user_id),
+                      permitir_gpt=partial(limites.llm.permitir, user_id))
+        for texto in textos
+    ))
+
+    # "..., mercado 120 no débito": um único meio citado vale para o resto
+    meios = {t["meio"] for t in itens if t.get("meio") != "Pendente"}
+    meio_comum = meios.pop() if len(meios) == 1 else None
+
+    for t in itens:
+        t["user_id"] = user_id
+        if t.get("meio") == "Pendente" and meio_comum:
+            t["meio"] = meio_comum
+        if t.get("tipo") == "RECEITA":
+            if t.get("meio") == "Pendente":
+                t["meio"] = "Pix"
+            t["subcategoria"] = t.get("categoria", "Receita")
+        else:
+            ajustar_subcategoria(t)
+
+    if any(t.get("meio") == "Pendente" for t in itens):
+        await set_pending(user_id, {"itens": itens, "meio": "Pendente"})
+        total = sum(float(t.get("valor", 0)) for t in itens)
+        linhas = "".join(
+            f"• R$ {float(t.get('valor', 0)):.2f} _{t.get('categoria')}_ — {t.get('descricao')}\n"
+            for t in itens)
+        return {
+            "reply": (
+                f"✨ *{len(itens)} Lançamentos Capturados!* ✨\n\n"
+                f"{linhas}\n"
+                f"💰 *Total:* `R$ {total:.2f}`\n\n"
+                "━━━━━━━━━━━━━━━━━━\n"
+                "💳 *Qual o meio de pagamento?*\n\n"
+                "1️⃣  *Pix*\n"
+                "2️⃣  *Débito*\n"
+                "3️⃣  *Crédito*\n\n"
+                "👉 _Responda com o número ou o nome._"
+            )
+        }
+
+    salvar_transacoes(itens)
+    return {"reply": format_lote_msg(itens)}
+
+
+def _pode_guardar(resposta: dict) -> bool:
+    """Erros não ficam registrados: o reenvio da mensagem tenta de novo"""
+    return resposta.get("reply") != MSG_ERRO_INTERNO
+
+
+async def _responder(user_id: str, text: str, message_id: Optional[str], audio: bool = False):
+    """Processa uma vez por message_id (reenvio devolve a resposta guardada)"""
+    async def processar():
+        resposta = await processar_mensagem(user_id, text)
+        return {"text": text, **resposta} if audio else resposta
+
+    return await ja_respondidas.executar_uma_vez(
+        user_id, message_id, processar, guardar=_pode_guardar)
+
+
+def _limite_mensagens(user_id: str) -> Optional[JSONResponse]:
+    """Resposta rápida (sem fila, sem GPT) para quem passou do limite de mensagens"""
+    if limites.mensagens.permitir(user_id):
+        return None
+    return JSONResponse(status_code=429, content={"reply": MSG_LIMITE_MENSAGENS})
+
+
+async def atender(user_id: str, text: str, message_id: Optional[str] = None, audio: bool = False):
+    """Processa a mensagem na vez do usuário (ordem de chegada preservada)"""
+    try:
+        return await agendador.executar(user_id, _responder, user_id, text, message_id, audio)
+    except FilaCheia:
+        return JSONResponse(status_code=429, content={"reply": MSG_FILA_CHEIA})
+
+
+@app.post("/message")
+async def receive_message(msg: Message):
+    # Reenvio de mensagem já respondida não gasta do limite (nem leva 429)
+    anterior = await ja_respondidas.obter(msg.user_id, msg.message_id)
+    if anterior is not None:
+        return anterior
+    return _limite_mensagens(msg.user_id) or await atender(msg.user_id, msg.text, msg.message_id)
+
+
+@app.post("/messages")
+async def receive_messages(lote: MessageBatch):
+    """
+    Várias mensagens (ex.: backlog entregue pelo gateway ao reconectar).
+    Mesma ordem por usuário de /message, usuários em paralelo; as
+    categorias do lote inteiro são buscadas antes, de uma vez.
+    Respostas na ordem de entrada.
+    """
+    mensagens = lote.messages
+    if len(mensagens) > BATCH_MAX_MESSAGES:
+        return JSONResponse(status_code=413, content={
+            "error": f"Máximo de {BATCH_MAX_MESSAGES} mensagens por lote"})
+
+    # Replay não passa pelo limite de mensagens; o GPT segue o orçamento global
+    await preaquecer_categorias([m.text for m in mensagens],
+                                permitir_gpt=partial(limites.llm.permitir, None))
+
+    por_usuario = {}
+    for indice, m in enumerate(mensagens):
+        por_usuario.setdefault(m.user_id, []).append(indice)
+    respostas: List[Optional[dict]] = [None] * len(mensagens)
+
+    async def em_sequencia(user_id, indices):
+        for indice in indices:
+            m = mensagens[indice]
+            respostas[indice] = await _responder(user_id, m.text, m.message_id)
+
+    async def na_vez(user_id, indices):
+        # Um lugar na fila do usuário para toda a sequência dele
+        try:
+            await agendador.executar(user_id, em_sequencia, user_id, indices)
+        except FilaCheia:
+            for indice in indices:
+                respostas[indice] = {"reply": MSG_FILA_CHEIA, "error": "fila_cheia"}
+
+    await asyncio.gather(*(na_vez(u, indices) for u, indices in por_usuario.items()))
+
+    return {"replies": [{"user_id": m.user_id, **r} for m, r in zip(mensagens, respostas)]}
 
 # ======================================================
 # ÁUDIO (WHATSAPP / WHISPER)
 # ======================================================
 
 
+@app.middleware("http")
+async def medir_primeira_requisicao(request: Request, call_next):
+    """Latência da primeira requisição após o cold start"""
+    if not ciclo_vida.aguardando_primeira_requisicao():
+        return await call_next(request)
+    inicio = time.perf_counter()
+    response = await call_next(request)
+    ciclo_vida.registrar_requisicao(request.url.path, time.perf_counter() - inicio)
+    return response
+
+
+@app.middleware("http")
+async def limitar_upload_extrato(request: Request, call_next):
+    """Recusa extratos grandes antes de ler o corpo"""
+    if request.url.path == "/importar":
+        tamanho = request.headers.get("content-length")
+        if tamanho and tamanho.isdigit() and int(tamanho) > IMPORT_MAX_BYTES + 4096:
+            return JSONResponse(status_code=413, content={"error": "Extrato grande demais"})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def limitar_upload_audio(request: Request, call_next):
+    """Recusa uploads grandes antes de ler o corpo"""
+    if request.url.path.startswith("/audio"):
+        # base64 ocupa 4/3 do binário; folga para cabeçalhos do multipart/JSON
+        limite = AUDIO_MAX_BYTES * 4 // 3 if request.url.path.endswith("/base64") else AUDIO_MAX_BYTES
+        tamanho = request.headers.get("content-length")
+        if tamanho and tamanho.isdigit() and int(tamanho) > limite + 4096:
+            return JSONResponse(status_code=413, content={"error": "Áudio grande demais"})
+    return await call_next(request)
+
+
+async def _transcrever_upload(arquivo, nome, user_id: Optional[str] = None):
+    """
+    Transcreve (com cache por hash) ou devolve uma resposta de erro.
+    Áudio inédito consome do orçamento de segundos de Whisper (do usuário e global).
+    """
+    client = get_openai_client()
+    if not client:
+        return None, {"error": "OpenAI API key não configurada"}
+
+    tamanho = tamanho_arquivo(arquivo)
+    if tamanho > AUDIO_MAX_BYTES:
+        return None, JSONResponse(status_code=413, content={"error": "Áudio grande demais"})
+
+    segundos = max(1.0, tamanho / AUDIO_BYTES_PER_SECOND)
+    try:
+        texto = await transcritor.transcrever_com_cache(
+            client, arquivo, nome, permitir=partial(limites.stt.permitir, user_id, segundos))
+        return texto, None
+    except LimiteExcedido:
+        return None, JSONResponse(status_code=429, content={
+            "error": "Limite de transcrição atingido", "reply": MSG_LIMITE_AUDIO})
+    except Exception as e:
+        log.error("❌ ERRO STT: %s", e)
+        return None, {"error": "Erro ao transcrever áudio"}
+
+
 @app.post("/audio")
 async def transcribe_audio(audio: UploadFile = File(...)):
-    if not client:
-        return {"error": "OpenAI API key não configurada"}
+    # O upload já chega em SpooledTemporaryFile (memória -> disco):
+    # repassa o próprio arquivo, sem ler tudo para a memória
+    try:
+        texto, erro = await _transcrever_upload(audio.file, audio.filename or "audio.ogg")
+        return erro or {"text": texto}
+    finally:
+        await audio.close()
+
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".ogg") as tmp:
-        tmp.write(await audio.read())
-        tmp_path = tmp.name
+@app.post("/audio/mensagem")
+async def receive_audio_message(user_id: str = Form(...), audio: UploadFile = File(...),
+                                message_id: Optional[str] = Form(None)):
+    """Áudio -> transcrição -> transação, em uma chamada só"""
+    anterior = await ja_respondidas.obter(user_id, message_id)
+    recusa = None if anterior is not None else _limite_mensagens(user_id)
+    if anterior is not None or recusa is not None:
+        await audio.close()
+        return anterior or recusa
 
     try:
-        with open(tmp_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                file=audio_file,
-                model="whisper-1"
-            )
-        return {"text": transcription.text}
+        texto, erro = await _transcrever_upload(
+            audio.file, audio.filename or "audio.ogg", user_id)
+    finally:
+        await audio.close()
+    if erro:
+        return erro
+
+    return await atender(user_id, texto, message_id, audio=True)
+
+
+@app.post("/audio/mensagem/base64")
+async def receive_audio_message_base64(msg: AudioMessage):
+    """Mesmo fluxo, com a mídia em base64 como entregue pelo whatsapp-web.js"""
+    anterior = await ja_respondidas.obter(msg.user_id, msg.message_id)
+    if anterior is not None:
+        return anterior
+    recusa = _limite_mensagens(msg.user_id)
+    if recusa is not None:
+        return recusa
+
+    try:
+        conteudo = base64.b64decode(msg.data, validate=True)
+    except (binascii.Error, ValueError):
+        return JSONResponse(status_code=400, content={"error": "Áudio em base64 inválido"})
+
+    extensao = (msg.mimetype or "audio/ogg").split(";")[0].split("/")[-1]
+    texto, erro = await _transcrever_upload(
+        io.BytesIO(conteudo), f"audio.{extensao}", msg.user_id)
+    if erro:
+        return erro
+
+    return await atender(msg.user_id, texto, msg.message_id, audio=True)
+
+
+# ======================================================
+# IMPORTAÇÃO DE EXTRATO (CSV / OFX)
+# ======================================================
+
+
+@app.post("/importar")
+async def importar_extrato(user_id: str = Form(...), arquivo: UploadFile = File(...),
+                           formato: Optional[str] = Form(None), cartao: bool = Form(False),
+                           meio: Optional[str] = Form(None)):
+    """
+    Importa um extrato inteiro de uma vez (ver importador.py).
+    Descrições inéditas consomem do orçamento global de GPT; estourou,
+    o resto do extrato é categorizado só por regras/classificador.
+    """
+    try:
+        return await importar(
+            arquivo.file, user_id, arquivo.filename or "", formato, cartao, meio,
+            permitir_gpt=partial(limites.llm.permitir, None))
+    except ExtratoInvalido as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
-        print("❌ ERRO STT:", str(e))
-        return {"error": "Erro ao transcrever áudio"}
+        log.error("❌ Erro na importação de %s: %s", user_id, e)
+        return JSONResponse(status_code=500, content={"error": "Erro ao importar extrato"})
     finally:
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except:
-            pass
+        await arquivo.close()
 
 
 @app.get("/")
@@ -293,3 +756,70 @@ def root():
         "message": "Bot WhatsApp + Planilha Financeira",
         "version": "2.0"
     }
+
+
+@app.get("/ready")
+def ready():
+    """Prontidão para a plataforma: 200 pronto, 503 ainda aquecendo ou sem armazenamento"""
+    pronto, detalhes = ciclo_vida.prontidao()
+    return JSONResponse(status_code=200 if pronto else 503, content=detalhes)
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "cache_categorias": cache_categorias.estatisticas(),
+        "classificador": classificador.estatisticas(),
+        "lote_gpt": lote_gpt.estatisticas(),
+        "outbox_pendentes": pendentes(),
+        "outbox_recusadas": recusadas(),
+        "ledger_reconciliacao": ledger.ultima_reconciliacao,
+        "transcricao": transcritor.estatisticas(),
+        "agendador": agendador.estatisticas(),
+        "mensagens_repetidas": ja_respondidas.estatisticas(),
+        "api_planilha": saude_api.estatisticas(),
+        "limites": limites.estatisticas(),
+        "inicializacao": ciclo_vida.estatisticas()
+    }
+
+
+# Medidores lidos na hora da coleta
+
+
+def _estados_pendentes():
+    # Redis não informa (contar exigiria varrer o keyspace)
+    total = user_states.tamanho()
+    return {(): total} if total is not None else {}
+
+
+Medidor("bot_estados_pendentes", "Conversas com pergunta pendente", funcao=_estados_pendentes)
+Medidor("bot_outbox_pendentes", "Parcelas aguardando envio para a planilha",
+        funcao=lambda: {(): pendentes()})
+Medidor("bot_outbox_recusadas", "Parcelas desistidas (recusadas pela API ou sem tentativas)",
+        funcao=lambda: {(): recusadas()})
+Medidor("bot_stt_fila", "Áudios aguardando vaga no Whisper",
+        funcao=lambda: {(): transcritor.na_fila})
+Medidor("bot_stt_em_andamento", "Transcrições em andamento",
+        funcao=lambda: {(): transcritor.em_andamento})
+Medidor("bot_agendador", "Mensagens no agendador por usuário", ["contador"],
+        funcao=lambda: {(k,): v for k, v in agendador.estatisticas().items()})
+Medidor("bot_api_disjuntor", "Disjuntor da API da planilha (0 fechado, 1 meio-aberto, 2 aberto)",
+        funcao=lambda: {(): {"fechado": 0, "meio_aberto": 1, "aberto": 2}[saude_api.estado]})
+Medidor("bot_api_timeout_segundos", "Timeout adaptativo atual da API da planilha",
+        funcao=lambda: {(): saude_api.timeout()})
+Medidor("bot_cache_categorias", "Contadores do cache de categorias", ["contador"],
+        funcao=lambda: {(k,): v for k, v in cache_categorias.estatisticas().items()})
+Medidor("bot_classificador", "Contadores do classificador local", ["contador"],
+        funcao=lambda: {(k,): v for k, v in classificador.estatisticas().items()
+                        if not isinstance(v, bool)})
+Medidor("bot_lote_gpt", "Contadores dos micro-lotes de categorização", ["contador"],
+        funcao=lambda: {(k,): v for k, v in lote_gpt.estatisticas().items()})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(
+        exportar_metricas(), media_type="text/plain; version=0.0.4")
+
+
+ciclo_vida.registrar_etapa("importacao", time.perf_counter() - _INICIO_IMPORT)
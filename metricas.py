@@ -0,0 +1,173 @@
+import bisect
+import functools
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# ======================================================
+# MÉTRICAS (FORMATO PROMETHEUS, SEM DEPENDÊNCIAS)
+# ======================================================
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _rotulos(nomes: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Iterable[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        registro.append(self)
+
+    def cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *rotulos: str, valor: float = 1):
+        self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def valor(self, *rotulos: str) -> float:
+        return self._valores.get(rotulos, 0)
+
+    def exportar(self) -> List[str]:
+        return self.cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, r)} {v}" for r, v in self._valores.items()]
+
+
+class Medidor(_Metrica):
+    """Gauge: valor definido com set() ou lido na hora por uma função"""
+    tipo = "gauge"
+
+    def __init__(self, nome, ajuda, rotulos=(),
+                 funcao: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._funcao = funcao
+
+    def set(self, valor: float, *rotulos: str):
+        self._valores[rotulos] = valor
+
+    def exportar(self) -> List[str]:
+        valores = self._valores
+        if self._funcao is not None:
+            try:
+                valores = self._funcao()
+            except Exception:
+                valores = {}
+        return self.cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, r)} {v}" for r, v in valores.items()]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(buckets)
+        # rótulos -> [contagens por bucket..., soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observar(self, valor: float, *rotulos: str):
+        serie = self._series.get(rotulos)
+        if serie is None:
+            serie = self._series[rotulos] = [0] * len(self.buckets) + [0.0, 0]
+        indice = bisect.bisect_left(self.buckets, valor)
+        if indice < len(self.buckets):
+            serie[indice] += 1
+        serie[-2] += valor
+        serie[-1] += 1
+
+    def exportar(self) -> List[str]:
+        linhas = self.cabecalho()
+        for r, serie in self._series.items():
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, serie):
+                acumulado += contagem
+                le = _rotulos(self.rotulos, r, 'le="%s"' % limite)
+                linhas.append(f"{self.nome}_bucket{le} {acumulado}")
+            le = _rotulos(self.rotulos, r, 'le="+Inf"')
+            linhas.append(f"{self.nome}_bucket{le} {serie[-1]}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, r)} {serie[-2]}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, r)} {serie[-1]}")
+        return linhas
+
+
+registro: List[_Metrica] = []
+
+
+def exportar() -> str:
+    """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)"""
+    linhas: List[str] = []
+    for metrica in registro:
+        linhas.extend(metrica.exportar())
+    return "\n".join(linhas) + "\n"
+
+# ======================================================
+# MÉTRICAS DO BOT
+# ======================================================
+
+
+latencia = Histograma(
+    "bot_estagio_segundos", "Latência por estágio do processamento", ["estagio"])
+falhas = Contador(
+    "bot_falhas_total", "Falhas por estágio", ["estagio"])
+retries = Contador(
+    "bot_retries_total", "Novas tentativas por operação", ["operacao"])
+hedges = Contador(
+    "bot_leituras_duplicadas_total", "Leituras lentas duplicadas (hedge)", ["operacao"])
+openai_tokens = Contador(
+    "bot_openai_tokens_total", "Tokens consumidos na OpenAI", ["uso", "tipo"])
+openai_chamadas = Contador(
+    "bot_openai_chamadas_total", "Chamadas à OpenAI", ["uso"])
+categorias_fonte = Contador(
+    "bot_categorizacao_total", "Categorizações por fonte (regra, modelo, gpt, fallback)", ["fonte"])
+
+
+def medir(estagio: str):
+    """Decorator para corrotinas: latência no histograma, exceções no contador de falhas"""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        async def envolvida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await funcao(*args, **kwargs)
+            except Exception:
+                falhas.inc(estagio)
+                raise
+            finally:
+                latencia.observar(time.perf_counter() - inicio, estagio)
+        return envolvida
+    return decorador
+
+
+def registrar_uso_openai(uso: str, response):
+    """Conta a chamada e os tokens de prompt/completion da resposta"""
+    openai_chamadas.inc(uso)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        openai_tokens.inc(uso, "prompt", valor=getattr(usage, "prompt_tokens", 0) or 0)
+        openai_tokens.inc(uso, "completion", valor=getattr(usage, "completion_tokens", 0) or 0)
+        # Parte do prompt servida do cache de prefixo da OpenAI
+        detalhes = getattr(usage, "prompt_tokens_details", None)
+        cacheados = getattr(detalhes, "cached_tokens", 0) if detalhes is not None else 0
+        if cacheados:
+            openai_tokens.inc(uso, "cached", valor=cacheados)
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import random
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from api_client import montar_transacoes, enviar_lote, saude_api
+import ledger
+from log import log
+from metricas import retries
+from config import (
+    OUTBOX_PATH, OUTBOX_BATCH_SIZE,
+    OUTBOX_POLL_INTERVAL, OUTBOX_MAX_BACKOFF, OUTBOX_MAX_ATTEMPTS
+)
+
+# ======================================================
+# OUTBOX DURÁVEL (SQLITE WAL) + FLUSHER EM BACKGROUND
+# ======================================================
+
+_conn: Optional[sqlite3.Connection] = None
+_acordar: Optional[asyncio.Event] = None
+_tarefa: Optional[asyncio.Task] = None
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(
+            OUTBOX_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chave TEXT,
+                transacao_id TEXT,
+                payload TEXT NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_tentativa REAL NOT NULL,
+                criado_em REAL NOT NULL,
+                ultimo_erro TEXT
+            )
+        """)
+        _migrar(_conn)
+        _conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_proxima ON outbox (proxima_tentativa)")
+        _conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_chave ON outbox (chave)")
+        _conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_transacao ON outbox (transacao_id)")
+        # Dead-letter: recusadas pela API ou que esgotaram as tentativas
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS recusadas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chave TEXT,
+                transacao_id TEXT,
+                payload TEXT NOT NULL,
+                tentativas INTEGER NOT NULL,
+                motivo TEXT NOT NULL,
+                recusada_em REAL NOT NULL
+            )
+        """)
+    return _conn
+
+
+def _migrar(conn: sqlite3.Connection):
+    """
+    Outbox antiga guardava a transação inteira por linha (sem chave).
+    Expande essas linhas em parcelas com chave de idempotência.
+    """
+    colunas = [c[1] for c in conn.execute("PRAGMA table_info(outbox)")]
+    if "chave" not in colunas:
+        conn.execute("ALTER TABLE outbox ADD COLUMN chave TEXT")
+    if "transacao_id" not in colunas:
+        conn.execute("ALTER TABLE outbox ADD COLUMN transacao_id TEXT")
+
+    legado = conn.execute(
+        "SELECT id, payload FROM outbox WHERE chave IS NULL").fetchall()
+    for linha_id, payload in legado:
+        _inserir(conn, [json.loads(payload)])
+        conn.execute("DELETE FROM outbox WHERE id = ?", (linha_id,))
+
+
+def _json_default(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _inserir(conn: sqlite3.Connection, datas: List[Dict[str, Any]], adiar: float = 0) -> int:
+    agora = time.time()
+    linhas = [
+        (chave, data.get("id"), json.dumps(payload, default=_json_default), agora + adiar, agora)
+        for data in datas
+        for chave, payload in montar_transacoes(data)
+    ]
+    # Todas as parcelas entram juntas (transação única no SQLite).
+    # Mesma chave = mesma parcela: reenfileirar nunca duplica.
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "INSERT OR IGNORE INTO outbox "
+            "(chave, transacao_id, payload, proxima_tentativa, criado_em) "
+            "VALUES (?, ?, ?, ?, ?)",
+            linhas
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(linhas)
+
+
+def enfileirar(data: Dict[str, Any], adiar: float = 0) -> int:
+    """
+    Monta o cronograma de parcelas e grava cada uma na outbox.
+    Retorna quantas linhas foram enfileiradas (já seguras em disco).
+    Com `adiar`, as linhas só vencem depois desses segundos: quem enfileira
+    vai enviar por conta própria e a outbox fica só de rede de segurança.
+    """
+    total = _inserir(_get_conn(), [data], adiar)
+    if _acordar is not None and not adiar:
+        _acordar.set()
+    return total
+
+
+def enfileirar_lote(datas: List[Dict[str, Any]], adiar: float = 0) -> int:
+    """
+    Várias transações (ex.: itens de uma mesma mensagem) numa gravação só;
+    o flusher acorda uma vez e as envia juntas pela rota de lote
+    """
+    total = _inserir(_get_conn(), datas, adiar)
+    if _acordar is not None and not adiar:
+        _acordar.set()
+    return total
+
+
+def confirmar_envio(chaves: List[str]):
+    """Parcelas enviadas fora do flusher (ex.: importação): saem da outbox"""
+    conn = _get_conn()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany("DELETE FROM outbox WHERE chave = ?", [(c,) for c in chaves])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    ledger.marcar_sincronizadas(chaves)
+
+
+def atualizar_categoria(transacao_id: str, categoria: str, subcategoria: str) -> int:
+    """
+    Corrige a categoria das parcelas ainda não enviadas de uma transação
+    e as libera para envio (estavam retidas esperando o refinamento).
+    Retorna quantas linhas foram alteradas (0 = já foi para a planilha).
+    """
+    cursor = _get_conn().execute(
+        "UPDATE outbox SET payload = json_set(payload, '$.categoria', ?, '$.subcategoria', ?), "
+        # Linhas em backoff por falha de envio mantêm o agendamento
+        "proxima_tentativa = CASE WHEN tentativas = 0 THEN ? ELSE proxima_tentativa END "
+        "WHERE transacao_id = ?",
+        (categoria, subcategoria, time.time(), transacao_id)
+    )
+    if cursor.rowcount and _acordar is not None:
+        _acordar.set()
+    return cursor.rowcount
+
+
+def liberar(transacao_id: str) -> int:
+    """Refinamento não veio: parcelas retidas seguem com a categoria provisória"""
+    cursor = _get_conn().execute(
+        "UPDATE outbox SET proxima_tentativa = ? WHERE transacao_id = ? AND tentativas = 0",
+        (time.time(), transacao_id)
+    )
+    if cursor.rowcount and _acordar is not None:
+        _acordar.set()
+    return cursor.rowcount
+
+
+def pendentes() -> int:
+    """Quantidade de transações aguardando envio"""
+    return _get_conn().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+def recusadas() -> int:
+    """Parcelas que saíram da fila sem chegar na planilha (ver tabela recusadas)"""
+    return _get_conn().execute("SELECT COUNT(*) FROM recusadas").fetchone()[0]
+
+
+def _backoff(tentativas: int) -> float:
+    """Backoff exponencial com jitter, limitado a OUTBOX_MAX_BACKOFF"""
+    base = min(OUTBOX_MAX_BACKOFF, 2 ** tentativas)
+    return base * random.uniform(0.5, 1.0)
+
+
+def _recusar(conn: sqlite3.Connection, linha_id: int, chave: str, tentativas: int, motivo: str):
+    conn.execute("BEGIN")
+    try:
+        conn.execute(
+            "INSERT INTO recusadas (chave, transacao_id, payload, tentativas, motivo, recusada_em) "
+            "SELECT chave, transacao_id, payload, ?, ?, ? FROM outbox WHERE id = ?",
+            (tentativas, motivo, time.time(), linha_id)
+        )
+        conn.execute("DELETE FROM outbox WHERE id = ?", (linha_id,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    ledger.marcar_recusada(chave)
+    log.error("🚫 Outbox: parcela %s desistida (%s)", chave, motivo)
+
+
+def _concluir(linha_id: int, chave: str, tentativas: int, resultado: Optional[bool]):
+    conn = _get_conn()
+    if resultado:
+        conn.execute("DELETE FROM outbox WHERE id = ?", (linha_id,))
+        ledger.marcar_sincronizada(chave)
+    elif resultado is None:
+        _recusar(conn, linha_id, chave, tentativas + 1, "recusada pela API")
+    elif tentativas + 1 >= OUTBOX_MAX_ATTEMPTS:
+        _recusar(conn, linha_id, chave, tentativas + 1, f"{tentativas + 1} tentativas")
+    else:
+        tentativas += 1
+        conn.execute(
+            "UPDATE outbox SET tentativas = ?, proxima_tentativa = ?, ultimo_erro = ? WHERE id = ?",
+            (tentativas, time.time() + _backoff(tentativas), "falha no envio", linha_id)
+        )
+        retries.inc("outbox")
+        log.info("🔁 Outbox: envio %s falhou (%dx), reagendado", linha_id, tentativas)
+
+
+async def drenar(limite: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Envia um lote de transações vencidas (uma requisição de lote quando a
+    API suporta). Retorna quantas foram processadas (sucesso ou falha).
+    Com o disjuntor aberto não envia nem gasta tentativas das linhas.
+    """
+    if not saude_api.disponivel():
+        return 0
+
+    linhas = _get_conn().execute(
+        "SELECT id, chave, payload, tentativas FROM outbox "
+        "WHERE proxima_tentativa <= ? ORDER BY id LIMIT ?",
+        (time.time(), limite)
+    ).fetchall()
+
+    if linhas:
+        resultados = await enviar_lote(
+            [(chave, json.loads(payload)) for _, chave, payload, _ in linhas])
+        for (linha_id, chave, _, tentativas), resultado in zip(linhas, resultados):
+            _concluir(linha_id, chave, tentativas, resultado)
+    return len(linhas)
+
+
+async def _loop_flusher():
+    while True:
+        try:
+            processadas = await drenar()
+        except Exception as e:
+            log.error("❌ Erro no flusher da outbox: %s", e)
+            processadas = 0
+
+        # Lote cheio: continua drenando sem esperar
+        if processadas >= OUTBOX_BATCH_SIZE:
+            continue
+
+        _acordar.clear()
+        try:
+            await asyncio.wait_for(_acordar.wait(), timeout=OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def iniciar_flusher():
+    """Inicia o flusher em background (startup do app)"""
+    global _tarefa, _acordar
+    if _tarefa is None or _tarefa.done():
+        _acordar = asyncio.Event()
+        _tarefa = asyncio.create_task(_loop_flusher())
+
+
+async def parar_flusher():
+    """Para o flusher; o que não foi enviado continua na outbox"""
+    global _tarefa
+    if _tarefa is not None:
+        _tarefa.cancel()
+        try:
+            await _tarefa
+        except asyncio.CancelledError:
+            pass
+        _tarefa = None
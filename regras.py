@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from cache_categorias import remover_acentos
+from log import log
+from config import RULES_PATH, RULES_RELOAD_INTERVAL
+
+# ======================================================
+# MOTOR DE REGRAS POR PALAVRA-CHAVE
+# ======================================================
+# Todas as palavras-chave viram UMA regex em forma de trie,
+# compilada uma vez: o custo do match não cresce com o nº de regras.
+
+
+def _dobrar(texto: str) -> str:
+    """Minúscula, sem acentos e com espaços únicos"""
+    return " ".join(remover_acentos(texto.lower()).split())
+
+
+def _regex_trie(termos: List[str]) -> str:
+    """['uber', 'ubereats'] -> 'uber(?:eats)?'"""
+    trie: dict = {}
+    for termo in termos:
+        no = trie
+        for letra in termo:
+            no = no.setdefault(letra, {})
+        no[""] = {}
+
+    def montar(no: dict) -> str:
+        fim = "" in no
+        ramos = [re.escape(letra) + montar(filho)
+                 for letra, filho in sorted(no.items()) if letra]
+        if not ramos:
+            return ""
+        if len(ramos) == 1 and not fim:
+            return ramos[0]
+        grupo = "(?:" + "|".join(ramos) + ")"
+        return grupo + "?" if fim else grupo
+
+    return montar(trie)
+
+
+class MotorRegras:
+    """
+    Regras carregadas de um arquivo JSON:
+    [{"termos": [...], "categoria": "...", "subcategoria": "...", "prioridade": 0}]
+    Em caso de vários matches vence a maior prioridade (empate: o que aparece antes).
+    O arquivo é relido automaticamente quando muda.
+    """
+
+    def __init__(self, caminho: str, intervalo_recarga: float = 5.0):
+        self.caminho = caminho
+        self.intervalo_recarga = intervalo_recarga
+        self._mtime = None
+        self._verificado_em = 0.0
+        self._regex: Optional[re.Pattern] = None
+        self._regras: Dict[str, Tuple[str, str, int]] = {}
+        self.recarregar()
+
+    def compilar(self, regras: List[dict]):
+        """Compila a lista de regras e troca a atual de uma vez"""
+        por_termo: Dict[str, Tuple[str, str, int]] = {}
+        for regra in regras:
+            alvo = (regra["categoria"], regra.get("subcategoria") or regra["categoria"],
+                    int(regra.get("prioridade", 0)))
+            for termo in regra["termos"]:
+                termo = _dobrar(termo)
+                atual = por_termo.get(termo)
+                if termo and (atual is None or alvo[2] > atual[2]):
+                    por_termo[termo] = alvo
+
+        regex = None
+        if por_termo:
+            # Aceita plural simples: "lanche" casa com "lanches"
+            regex = re.compile(
+                r"\b(" + _regex_trie(list(por_termo)) + r")s?\b")
+
+        self._regex, self._regras = regex, por_termo
+
+    def recarregar(self) -> bool:
+        """Relê o arquivo se ele mudou. Regras inválidas mantêm as anteriores."""
+        self._verificado_em = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.caminho)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.caminho, encoding="utf-8") as f:
+                self.compilar(json.load(f))
+            self._mtime = mtime
+            log.info("📜 Regras carregadas: %d termos", len(self._regras))
+            return True
+        except Exception as e:
+            log.error("❌ Regras inválidas em %s: %s", self.caminho, e)
+            return False
+
+    def classificar(self, mensagem: str) -> Optional[Tuple[str, str]]:
+        """Retorna (categoria, subcategoria) da regra vencedora ou None"""
+        if time.monotonic() - self._verificado_em > self.intervalo_recarga:
+            self.recarregar()
+
+        regex, regras = self._regex, self._regras
+        if regex is None:
+            return None
+
+        melhor = None
+        for match in regex.finditer(_dobrar(mensagem)):
+            categoria, subcategoria, prioridade = regras[match.group(1)]
+            if melhor is None or prioridade > melhor[2]:
+                melhor = (categoria, subcategoria, prioridade)
+
+        return (melhor[0], melhor[1]) if melhor else None
+
+
+motor_regras = MotorRegras(RULES_PATH, RULES_RELOAD_INTERVAL)
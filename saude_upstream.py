@@ -0,0 +1,162 @@
+import random
+import time
+from typing import Optional
+
+from log import log
+
+# ======================================================
+# SAÚDE DO UPSTREAM: DISJUNTOR + TIMEOUT ADAPTATIVO
+# ======================================================
+# Visão única (por processo) de como a API está respondendo:
+# - disjuntor fechado -> aberto após N falhas seguidas; aberto, recusa na
+#   hora (CircuitoAberto) em vez de esperar timeouts; passado o tempo de
+#   espera, deixa UMA requisição de sonda (meio-aberto) decidir se fecha.
+# - timeout = média móvel da latência + 4 desvios (como o RTO do TCP),
+#   entre um mínimo e um máximo.
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+class CircuitoAberto(Exception):
+    """Upstream marcado como fora do ar: falha rápida, sem chamar a rede"""
+
+
+class SaudeUpstream:
+    def __init__(self, nome: str, limite_falhas: int, tempo_aberto: float,
+                 tempo_aberto_max: float, timeout_min: float, timeout_max: float):
+        self.nome = nome
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto_base = tempo_aberto
+        self.tempo_aberto_max = tempo_aberto_max
+        self.timeout_min = timeout_min
+        self.timeout_max = timeout_max
+
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self.aberturas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._sonda_em_voo = False
+
+        # Média móvel exponencial da latência e do desvio (segundos)
+        self.latencia_media: Optional[float] = None
+        self.latencia_desvio = 0.0
+
+        self.recusadas = 0
+        self.aberturas = 0
+
+    # ----------------------------------
+    # Disjuntor
+    # ----------------------------------
+
+    def disponivel(self) -> bool:
+        """Consulta sem efeito colateral: vale a pena tentar agora?"""
+        if self.estado == ABERTO:
+            return time.monotonic() >= self._aberto_ate
+        if self.estado == MEIO_ABERTO:
+            return not self._sonda_em_voo
+        return True
+
+    def permitir(self) -> bool:
+        """
+        Libera uma requisição ou levanta CircuitoAberto.
+        Retorna True se ela é a sonda do meio-aberto (repassar a registrar_falha).
+        """
+        if self.estado == ABERTO and time.monotonic() >= self._aberto_ate:
+            self.estado = MEIO_ABERTO
+            self._sonda_em_voo = False
+            log.info("🟡 %s: disjuntor meio-aberto, testando com uma requisição", self.nome)
+
+        if self.estado == FECHADO:
+            return False
+        if self.estado == MEIO_ABERTO and not self._sonda_em_voo:
+            self._sonda_em_voo = True
+            return True
+
+        self.recusadas += 1
+        raise CircuitoAberto(self.nome)
+
+    def registrar_sucesso(self, segundos: float):
+        self._observar_latencia(segundos)
+        self.falhas_seguidas = 0
+        if self.estado != FECHADO:
+            log.info("🟢 %s: disjuntor fechado, upstream respondendo", self.nome)
+        self.estado = FECHADO
+        self.aberturas_seguidas = 0
+        self._sonda_em_voo = False
+
+    def registrar_falha(self, segundos: Optional[float] = None, sonda: bool = False):
+        """
+        Abre só a partir do fechado (ao atingir o limite) ou quando a sonda
+        do meio-aberto falha. Falhas de requisições que já estavam em voo
+        quando o disjuntor abriu não reabrem nem aumentam a espera.
+        """
+        if segundos is not None:
+            self._observar_latencia(segundos)
+        if self.estado == FECHADO:
+            self.falhas_seguidas += 1
+            if self.falhas_seguidas >= self.limite_falhas:
+                self._abrir()
+        elif self.estado == MEIO_ABERTO and sonda:
+            self.falhas_seguidas += 1
+            self._abrir()
+
+    def liberar_sonda(self, sonda: bool = True):
+        """Requisição cancelada antes da resposta: outra pode sondar"""
+        if self.estado == MEIO_ABERTO and sonda:
+            self._sonda_em_voo = False
+
+    def _abrir(self):
+        # Cada reabertura seguida dobra a espera; o jitter entra antes do teto
+        espera = min(self.tempo_aberto_max,
+                     self.tempo_aberto_base * 2 ** min(self.aberturas_seguidas, 20)
+                     * random.uniform(0.8, 1.2))
+        self.estado = ABERTO
+        self._aberto_ate = time.monotonic() + espera
+        self._sonda_em_voo = False
+        self.aberturas += 1
+        self.aberturas_seguidas += 1
+        log.warning("🔴 %s: disjuntor aberto por %.1fs (%d falhas seguidas)",
+                    self.nome, espera, self.falhas_seguidas)
+
+    # ----------------------------------
+    # Latência, timeout e backoff
+    # ----------------------------------
+
+    def _observar_latencia(self, segundos: float):
+        if self.latencia_media is None:
+            self.latencia_media = segundos
+            self.latencia_desvio = segundos / 2
+            return
+        erro = segundos - self.latencia_media
+        self.latencia_media += 0.125 * erro
+        self.latencia_desvio += 0.25 * (abs(erro) - self.latencia_desvio)
+
+    def timeout(self) -> float:
+        """Timeout da próxima requisição; sem histórico, o máximo"""
+        if self.latencia_media is None:
+            return self.timeout_max
+        alvo = self.latencia_media + 4 * self.latencia_desvio
+        return max(self.timeout_min, min(self.timeout_max, alvo))
+
+    def atraso_hedge(self, minimo: float) -> float:
+        """Espera antes de duplicar uma leitura: bem acima do normal, não no timeout"""
+        if self.latencia_media is None:
+            return max(minimo, self.timeout_max / 4)
+        return max(minimo, self.latencia_media + 2 * self.latencia_desvio)
+
+    @staticmethod
+    def backoff(tentativa: int, base: float = 0.5, maximo: float = 10.0) -> float:
+        """Backoff exponencial com jitter completo"""
+        return random.uniform(0, min(maximo, base * 2 ** tentativa))
+
+    def estatisticas(self) -> dict:
+        return {
+            "estado": self.estado,
+            "falhas_seguidas": self.falhas_seguidas,
+            "aberturas": self.aberturas,
+            "recusadas": self.recusadas,
+            "latencia_media_ms": round((self.latencia_media or 0) * 1000, 1),
+            "timeout_s": round(self.timeout(), 2),
+        }
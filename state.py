@@ -1,20 +1,233 @@
-# Gerenciamento de estados dos usuários
-user_states = {}
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
 
+from log import log
+from config import (
+    STATE_BACKEND, STATE_TTL, STATE_MAX_USERS,
+    STATE_SQLITE_PATH, REDIS_URL
+)
 
-def get_pending(user_id: str) -> dict:
+# ======================================================
+# SERIALIZAÇÃO (datetime sobrevive ao JSON)
+# ======================================================
+
+
+def _codificar(valor):
+    if isinstance(valor, datetime):
+        return {"__datetime__": valor.isoformat()}
+    return str(valor)
+
+
+def _decodificar(obj):
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def serializar(valor: dict) -> str:
+    return json.dumps(valor, default=_codificar)
+
+
+def desserializar(texto: str) -> dict:
+    return json.loads(texto, object_hook=_decodificar)
+
+# ======================================================
+# BACKENDS
+# ======================================================
+
+
+class BackendEstado:
+    """
+    Interface: chave -> dict, com expiração (TTL) e tamanho limitado.
+    Leitura/escrita são corrotinas: disco e rede não bloqueiam o event loop.
+    """
+
+    async def obter(self, chave: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def definir(self, chave: str, valor: dict):
+        raise NotImplementedError
+
+    async def remover(self, chave: str):
+        raise NotImplementedError
+
+    def tamanho(self) -> Optional[int]:
+        """Itens guardados (métricas); None quando contar sairia caro"""
+        raise NotImplementedError
+
+
+class MemoriaBackend(BackendEstado):
+    """Dict em memória (um worker só). Ao passar de `max_itens`, descarta o mais antigo."""
+
+    def __init__(self, ttl: float, max_itens: int):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._dados: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def obter(self, chave):
+        item = self._dados.get(chave)
+        if item is None:
+            return None
+        expira_em, valor = item
+        if expira_em < time.time():
+            del self._dados[chave]
+            return None
+        return valor
+
+    async def definir(self, chave, valor):
+        self._dados[chave] = (time.time() + self.ttl, valor)
+        self._dados.move_to_end(chave)
+        while len(self._dados) > self.max_itens:
+            self._dados.popitem(last=False)
+
+    async def remover(self, chave):
+        self._dados.pop(chave, None)
+
+    def tamanho(self):
+        return len(self._dados)
+
+
+class SQLiteBackend(BackendEstado):
+    """
+    Arquivo SQLite (WAL): sobrevive a restart e é compartilhado entre workers
+    da mesma máquina. As consultas rodam numa thread (asyncio.to_thread),
+    uma por vez na conexão.
+    """
+
+    def __init__(self, caminho: str, ttl: float, max_itens: int, namespace: str):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self.namespace = namespace
+        self._conn = sqlite3.connect(
+            caminho, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS estados (
+                namespace TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                expira_em REAL NOT NULL,
+                PRIMARY KEY (namespace, chave)
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_estados_expira ON estados (namespace, expira_em)")
+        self._lock = threading.Lock()
+
+    def _obter(self, chave):
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT valor FROM estados WHERE namespace = ? AND chave = ? AND expira_em >= ?",
+                (self.namespace, chave, time.time())
+            ).fetchone()
+        return desserializar(linha[0]) if linha else None
+
+    def _definir(self, chave, texto):
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO estados (namespace, chave, valor, expira_em) VALUES (?, ?, ?, ?)",
+                (self.namespace, chave, texto, agora + self.ttl)
+            )
+            # Limpa expirados e o excesso (os que expiram primeiro saem antes)
+            self._conn.execute(
+                "DELETE FROM estados WHERE namespace = ? AND expira_em < ?", (self.namespace, agora))
+            self._conn.execute(
+                "DELETE FROM estados WHERE namespace = ? AND chave IN ("
+                "SELECT chave FROM estados WHERE namespace = ? ORDER BY expira_em DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_itens)
+            )
+
+    def _remover(self, chave):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM estados WHERE namespace = ? AND chave = ?", (self.namespace, chave))
+
+    async def obter(self, chave):
+        return await asyncio.to_thread(self._obter, chave)
+
+    async def definir(self, chave, valor):
+        # Serializa antes: o dict pode mudar no event loop enquanto a thread grava
+        await asyncio.to_thread(self._definir, chave, serializar(valor))
+
+    async def remover(self, chave):
+        await asyncio.to_thread(self._remover, chave)
+
+    def tamanho(self):
+        # Só para métricas (/metrics roda fora do event loop)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM estados WHERE namespace = ? AND expira_em >= ?",
+                (self.namespace, time.time())
+            ).fetchone()[0]
+
+
+class RedisBackend(BackendEstado):
+    """
+    Qualquer servidor com protocolo Redis (Redis, Valkey, KeyDB...): N workers/máquinas.
+    TTL via EXPIRE; o limite de tamanho fica a cargo do maxmemory-policy do servidor.
+    Cliente assíncrono (redis.asyncio): as idas ao servidor não travam o event loop.
+    """
+
+    def __init__(self, url: str, ttl: float, namespace: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis exige o pacote 'redis'")
+        self.ttl = int(ttl)
+        self.prefixo = f"bot:{namespace}:"
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    async def obter(self, chave):
+        texto = await self._redis.get(self.prefixo + chave)
+        return desserializar(texto) if texto else None
+
+    async def definir(self, chave, valor):
+        await self._redis.set(self.prefixo + chave, serializar(valor), ex=self.ttl)
+
+    async def remover(self, chave):
+        await self._redis.delete(self.prefixo + chave)
+
+    def tamanho(self):
+        # Contar exigiria varrer o keyspace (SCAN) a cada coleta de métricas
+        return None
+
+
+def criar_backend(namespace: str, ttl: float = STATE_TTL,
+                  max_itens: int = STATE_MAX_USERS, tipo: str = STATE_BACKEND) -> BackendEstado:
+    """Cria o backend configurado em STATE_BACKEND para um namespace"""
+    if tipo == "sqlite":
+        return SQLiteBackend(STATE_SQLITE_PATH, ttl, max_itens, namespace)
+    if tipo == "redis":
+        return RedisBackend(REDIS_URL, ttl, namespace)
+    return MemoriaBackend(ttl, max_itens)
+
+# ======================================================
+# ESTADOS PENDENTES DOS USUÁRIOS
+# ======================================================
+
+
+user_states = criar_backend("pendentes")
+
+
+async def get_pending(user_id: str) -> dict:
     """Retorna os dados pendentes de um usuário"""
-    return user_states.get(user_id, None)
+    return await user_states.obter(user_id)
 
 
-def set_pending(user_id: str, data: dict):
+async def set_pending(user_id: str, data: dict):
     """Define dados pendentes para um usuário"""
-    user_states[user_id] = data
-    print(f"✅ Estado salvo para {user_id}")
+    await user_states.definir(user_id, data)
+    log.debug("✅ Estado salvo para %s", user_id)
 
 
-def clear_pending(user_id: str):
+async def clear_pending(user_id: str):
     """Limpa os dados pendentes de um usuário"""
-    if user_id in user_states:
-        del user_states[user_id]
-        print(f"🗑️ Estado limpo para {user_id}")
+    await user_states.remover(user_id)
+    log.debug("🗑️ Estado limpo para %s", user_id)
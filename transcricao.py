@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import time
+from typing import BinaryIO, Callable, Optional
+
+from config import STT_MAX_CONCURRENCY, TRANSCRIPT_CACHE_TTL, TRANSCRIPT_CACHE_SIZE
+from state import criar_backend
+from metricas import medir
+from limites import LimiteExcedido
+
+# ======================================================
+# TRANSCRIÇÃO (WHISPER) COM CONCORRÊNCIA LIMITADA
+# ======================================================
+
+
+def tamanho_arquivo(arquivo: BinaryIO) -> int:
+    """Tamanho de um arquivo já recebido (ex.: SpooledTemporaryFile do upload)"""
+    arquivo.seek(0, 2)
+    tamanho = arquivo.tell()
+    arquivo.seek(0)
+    return tamanho
+
+
+def hash_arquivo(arquivo: BinaryIO) -> str:
+    """sha256 do conteúdo, lido em blocos (volta o cursor ao início)"""
+    sha = hashlib.sha256()
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(64 * 1024), b""):
+        sha.update(bloco)
+    arquivo.seek(0)
+    return sha.hexdigest()
+
+
+class Transcritor:
+    """
+    No máximo `max_simultaneas` chamadas ao Whisper ao mesmo tempo; o resto
+    espera na fila sem bloquear o event loop (o texto segue fluindo).
+    """
+
+    def __init__(self, max_simultaneas: int):
+        self._limite = asyncio.Semaphore(max_simultaneas)
+        self.max_simultaneas = max_simultaneas
+        self.na_fila = 0
+        self.em_andamento = 0
+        self.total = 0
+        self.erros = 0
+        self.segundos = 0.0
+        self.cache_hits = 0
+        self._cache = criar_backend(
+            "transcricoes", ttl=TRANSCRIPT_CACHE_TTL, max_itens=TRANSCRIPT_CACHE_SIZE)
+
+    async def transcrever_com_cache(self, client, arquivo: BinaryIO, nome: str,
+                                    permitir: Optional[Callable[[], bool]] = None) -> str:
+        """
+        Mesmo áudio (encaminhado/reenviado) = mesma transcrição, sem Whisper.
+        `permitir()` só é consultado se for mesmo ao Whisper (LimiteExcedido se negar).
+        """
+        chave = hash_arquivo(arquivo)
+        salvo = await self._cache.obter(chave)
+        if salvo is not None:
+            self.cache_hits += 1
+            return salvo["texto"]
+
+        if permitir is not None and not permitir():
+            raise LimiteExcedido("stt")
+
+        texto = await self.transcrever(client, arquivo, nome)
+        await self._cache.definir(chave, {"texto": texto})
+        return texto
+
+    @medir("transcribe_audio")
+    async def transcrever(self, client, arquivo: BinaryIO, nome: str) -> str:
+        self.na_fila += 1
+        entrou = False
+        try:
+            async with self._limite:
+                self.na_fila -= 1
+                entrou = True
+                self.em_andamento += 1
+                inicio = time.perf_counter()
+                try:
+                    transcription = await client.audio.transcriptions.create(
+                        file=(nome, arquivo),
+                        model="whisper-1"
+                    )
+                    self.total += 1
+                    return transcription.text
+                except Exception:
+                    self.erros += 1
+                    raise
+                finally:
+                    self.em_andamento -= 1
+                    self.segundos += time.perf_counter() - inicio
+        finally:
+            # Cancelado enquanto ainda esperava na fila
+            if not entrou:
+                self.na_fila -= 1
+
+    def estatisticas(self) -> dict:
+        return {
+            "max_simultaneas": self.max_simultaneas,
+            "na_fila": self.na_fila,
+            "em_andamento": self.em_andamento,
+            "total": self.total,
+            "erros": self.erros,
+            "cache_hits": self.cache_hits,
+            "segundos_totais": round(self.segundos, 2)
+        }
+
+
+transcritor = Transcritor(STT_MAX_CONCURRENCY)